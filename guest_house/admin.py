@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Room, Meal, Guest, DebitCard, Reservation, Transaction
+from .models import Room, Meal, RateRule, StayDiscount, Guest, DebitCard, Reservation, Transaction, Notification
 
 
 # ---------------------------
@@ -22,6 +22,23 @@ class MealAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+# ---------------------------
+# SEASONAL RATES & DISCOUNTS
+# ---------------------------
+@admin.register(RateRule)
+class RateRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'room', 'start_date', 'end_date', 'weekdays', 'multiplier')
+    list_filter = ('room',)
+    list_select_related = ('room',)
+    search_fields = ('name',)
+
+
+@admin.register(StayDiscount)
+class StayDiscountAdmin(admin.ModelAdmin):
+    list_display = ('min_nights', 'percent')
+    ordering = ('min_nights',)
+
+
 # ---------------------------
 # GUEST
 # ---------------------------
@@ -43,19 +60,34 @@ class DebitCardAdmin(admin.ModelAdmin):
     list_display = ('card_number', 'cardholder_name', 'guest', 'balance', 'expiration_date', 'is_active')
     search_fields = ('card_number', 'cardholder_name', 'guest__first_name', 'guest__last_name')
     list_filter = ('is_active', 'expiration_date')
+    list_select_related = ('guest',)
+    readonly_fields = ('balance',)  # changes only through deposits and payments
     # readonly_fields = ('cvc',)   # Optional: keep CVC hidden
 
 
 # ---------------------------
 # TRANSACTION INLINE for Reservation
 # ---------------------------
-class TransactionInline(admin.TabularInline):  
+class TransactionInline(admin.TabularInline):
     """Show related transactions inside Reservation admin"""
     model = Transaction
     extra = 0
     fields = ('debit_card', 'amount', 'transaction_type_badge', 'timestamp')
     readonly_fields = ('debit_card', 'amount', 'transaction_type_badge', 'timestamp')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('debit_card')
+
+    # ledger entries are append-only, written by payments and deposits
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
     def transaction_type_badge(self, obj):
         color_map = {
             "deposit": "#2ecc71",   # green
@@ -79,6 +111,7 @@ class ReservationAdmin(admin.ModelAdmin):
     list_filter = ('status', 'check_in_date', 'check_out_date')
     search_fields = ('guest__first_name', 'guest__last_name', 'room__name')
     raw_id_fields = ('guest', 'room', 'meal')
+    list_select_related = ('guest', 'room', 'meal')
     readonly_fields = ('total_cost', 'status')
     inlines = [TransactionInline]   # ✅ show transactions inline
 
@@ -105,11 +138,12 @@ class ReservationAdmin(admin.ModelAdmin):
 # ---------------------------
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
-    list_display = ('id', 'debit_card', 'amount', 'transaction_type_badge', 'reservation', 'timestamp')
+    list_display = ('id', 'debit_card', 'amount', 'transaction_type_badge', 'balance_after', 'reservation', 'timestamp')
     list_filter = ('transaction_type', 'timestamp')
     search_fields = ('debit_card__card_number', 'reservation__guest__first_name', 'reservation__guest__last_name')
     readonly_fields = ('timestamp',)
     raw_id_fields = ('debit_card', 'reservation')
+    list_select_related = ('debit_card', 'reservation__guest')
 
     def transaction_type_badge(self, obj):
         """Show transaction type with badge colors"""
@@ -126,3 +160,27 @@ class TransactionAdmin(admin.ModelAdmin):
 
     transaction_type_badge.admin_order_field = "transaction_type"
     transaction_type_badge.short_description = "Transaction Type"
+
+    # ledger entries are append-only
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+# ---------------------------
+# NOTIFICATION OUTBOX
+# ---------------------------
+@admin.register(Notification)
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'recipient', 'reservation', 'status', 'attempts', 'lease_owner', 'created_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('recipient',)
+    raw_id_fields = ('reservation',)
+    readonly_fields = (
+        'created_at', 'sent_at', 'attempts', 'last_response', 'next_attempt_at', 'lease_owner', 'lease_expires_at'
+    )
@@ -1,7 +1,17 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class GuestHouseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'guest_house'
-    
+
+    def ready(self):
+        from django.core.signals import request_started
+
+        from . import signals  # noqa: F401  (connects the receivers)
+        from .catalogue_cache import WARM_DISPATCH_UID, warm_on_first_request
+
+        # the database may not exist yet here, so warming waits for the first request
+        if settings.CATALOGUE_CACHE_WARM:
+            request_started.connect(warm_on_first_request, dispatch_uid=WARM_DISPATCH_UID)
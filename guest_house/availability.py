@@ -0,0 +1,66 @@
+"""
+Date-range room availability.
+
+A stay is the half-open interval [check_in, check_out). Two stays overlap when
+each one starts before the other ends, so a room is free for a stay when none
+of its active reservations satisfies:
+
+    reservation.check_in_date < check_out and reservation.check_out_date > check_in
+
+Both lookups below are served by the interval indexes on Reservation
+(`reservation_stay_idx` and `reservation_room_stay_idx`): the range scan on
+check_out_date starts at the requested check-in, so stays that ended before the
+window are never read and the cost follows the number of current and future
+bookings rather than the size of the reservation history.
+"""
+from .models import Room, Reservation
+
+
+# ?ordering= values accepted by the availability endpoint
+ORDERING = {
+    'price': ('price_per_night', 'id'),
+    '-price': ('-price_per_night', 'id'),
+    'name': ('name', 'id'),
+    '-name': ('-name', 'id'),
+}
+
+
+def overlapping_reservations(check_in, check_out, rooms=None):
+    """Active reservations that hold a room for any night in [check_in, check_out)"""
+    qs = Reservation.objects.filter(
+        status__in=Reservation.ACTIVE_STATUSES,
+        room__isnull=False,
+        check_out_date__gt=check_in,
+        check_in_date__lt=check_out,
+    )
+    if rooms is not None:
+        qs = qs.filter(room__in=rooms)
+    return qs
+
+
+def is_room_available(room, check_in, check_out, exclude=None):
+    """True when the room is bookable and free for the whole stay"""
+    if not room.is_available:
+        return False
+    qs = overlapping_reservations(check_in, check_out, rooms=[room])
+    if exclude is not None:
+        qs = qs.exclude(pk=exclude.pk)
+    return not qs.exists()
+
+
+def available_rooms(check_in, check_out, min_price=None, max_price=None, ordering=None):
+    """
+    Rooms free for the whole stay, optionally within a price range.
+
+    Runs as a single query: the overlapping reservations become a sub-select
+    that is excluded from the room list.
+    """
+    booked = overlapping_reservations(check_in, check_out).values('room_id')
+    rooms = Room.objects.filter(is_available=True).exclude(id__in=booked)
+
+    if min_price is not None:
+        rooms = rooms.filter(price_per_night__gte=min_price)
+    if max_price is not None:
+        rooms = rooms.filter(price_per_night__lte=max_price)
+
+    return rooms.order_by(*ORDERING.get(ordering, ('id',)))
@@ -0,0 +1,131 @@
+"""
+Read-through cache of rendered room and meal responses.
+
+RoomViewSet and MealViewSet list and retrieve through CachedCatalogueMixin:
+a JSON GET is answered from the cache with the bytes rendered the first time,
+without touching the database or the serializer. Keys are
+
+    catalogue:<model>:detail:<pk>
+    catalogue:<model>:list:<list version>:<query string>
+
+and the post_save/post_delete receivers in signals.py call `invalidate`,
+which deletes the changed object's detail entry and moves the model to a new
+list version, so exactly the entries that could show the change go stale.
+The cache is settings.CACHES[CATALOGUE_CACHE]; with the default local-memory
+backend other processes notice an edit only after CATALOGUE_CACHE_TIMEOUT,
+with a shared backend (file, Redis, memcached) at once.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache():
+    return caches[settings.CATALOGUE_CACHE]
+
+
+def _prefix(model):
+    return f"catalogue:{model._meta.model_name}"
+
+
+def list_version(model):
+    key = f"{_prefix(model)}:version"
+    version = get_cache().get(key)
+    if version is None:
+        version = time.time_ns()
+        if not get_cache().add(key, version, None):
+            version = get_cache().get(key, version)
+    return version
+
+
+def list_key(model, query_string):
+    return f"{_prefix(model)}:list:{list_version(model)}:{query_string}"
+
+
+def detail_key(model, pk):
+    return f"{_prefix(model)}:detail:{pk}"
+
+
+def invalidate(model, pk=None):
+    cache = get_cache()
+    cache.set(f"{_prefix(model)}:version", time.time_ns(), None)
+    if pk is not None:
+        cache.delete(detail_key(model, pk))
+
+
+def store(key, content, content_type):
+    get_cache().set(key, (content, content_type), settings.CATALOGUE_CACHE_TIMEOUT)
+
+
+class CachedCatalogueMixin:
+    """Serve list and retrieve from the catalogue cache when the client wants JSON"""
+
+    def list(self, request, *args, **kwargs):
+        key = list_key(self.queryset.model, request.META.get("QUERY_STRING", ""))
+        return self._cached(key, lambda: super(CachedCatalogueMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        def build():
+            return super(CachedCatalogueMixin, self).retrieve(request, *args, **kwargs)
+
+        value = kwargs.get(self.lookup_url_kwarg or self.lookup_field)
+        try:
+            pk = self.queryset.model._meta.pk.to_python(value)
+        except ValidationError:
+            return build()
+        if str(pk) != value:
+            return build()  # "01" finds pk 1 too, but invalidate() only deletes the canonical key
+        return self._cached(detail_key(self.queryset.model, pk), build)
+
+    def _cached(self, key, build):
+        if not isinstance(self.request.accepted_renderer, JSONRenderer):
+            return build()  # the browsable API page carries per-user content
+
+        hit = get_cache().get(key)
+        if hit is not None:
+            content, content_type = hit
+            return HttpResponse(content, content_type=content_type)
+
+        response = build()
+        if response.status_code == status.HTTP_200_OK:
+            response = self.finalize_response(self.request, response)
+            response.render()
+            store(key, response.content, response["Content-Type"])
+        return response
+
+
+def warm():
+    """Render the room and meal lists and details into the cache"""
+    from .models import Meal, Room
+    from .serializers import MealSerializer, RoomSerializer
+
+    renderer = JSONRenderer()
+    content_type = renderer.media_type
+    for model, serializer_class in ((Room, RoomSerializer), (Meal, MealSerializer)):
+        objects = list(model.objects.all())
+        data = serializer_class(objects, many=True).data
+        store(list_key(model, ""), renderer.render(data), content_type)
+        for obj, item in zip(objects, data):
+            store(detail_key(model, obj.pk), renderer.render(item), content_type)
+
+
+def warm_on_first_request(sender, **kwargs):
+    """request_started receiver: warm the cache once, on this process's first request"""
+    from django.core.signals import request_started
+
+    request_started.disconnect(warm_on_first_request, dispatch_uid=WARM_DISPATCH_UID)
+    try:
+        warm()
+    except Exception:
+        logger.warning("Could not warm the catalogue cache", exc_info=True)
+
+
+WARM_DISPATCH_UID = "guest_house.catalogue_cache.warm"
@@ -0,0 +1,89 @@
+"""
+Conditional GET for reservations, transactions, cards and guests.
+
+Responses carry an ETag and a Last-Modified header. A client that polls sends
+them back as If-None-Match / If-Modified-Since, and `conditional` compares
+them with a version read by a single query: the object's updated_at (for a
+reservation, the later of its own and its guest's, since the guest is
+nested), or for a list the newest updated_at and the row count, which also
+changes on deletes. When nothing changed the answer is 304 Not Modified and
+the object is never loaded or serialized.
+
+Every write must move updated_at, so the bulk .update() calls in models.py,
+expiry.py and serializers.py set it explicitly. Ledger entries are
+append-only and use their timestamp instead.
+"""
+import functools
+import hashlib
+
+from django.db.models import Count, Max
+from django.views.decorators.http import condition
+
+
+def make_etag(*parts):
+    return hashlib.md5("|".join(map(str, parts)).encode(), usedforsecurity=False).hexdigest()
+
+
+def latest(*timestamps):
+    present = [t for t in timestamps if t is not None]
+    return max(present) if present else None
+
+
+def detail_version(model, field='updated_at', nested=()):
+    """Version of one object, and of the related rows its representation nests, by primary key"""
+    fields = [field, *(f"{name}__updated_at" for name in nested)]
+
+    def version(request, pk=None, **kwargs):
+        row = model.objects.filter(pk=pk).values_list(*fields).first()
+        if row is None:
+            return None
+        modified = latest(*row)
+        return make_etag(model._meta.label, pk, request.accepted_renderer.format, modified), modified
+
+    return version
+
+
+def collection_version(model, field='updated_at', nested=()):
+    """Version of a list: the newest change, nested rows included, and the row count, per query string"""
+
+    def version(request, **kwargs):
+        aggregate = model.objects.aggregate(
+            count=Count('pk'), modified=Max(field), **{f"{name}_modified": Max(f"{name}__updated_at") for name in nested}
+        )
+        modified = latest(aggregate['modified'], *(aggregate[f"{name}_modified"] for name in nested))
+        return make_etag(
+            model._meta.label, request.accepted_renderer.format, request.META.get("QUERY_STRING", ""),
+            aggregate['count'], modified
+        ), modified
+
+    return version
+
+
+def conditional(version):
+    """
+    Decorate a ViewSet list or retrieve so a request whose validators still
+    match gets 304 without running the view.
+
+    `version(request, **kwargs)` returns (etag, last_modified), or None when
+    the object does not exist, in which case the view runs and 404s as usual.
+    """
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            computed = []
+
+            def validators():
+                if not computed:
+                    computed.append(version(request, **kwargs) or (None, None))
+                return computed[0]
+
+            @condition(etag_func=lambda *a, **k: validators()[0], last_modified_func=lambda *a, **k: validators()[1])
+            def run(request, *args, **kwargs):
+                return view(self, request, *args, **kwargs)
+
+            return run(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
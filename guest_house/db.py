@@ -0,0 +1,55 @@
+"""
+Retrying writes that find SQLite locked.
+
+SQLite has one writer at a time. The production profile in settings (WAL,
+BEGIN IMMEDIATE, a busy timeout) makes writers queue for the lock instead of
+failing, but a writer can still give up with "database is locked" under a
+burst. `retry_on_busy` runs such a write path again after a short, jittered,
+exponentially growing pause, DB_BUSY_RETRIES times at most.
+
+Only the outermost transaction can be retried: inside an atomic block the
+error is re-raised for the caller that owns the transaction.
+"""
+import functools
+import random
+import sqlite3
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+BUSY_MESSAGES = ("database is locked", "database table is locked", "database is busy")
+
+
+def is_busy(exc):
+    return isinstance(exc, (OperationalError, sqlite3.OperationalError)) and any(
+        message in str(exc) for message in BUSY_MESSAGES
+    )
+
+
+def busy_delay(attempt):
+    """Full-jitter exponential backoff before the given retry (1-based)"""
+    ceiling = min(settings.DB_BUSY_RETRY_CAP, settings.DB_BUSY_RETRY_BASE * 2 ** (attempt - 1))
+    return random.uniform(0, ceiling)
+
+
+def retry_on_busy(func=None, *, retries=None):
+    """Decorate a write path so a locked database makes it run again after a pause"""
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            limit = settings.DB_BUSY_RETRIES if retries is None else retries
+            attempt = 0
+            while True:
+                try:
+                    return func(*args, **kwargs)
+                except (OperationalError, sqlite3.OperationalError) as exc:
+                    attempt += 1
+                    if not is_busy(exc) or attempt > limit or connection.in_atomic_block:
+                        raise
+                    time.sleep(busy_delay(attempt))
+
+        return wrapper
+
+    return decorator(func) if func is not None else decorator
@@ -0,0 +1,170 @@
+"""
+Reminders and cancellations for unpaid reservations.
+
+`process_due` does one pass over everything that is due and is shared by the
+`check_reservations` cron command and the long-running `run_reservation_worker`.
+The worker keeps a heap of upcoming deadlines (`DeadlineScheduler`) so it can
+sleep until the next one instead of polling the reservation table.
+
+Neither waits on the SMS provider: each transition queues its guest
+notifications in the outbox in the same transaction (see outbox.py).
+"""
+import heapq
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from . import outbox
+from .models import Reservation
+
+# reservations locked and transitioned per transaction
+CHUNK_SIZE = 5000
+
+
+def transition(due, apply, chunk_size=CHUNK_SIZE):
+    """
+    Apply a state change to the `due` queryset in primary-key ranges.
+
+    Each range is locked and handed to apply(rows, [(id, guest phone)]) in its
+    own transaction, so the statement count grows with the number of chunks
+    rather than the number of reservations. Returns how many rows changed.
+    """
+    count = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            chunk = list(
+                due.filter(id__gt=last_id).order_by("id")
+                .select_for_update(of=("self",)).values_list("id", "guest__phone")[:chunk_size]
+            )
+            if not chunk:
+                return count
+            apply(due.filter(id__gt=last_id, id__lte=chunk[-1][0]), chunk)
+        last_id = chunk[-1][0]
+        count += len(chunk)
+
+
+def queue_reminders(now, stdout, chunk_size=CHUNK_SIZE):
+    """Queue SMS reminders for reservations unpaid after Reservation.REMINDER_AFTER"""
+    def remind(rows, chunk):
+        rows.update(reminder_sent=True, updated_at=timezone.now())
+        outbox.enqueue("reminder_due", chunk)
+
+    count = transition(Reservation.objects.due_for_reminder(now), remind, chunk_size)
+    if count:
+        stdout.write(f"[REMINDER] Queued {count} reminders.")
+
+
+def cancel_expired(now, stdout, chunk_size=CHUNK_SIZE):
+    """Cancel reservations still unpaid after Reservation.CANCEL_AFTER (reminded first)"""
+    def cancel(rows, chunk):
+        rows.cancel()  # one UPDATE plus one bulk release of the room nights
+        outbox.enqueue("cancelled", chunk)
+
+    count = transition(Reservation.objects.due_for_cancel(now), cancel, chunk_size)
+    if count:
+        stdout.write(f"[CANCELLED] Cancelled {count} reservations.")
+
+
+def process_due(now, stdout):
+    queue_reminders(now, stdout)
+    cancel_expired(now, stdout)
+
+
+class DeadlineScheduler:
+    """Min-heap of (due time, reservation id) for pending reservations"""
+
+    def __init__(self):
+        self._heap = []
+        self.last_seen_id = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def schedule(self, reservation_id, created_at, reminder_sent=False):
+        if not reminder_sent:
+            heapq.heappush(self._heap, (created_at + Reservation.REMINDER_AFTER, reservation_id))
+        heapq.heappush(self._heap, (created_at + Reservation.CANCEL_AFTER, reservation_id))
+
+    def load(self):
+        """Schedule every pending reservation and start the change feed after the newest row"""
+        self.last_seen_id = Reservation.objects.aggregate(last=Max("id"))["last"] or 0
+        pending = Reservation.objects.filter(status="pending", id__lte=self.last_seen_id).values_list(
+            "id", "created_at", "reminder_sent"
+        )
+        for reservation_id, created_at, reminder_sent in pending.iterator():
+            self.schedule(reservation_id, created_at, reminder_sent)
+
+    def poll(self):
+        """
+        Schedule reservations created since the last poll.
+
+        This is the change feed: a range scan on the primary key, so it stays
+        cheap however often it runs and however large the table grows.
+        """
+        new = Reservation.objects.filter(id__gt=self.last_seen_id).order_by("id").values_list(
+            "id", "created_at", "status", "reminder_sent"
+        )
+        count = 0
+        for reservation_id, created_at, status, reminder_sent in new:
+            self.last_seen_id = reservation_id
+            if status == "pending":
+                self.schedule(reservation_id, created_at, reminder_sent)
+                count += 1
+        return count
+
+    def next_due(self):
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove and return the ids of every deadline at or before now"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+
+class ReservationWorker:
+    """
+    Long-running replacement for polling check_reservations from cron.
+
+    Each tick picks up new reservations from the change feed, runs
+    process_due when a deadline has passed, and returns how long to sleep:
+    until the next deadline, but never longer than poll_interval so new
+    reservations are noticed promptly. A periodic sweep also runs process_due,
+    catching rows the feed skipped (a transaction that committed after a
+    later id was already seen).
+    """
+
+    def __init__(self, stdout, poll_interval=1.0, sweep_interval=60.0):
+        self.stdout = stdout
+        self.poll_interval = poll_interval
+        self.sweep_interval = sweep_interval
+        self.scheduler = DeadlineScheduler()
+        self._next_sweep = None
+
+    def start(self):
+        self.scheduler.load()
+        self._next_sweep = timezone.now()
+
+    def tick(self, now=None):
+        now = now or timezone.now()
+        self.scheduler.poll()
+
+        if self.scheduler.pop_due(now) or now >= self._next_sweep:
+            process_due(now, self.stdout)
+            self._next_sweep = now + timedelta(seconds=self.sweep_interval)
+
+        wait = self.poll_interval
+        next_due = self.scheduler.next_due()
+        if next_due is not None:
+            wait = min(wait, max((next_due - timezone.now()).total_seconds(), 0))
+        return wait
+
+    def run(self):
+        self.start()
+        while True:
+            time.sleep(self.tick())
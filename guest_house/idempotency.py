@@ -0,0 +1,242 @@
+"""
+Idempotency keys for POST endpoints with side effects.
+
+A client that sends `Idempotency-Key: <unique value>` can retry the request
+safely: the first request claims the key by inserting an IdempotencyKey row,
+runs, and stores its response in the same transaction as its own writes.
+Retries replay that response without running anything again, straight from a
+bounded in-process TTL cache when they land on the same worker, otherwise
+from the row. A duplicate that arrives while the original is still running
+waits for it (IDEMPOTENCY_WAIT seconds at most, then 409). Reusing a key
+for a different request body is rejected with 422.
+
+Each claim carries a random owner token and a lease of IDEMPOTENCY_LEASE
+seconds, far longer than any request should run. Only a claim whose lease
+ran out can be taken over, by replacing its owner, and a request stores its
+response (in the transaction holding its writes) only while it still owns
+the claim; one that lost it rolls its writes back and answers 409. So
+however slow the original is, at most one run's effects commit. Claim rows
+left behind by a process that died mid-request hold no effects, since the
+handler's writes rolled back with it.
+"""
+import functools
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .db import retry_on_busy
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+
+
+class TTLCache:
+    """Thread-safe LRU mapping whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize, ttl, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if self._clock() >= expires_at:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+cache = TTLCache(settings.IDEMPOTENCY_CACHE_SIZE, settings.IDEMPOTENCY_KEY_TTL)
+
+# keys being executed by this process, so local duplicates wait without polling
+_running = {}
+_running_lock = threading.Lock()
+
+
+def request_hash(data):
+    body = json.dumps(data, sort_keys=True, cls=JSONEncoder)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def replay(stored):
+    status_code, data = stored
+    response = Response(data, status=status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def mismatch():
+    return Response(
+        {"detail": f"This {HEADER} was already used with a different request."},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+    )
+
+
+def claim(scope, key, fingerprint):
+    """
+    Insert the claim row; returns (owner token or None, existing row or None).
+
+    An expired row, or an unfinished claim whose lease ran out, is replaced.
+    """
+    now = timezone.now()
+    owner = uuid.uuid4().hex
+    try:
+        with transaction.atomic():
+            IdempotencyKey.objects.create(
+                scope=scope, key=key, request_hash=fingerprint, owner=owner,
+                lease_expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_LEASE),
+                expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+            )
+        return owner, None
+    except IntegrityError:
+        pass
+
+    row = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+    if row is not None and (row.expires_at <= now or (
+            row.status_code is None and (row.lease_expires_at is None or row.lease_expires_at <= now))):
+        # conditional on the owner we saw, so of several takers only one wins
+        IdempotencyKey.objects.filter(pk=row.pk, owner=row.owner, status_code=row.status_code).delete()
+        return claim(scope, key, fingerprint)
+    return None, row
+
+
+def wait_for(scope, key):
+    """Poll until the original request stores its response; None on timeout or if it gave up"""
+    with _running_lock:
+        event = _running.get((scope, key))
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    delay = 0.05
+    while time.monotonic() < deadline:
+        if event is not None:
+            event.wait(min(delay, max(deadline - time.monotonic(), 0)))
+        else:
+            time.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+        row = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if row is None or row.status_code is not None:
+            return row
+        delay = min(delay * 2, 0.5)
+    return None
+
+
+def idempotent(scope):
+    """Decorate a ViewSet action so an Idempotency-Key header makes retries replay its response"""
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(self, request, *args, **kwargs):
+            key = request.headers.get(HEADER)
+            if not key:
+                return view(self, request, *args, **kwargs)
+            if len(key) > 255:
+                return Response({"detail": f"{HEADER} must be at most 255 characters."},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+            fingerprint = request_hash(request.data)
+            cached = cache.get((scope, key))
+            if cached is not None:
+                return replay(cached[1:]) if cached[0] == fingerprint else mismatch()
+
+            owner, row = claim(scope, key, fingerprint)
+            if owner is None:
+                if row is not None and row.request_hash != fingerprint:
+                    return mismatch()
+                if row is not None and row.status_code is None:
+                    row = wait_for(scope, key)
+                if row is None or row.status_code is None:
+                    return Response(
+                        {"detail": "A request with this key is still being processed; retry later."},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                remaining = (row.expires_at - timezone.now()).total_seconds()
+                cache.set((scope, key), (row.request_hash, row.status_code, row.response), ttl=remaining)
+                return replay((row.status_code, row.response))
+
+            event = threading.Event()
+            with _running_lock:
+                _running[(scope, key)] = event
+            try:
+                return execute(self, request, args, kwargs, view, scope, key, fingerprint, owner)
+            finally:
+                with _running_lock:
+                    _running.pop((scope, key), None)
+                event.set()
+
+        return wrapper
+
+    return decorator
+
+
+class ClaimLost(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "This request took too long and was taken over by a retry with the same key."
+
+
+def execute(viewset, request, args, kwargs, view, scope, key, fingerprint, owner):
+    @retry_on_busy
+    def run():
+        with transaction.atomic():
+            response = view(viewset, request, *args, **kwargs)
+            stored = store(scope, key, owner, response)
+            if stored is None:
+                raise ClaimLost()  # rolls back this run's writes; the new owner's are the ones that count
+            return response, stored
+
+    try:
+        response, stored = run()
+    except ClaimLost as exc:
+        return viewset.handle_exception(exc)
+    except APIException as exc:
+        # a rejected request is rejected again on retry, without re-validating
+        response = viewset.handle_exception(exc)
+        stored = store(scope, key, owner, response)
+        if stored is None:
+            return response
+    except BaseException:
+        IdempotencyKey.objects.filter(scope=scope, key=key, owner=owner, status_code__isnull=True).delete()
+        raise
+
+    cache.set((scope, key), (fingerprint, *stored))
+    return response
+
+
+def store(scope, key, owner, response):
+    """Record the response if `owner` still holds the claim; None when it lost it"""
+    # encoded the way the JSON renderer will, so a replay renders identically
+    data = json.loads(json.dumps(response.data, cls=JSONEncoder))
+    if not IdempotencyKey.objects.filter(scope=scope, key=key, owner=owner, status_code__isnull=True).update(
+            status_code=response.status_code, response=data):
+        return None
+    return response.status_code, data
@@ -0,0 +1,75 @@
+"""
+Card ledger.
+
+Every balance change is appended to the Transaction table together with the
+balance it leaves behind (`balance_after`), in the same database transaction
+as the conditional UPDATE of DebitCard.balance. The materialised column is
+therefore always derivable from the ledger: the current balance is the
+`balance_after` of the card's latest entry, and a statement for any period
+needs only the entry just before it, never a sum over history.
+reconcile_ledger checks the two against each other.
+"""
+from django.db import transaction
+
+from .models import DebitCard, Transaction
+
+
+def post(card, amount, transaction_type, reservation=None):
+    """
+    Apply a deposit or payment to the card and append its ledger entry.
+
+    Returns the new Transaction, or None (with nothing written) when a payment
+    exceeds the balance or the card is inactive.
+    """
+    with transaction.atomic():
+        if transaction_type == 'payment':
+            applied = DebitCard.objects.debit(card.pk, amount)
+        else:
+            applied = DebitCard.objects.credit(card.pk, amount)
+        if not applied:
+            return None
+
+        # the UPDATE holds the row (or database) write lock until commit,
+        # so this is exactly the balance our change produced
+        balance = DebitCard.objects.values_list('balance', flat=True).get(pk=card.pk)
+        return Transaction.objects.create(
+            debit_card=card,
+            amount=amount,
+            transaction_type=transaction_type,
+            reservation=reservation,
+            balance_after=balance
+        )
+
+
+def entries(card):
+    return Transaction.objects.filter(debit_card=card)
+
+
+def balance(card):
+    """Ledger balance from the latest entry, or None for a card without entries"""
+    return entries(card).order_by('-id').values_list('balance_after', flat=True).first()
+
+
+def statement(card, start, end):
+    """
+    Opening balance, entries and closing balance for [start, end).
+
+    Reads the entries of the period plus at most one neighbouring entry, using
+    the (debit_card, timestamp) index.
+    """
+    period = list(entries(card).filter(timestamp__gte=start, timestamp__lt=end).order_by('timestamp', 'id'))
+
+    before = entries(card).filter(timestamp__lt=start).order_by('-timestamp', '-id').first()
+    if before is not None:
+        opening = before.balance_after
+    elif period:
+        opening = period[0].balance_before
+    else:
+        after = entries(card).filter(timestamp__gte=end).order_by('timestamp', 'id').first()
+        opening = after.balance_before if after is not None else card.balance
+
+    return {
+        'opening_balance': opening,
+        'closing_balance': period[-1].balance_after if period else opening,
+        'entries': period,
+    }
@@ -0,0 +1,57 @@
+"""
+Structured, buffered logging.
+
+BackgroundRotatingHandler is a QueueHandler: callers only enqueue the record,
+and a QueueListener thread formats each one as a JSON line and writes it to a
+file rotated by size (max_bytes) or by time (when/interval). Configure it in
+settings.LOGGING; fields passed as `extra={"data": {...}}` become keys of the
+JSON object.
+"""
+import atexit
+import json
+import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "data", {}))
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class BackgroundRotatingHandler(QueueHandler):
+    def __init__(self, filename, max_bytes=0, backup_count=5, when=None, interval=1):
+        super().__init__(queue.SimpleQueue())
+        if when:
+            target = TimedRotatingFileHandler(
+                filename, when=when, interval=interval, backupCount=backup_count, encoding="utf-8", delay=True
+            )
+        else:
+            target = RotatingFileHandler(
+                filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True
+            )
+        target.setFormatter(JSONFormatter())
+        self.target = target
+        self.listener = QueueListener(self.queue, target, respect_handler_level=True)
+        self.listener.start()
+        self._running = True
+        atexit.register(self.stop)
+
+    def stop(self):
+        """Write out everything queued so far and stop the writer thread"""
+        if self._running:
+            self._running = False
+            self.listener.stop()
+            self.target.close()
+
+    def close(self):
+        self.stop()
+        super().close()
@@ -0,0 +1,180 @@
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, close_old_connections, connections
+from django.db.models import Count
+from django.test.utils import override_settings
+
+from guest_house.db import is_busy
+from guest_house.models import DebitCard, Guest, Reservation, Room
+from guest_house.serializers import PaymentSerializer
+
+CVC = "123"
+AMOUNT = Decimal("10.00")
+
+
+@contextmanager
+def scratch_database(profile, path):
+    """
+    Point the default alias at the database file `path`, configured as
+    DB_PROFILE=`profile` configures the real one.
+
+    Only connections opened from here on use it, so all work on it belongs in
+    threads started inside the block; the calling thread keeps its own.
+    """
+    database = {
+        **connections.settings[DEFAULT_DB_ALIAS], "NAME": path, "OPTIONS": {}, "CONN_MAX_AGE": 0,
+        "CONN_HEALTH_CHECKS": False,
+    }
+    if profile == "production":
+        database.update(settings.SQLITE_PRODUCTION_DATABASE)
+    original = connections.settings[DEFAULT_DB_ALIAS]
+    connections.settings[DEFAULT_DB_ALIAS] = database
+    try:
+        with override_settings(DB_PROFILE=profile):
+            yield
+    finally:
+        connections.settings[DEFAULT_DB_ALIAS] = original
+
+
+def in_thread(func, *args):
+    """Run func in a new thread with its own connections, and return its result"""
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = func(*args)
+        except BaseException as exc:
+            outcome["error"] = exc
+        finally:
+            connections.close_all()
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def prepare(cards, reservations):
+    """Migrate the scratch database and add pending reservations to pay; returns their ids"""
+    call_command("migrate", verbosity=0, interactive=False)
+    room = Room.objects.create(name="Room 1", price_per_night=AMOUNT)
+    guests = Guest.objects.bulk_create([
+        Guest(first_name="Guest", last_name="Benchmark", email=f"guest{n}@example.com", phone=f"+25078{n:07d}")
+        for n in range(cards)
+    ])
+    DebitCard.objects.bulk_create([
+        DebitCard(guest=guest, cardholder_name="Guest Benchmark", card_number=f"4{n:015d}", cvc=CVC,
+                  balance=Decimal("9999999.00"), expiration_date="12/30")
+        for n, guest in enumerate(guests)
+    ])
+    check_in = date.today() + timedelta(days=30)
+    Reservation.objects.bulk_create([
+        Reservation(guest=guests[n % cards], room=room, check_in_date=check_in,
+                    check_out_date=check_in + timedelta(days=1), total_cost=AMOUNT)
+        for n in range(reservations)
+    ])
+    return list(Reservation.objects.order_by("id").values_list("id", flat=True))
+
+
+def pay(reservation_id, card_number):
+    """What the payments endpoint does for one request, then what request_finished does"""
+    try:
+        serializer = PaymentSerializer(data={
+            "card_number": card_number, "cvc": CVC, "amount": str(AMOUNT), "reservation_id": reservation_id,
+        })
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+    finally:
+        close_old_connections()  # closes the connection unless CONN_MAX_AGE keeps it
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure concurrent payment-write throughput on SQLite with the development and the "
+        "DB_PROFILE=production database settings. Each run migrates a scratch database file, never the "
+        "project's, and pays reservations through PaymentSerializer from several threads, so it measures "
+        "the shipped write path: conditional updates, ledger entry, outbox row and busy retries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8, help="Concurrent writers")
+        parser.add_argument("--writes", type=int, default=200, help="Payments per writer")
+        parser.add_argument("--readers", type=int, default=2, help="Threads reading while the writers run")
+        parser.add_argument("--cards", type=int, default=10)
+        parser.add_argument("--profile", choices=["development", "production", "both"], default="both")
+
+    def handle(self, *args, **options):
+        profiles = ["development", "production"] if options["profile"] == "both" else [options["profile"]]
+        for profile in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                with scratch_database(profile, os.path.join(directory, "benchmark.sqlite3")):
+                    self.run(profile, options)
+
+    def run(self, profile, options):
+        threads, writes = options["threads"], options["writes"]
+        card_numbers = [f"4{n:015d}" for n in range(options["cards"])]
+        ids = in_thread(prepare, options["cards"], threads * writes)
+
+        failed, errors = [], []
+        done = threading.Event()
+
+        def writer(number):
+            try:
+                for n, reservation_id in enumerate(ids[number * writes:(number + 1) * writes]):
+                    try:
+                        pay(reservation_id, card_numbers[n % len(card_numbers)])
+                    except OperationalError as exc:
+                        if not is_busy(exc):
+                            raise
+                        failed.append(reservation_id)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        def reader():
+            try:
+                while not done.is_set():
+                    try:
+                        list(Reservation.objects.values("status").annotate(count=Count("id")))
+                    except OperationalError:
+                        pass
+                    finally:
+                        close_old_connections()
+            finally:
+                connections.close_all()
+
+        readers = [threading.Thread(target=reader, daemon=True) for _ in range(options["readers"])]
+        writers = [threading.Thread(target=writer, args=(n,)) for n in range(threads)]
+        for thread in readers:
+            thread.start()
+        started = time.perf_counter()
+        for thread in writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        done.set()
+        for thread in readers:
+            thread.join()
+        if errors:
+            raise CommandError(f"A writer failed: {errors[0]!r}")
+
+        total = threads * writes
+        paid = in_thread(lambda: Reservation.objects.filter(status="paid").count())
+        self.stdout.write(
+            f"[BENCHMARK] {profile}: {paid}/{total} payments from {threads} writers "
+            f"in {elapsed:.2f}s ({paid / elapsed:.0f}/s); "
+            f"{len(failed)} failed with 'database is locked'."
+        )
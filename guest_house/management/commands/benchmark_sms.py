@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from guest_house.notifications import FakeGateway, FakeGatewayBackend, Message, TokenBucket, dispatch
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure SMS dispatch throughput offline against the in-process fake gateway. "
+        "Touches neither the database nor the real provider."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument(
+            "--texts", type=int, default=0,
+            help="Distinct message texts; 0 gives every message its own text, like per-reservation reminders"
+        )
+        parser.add_argument("--batch-size", type=int, default=settings.SMS_BATCH_SIZE)
+        parser.add_argument("--workers", type=int, default=settings.SMS_MAX_WORKERS)
+        parser.add_argument("--latency", type=float, default=0.2, help="Seconds per gateway request")
+        parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+        parser.add_argument("--rate-limit", type=float, default=0, help="Messages per second; 0 for unlimited")
+        parser.add_argument("--seed", type=int, default=None)
+
+    def handle(self, *args, **options):
+        gateway = FakeGateway(
+            latency=options["latency"], error_rate=options["error_rate"], seed=options["seed"]
+        ).start()
+        try:
+            backend = FakeGatewayBackend(gateway=gateway)
+            texts = options["texts"]
+            messages = [
+                Message(i, f"Reminder {i % texts if texts else i}", f"+2507{i:08d}")
+                for i in range(options["messages"])
+            ]
+            limiter = TokenBucket(options["rate_limit"]) if options["rate_limit"] else None
+
+            started = time.perf_counter()
+            results = dispatch(
+                backend, messages, batch_size=options["batch_size"], max_workers=options["workers"],
+                limiter=limiter
+            )
+            elapsed = time.perf_counter() - started
+        finally:
+            gateway.stop()
+
+        sent = sum(result.sent for result in results.values())
+        self.stdout.write(
+            f"[BENCHMARK] {len(messages)} messages in {elapsed:.2f}s "
+            f"({len(messages) / elapsed:.0f}/s) over {gateway.requests} requests; "
+            f"{sent} sent, {len(messages) - sent} failed."
+        )
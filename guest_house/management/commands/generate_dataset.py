@@ -0,0 +1,278 @@
+import math
+import random
+import time
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from guest_house import catalogue_cache
+from guest_house.models import DebitCard, Guest, Meal, Reservation, Room, RoomNight, Transaction
+from guest_house.pricing import catalogue, money, price_stay
+
+FIRST_NAMES = [
+    "Jean", "Aline", "Eric", "Diane", "Patrick", "Claudine", "Emmanuel", "Grace", "Olivier", "Sandrine",
+    "Yves", "Josiane", "Innocent", "Clarisse", "Fabrice", "Divine", "Samuel", "Esther", "David", "Alice",
+]
+LAST_NAMES = [
+    "Uwimana", "Mugisha", "Niyonsaba", "Habimana", "Uwase", "Nshimiyimana", "Mukamana", "Ndayisaba",
+    "Iradukunda", "Hakizimana", "Ingabire", "Tuyisenge", "Kamanzi", "Mutoni", "Bizimana", "Umutoni",
+]
+# MTN (078, 079) and Airtel (072, 073) numbers, as +2507XXXXXXXX
+PHONE_PREFIXES = "8923"
+ROOM_PRICES = [Decimal(p) for p in ("30.00", "45.00", "60.00", "80.00", "120.00", "200.00")]
+MEALS = [
+    ("Breakfast", Decimal("8.00")), ("Half Board", Decimal("20.00")), ("Full Board", Decimal("35.00")),
+    ("Brochettes and Chips", Decimal("12.00")), ("Isombe with Rice", Decimal("9.00")),
+]
+# nights per stay and free nights between consecutive stays in a room
+NIGHTS = ([1, 2, 3, 4, 5, 7, 10, 14], [20, 25, 20, 12, 8, 8, 4, 3])
+GAPS = ([0, 1, 2, 3, 5, 8], [30, 25, 15, 12, 10, 8])
+MEAN_NIGHTS, MEAN_GAP = 3.6, 2.1
+
+GUEST_FIELDS = ("id", "first_name", "last_name", "email", "phone", "updated_at")
+CARD_FIELDS = ("id", "guest", "cardholder_name", "card_number", "balance", "cvc", "expiration_date",
+               "is_active", "updated_at")
+RESERVATION_FIELDS = ("id", "guest", "room", "meal", "check_in_date", "check_out_date", "total_cost", "status",
+                      "created_at", "reminder_sent", "updated_at")
+NIGHT_FIELDS = ("room", "reservation", "date")
+TRANSACTION_FIELDS = ("debit_card", "amount", "transaction_type", "reservation", "timestamp", "balance_after")
+
+
+def insert(model, fields, rows):
+    """Write prepared value tuples with one executemany; far cheaper per row than bulk_create"""
+    qn = connection.ops.quote_name
+    columns = ", ".join(qn(model._meta.get_field(name).column) for name in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(f"INSERT INTO {qn(model._meta.db_table)} ({columns}) VALUES ({placeholders})", rows)
+    return len(rows)
+
+
+class Command(BaseCommand):
+    help = (
+        "Append a synthetic, self-consistent data set for load and scale testing: guests with Rwandan "
+        "phone numbers and one card each, stays spread over a calendar without double bookings, mixed "
+        "statuses, and deposit/payment ledgers that reconcile. The same --seed and --today give the same "
+        "rows. Run it alone: it assigns primary keys itself, and stops if anything else writes guests, cards "
+        "or reservations meanwhile."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--guests", type=int, default=10000)
+        parser.add_argument("--reservations-per-guest", type=float, default=2.0, help="Average")
+        parser.add_argument(
+            "--rooms", type=int, default=None,
+            help="Rooms to create; by default enough for the stays to fill about 80%% of the calendar"
+        )
+        parser.add_argument("--past-days", type=int, default=365, help="Calendar days before --today")
+        parser.add_argument("--future-days", type=int, default=180, help="Calendar days from --today on")
+        parser.add_argument("--today", type=date.fromisoformat, default=None, help="YYYY-MM-DD; default today")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=5000, help="Guests planned and written per batch")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        if options["today"]:
+            self.now = datetime.combine(options["today"], datetime.min.time().replace(hour=12),
+                                        tzinfo=timezone.get_current_timezone())
+        else:
+            self.now = timezone.now()
+        self.today = timezone.localdate(self.now)
+        self.start = self.today - timedelta(days=options["past_days"])
+        self.end = self.today + timedelta(days=options["future_days"])
+        guests, per_guest = options["guests"], options["reservations_per_guest"]
+
+        # new rows continue after the existing ones, so runs can be stacked
+        self.next_id = {
+            model: (model.objects.aggregate(last=Max("id"))["last"] or 0) + 1
+            for model in (Guest, DebitCard, Reservation)
+        }
+        if self.next_id[Guest] + guests > 10 ** 7:
+            raise CommandError("Phone numbers run out at 10 million guests.")
+
+        rooms = options["rooms"] or max(1, math.ceil(
+            guests * per_guest * (MEAN_NIGHTS + MEAN_GAP) / (0.8 * (self.end - self.start).days)
+        ))
+        self.create_catalogue(rooms)
+
+        started = time.perf_counter()
+        written = 0
+        for first in range(0, guests, options["batch_size"]):
+            count = min(options["batch_size"], guests - first)
+            written += self.write_batch(count, per_guest)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f"[DATASET] {first + count}/{guests} guests, {written} rows ({written / elapsed:.0f} rows/s)"
+            )
+
+        # rows written behind the ORM's back send no signals; drop what was cached
+        catalogue.invalidate()
+        catalogue_cache.invalidate(Room)
+        catalogue_cache.invalidate(Meal)
+        self.stdout.write(f"[DATASET] Wrote {written} rows in {time.perf_counter() - started:.1f}s.")
+
+    def create_catalogue(self, count):
+        first = Room.objects.count() + 1
+        self.rooms = Room.objects.bulk_create([
+            Room(name=f"Room {first + n}", price_per_night=self.rng.choice(ROOM_PRICES)) for n in range(count)
+        ])
+        # stacked runs share the menu: add only the meals that are missing
+        meals = {meal.name: meal for meal in Meal.objects.filter(name__in=[name for name, _ in MEALS])}
+        meals.update((meal.name, meal) for meal in Meal.objects.bulk_create([
+            Meal(name=name, price=price) for name, price in MEALS if name not in meals
+        ]))
+        self.meals = [meals[name] for name, _ in MEALS]
+        catalogue.invalidate()
+        self.snapshot = catalogue.snapshot()
+        # the next free night of each room; active stays are laid end to end
+        self.free_from = [self.start + timedelta(days=self.rng.randrange(7)) for _ in self.rooms]
+        self.open_rooms = list(range(len(self.rooms)))
+
+    def write_batch(self, count, per_guest):
+        self.rows = {model: [] for model in (Guest, DebitCard, Reservation, RoomNight, Transaction)}
+        tails = {model: next_id - 1 for model, next_id in self.next_id.items()}
+        for _ in range(count):
+            self.plan_guest(per_guest)
+
+        with transaction.atomic():
+            self.check_tails(tails)
+            return (
+                insert(Guest, GUEST_FIELDS, self.rows[Guest])
+                + insert(DebitCard, CARD_FIELDS, self.rows[DebitCard])
+                + insert(Reservation, RESERVATION_FIELDS, self.rows[Reservation])
+                + insert(RoomNight, NIGHT_FIELDS, self.rows[RoomNight])
+                + insert(Transaction, TRANSACTION_FIELDS, self.rows[Transaction])
+            )
+
+    @staticmethod
+    def check_tails(tails):
+        """Fail if anything else added rows since the last batch: the keys planned for this one may be taken"""
+        for model, expected in tails.items():
+            if (model.objects.aggregate(last=Max("id"))["last"] or 0) != expected:
+                raise CommandError(
+                    f"New {model._meta.verbose_name_plural} were written while generating; run generate_dataset alone."
+                )
+
+    def take_id(self, model):
+        self.next_id[model] += 1
+        return self.next_id[model] - 1
+
+    def plan_guest(self, per_guest):
+        rng = self.rng
+        guest_id, card_id = self.take_id(Guest), self.take_id(DebitCard)
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        joined = self.now - timedelta(days=rng.uniform(30, 3 * 365))
+        self.rows[Guest].append((
+            guest_id, first_name, last_name, f"{first_name}.{last_name}.{guest_id}@example.com".lower(),
+            f"+2507{rng.choice(PHONE_PREFIXES)}{guest_id:07d}", self.timestamp(joined),
+        ))
+
+        stays = round(rng.expovariate(1 / per_guest)) if per_guest else 0
+        stays = sorted((self.plan_stay() for _ in range(stays)), key=lambda stay: stay["created_at"])
+
+        # deposits top the card up just before each payment that needs it
+        entries, balance, last = [], Decimal("0.00"), joined
+        if not stays or rng.random() < 0.3:
+            last = min(last + timedelta(minutes=rng.uniform(1, 60 * 24 * 30)), self.now)
+            balance = self.post(entries, balance, self.round_up(rng.uniform(20, 500)), "deposit", last)
+        for stay in stays:
+            stay["id"] = self.take_id(Reservation)
+            if stay["status"] != "paid":
+                continue
+            paid_at = max(stay["created_at"] + timedelta(seconds=rng.uniform(20, 280)), last)
+            if balance < stay["total_cost"]:
+                topped_up = max(paid_at - timedelta(seconds=rng.uniform(5, 15)), last)
+                amount = self.round_up(stay["total_cost"] - balance + Decimal(rng.randrange(100)))
+                balance = self.post(entries, balance, amount, "deposit", topped_up)
+            balance = self.post(entries, balance, stay["total_cost"], "payment", paid_at, stay["id"])
+            stay["updated_at"] = paid_at
+            stay["reminder_sent"] = paid_at - stay["created_at"] >= Reservation.REMINDER_AFTER
+            last = paid_at
+
+        self.rows[DebitCard].append((
+            card_id, guest_id, f"{first_name} {last_name}", f"4{card_id:015d}", str(balance),
+            f"{rng.randrange(1000):03d}", f"{rng.randint(1, 12):02d}/{rng.randint(27, 31)}", True,
+            self.timestamp(entries[-1][4] if entries else joined),
+        ))
+        for stay in stays:
+            self.rows[Reservation].append((
+                stay["id"], guest_id, stay["room"].id, stay["meal"].id if stay["meal"] else None,
+                stay["check_in"].isoformat(), stay["check_out"].isoformat(), str(stay["total_cost"]),
+                stay["status"], self.timestamp(stay["created_at"]), stay["reminder_sent"],
+                self.timestamp(stay["updated_at"]),
+            ))
+            if stay["status"] in Reservation.ACTIVE_STATUSES:
+                self.rows[RoomNight].extend(
+                    (stay["room"].id, stay["id"], (stay["check_in"] + timedelta(days=n)).isoformat())
+                    for n in range((stay["check_out"] - stay["check_in"]).days)
+                )
+        self.rows[Transaction].extend(
+            (card_id, str(amount), transaction_type, reservation_id, self.timestamp(at), str(balance_after))
+            for amount, transaction_type, reservation_id, balance_after, at in entries
+        )
+
+    def plan_stay(self):
+        rng = self.rng
+        nights = rng.choices(*NIGHTS)[0]
+        while self.open_rooms:
+            slot = rng.randrange(len(self.open_rooms))
+            index = self.open_rooms[slot]
+            check_in = self.free_from[index] + timedelta(days=rng.choices(*GAPS)[0])
+            if check_in + timedelta(days=nights) <= self.end:
+                break
+            self.open_rooms[slot] = self.open_rooms[-1]  # this room's calendar is full
+            self.open_rooms.pop()
+        else:
+            raise CommandError("The calendar is full; add --rooms or widen --past-days/--future-days.")
+        check_out = check_in + timedelta(days=nights)
+        room = self.rooms[index]
+        meal = rng.choice(self.meals) if rng.random() < 0.6 else None
+
+        roll = rng.random()
+        if check_in >= self.today and roll < 0.04:
+            status = "pending"  # booked in the last few minutes and not paid yet
+            booked = self.now - timedelta(seconds=rng.uniform(0, Reservation.CANCEL_AFTER.total_seconds()))
+        else:
+            status = "cancelled" if roll < (0.16 if check_in >= self.today else 0.10) else "paid"
+            booked = min(
+                datetime.combine(check_in, datetime.min.time(), tzinfo=self.now.tzinfo)
+                - timedelta(days=rng.uniform(0, 60), seconds=rng.uniform(0, 86400)),
+                self.now - timedelta(minutes=rng.uniform(10, 60 * 24 * 7)),
+            )
+        if status != "cancelled":
+            self.free_from[index] = check_out  # cancelled stays released their nights
+
+        return {
+            "room": room, "meal": meal, "check_in": check_in, "check_out": check_out, "status": status,
+            "total_cost": self.price(room, meal, check_in, check_out), "created_at": booked,
+            "updated_at": booked + (Reservation.CANCEL_AFTER if status == "cancelled" else timedelta()),
+            "reminder_sent": status == "cancelled" or (
+                status == "pending" and booked <= self.now - Reservation.REMINDER_AFTER
+            ),
+        }
+
+    def price(self, room, meal, check_in, check_out):
+        meal_price = meal.price if meal else Decimal("0")
+        if self.snapshot.rates or self.snapshot.discounts:
+            return price_stay(check_in, check_out, room_id=room.id, room_price=room.price_per_night,
+                              meal_price=meal_price, snapshot=self.snapshot)
+        return money(room.price_per_night * (check_out - check_in).days) + meal_price
+
+    @staticmethod
+    def post(entries, balance, amount, transaction_type, at, reservation_id=None):
+        balance += amount if transaction_type == "deposit" else -amount
+        entries.append((amount, transaction_type, reservation_id, balance, at))
+        return balance
+
+    @staticmethod
+    def timestamp(value):
+        # what the SQLite backend stores for an aware datetime, without its per-call overhead
+        return str(value.astimezone(dt_timezone.utc).replace(tzinfo=None))
+
+    @staticmethod
+    def round_up(amount, step=10):
+        return Decimal(math.ceil(Decimal(amount) / step) * step).quantize(Decimal("0.01"))
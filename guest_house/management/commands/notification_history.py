@@ -0,0 +1,32 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from guest_house.outbox import history
+
+
+class Command(BaseCommand):
+    help = "Show the notifications sent to a guest or phone number, e.g. all failures this week."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--guest", type=int, help="Guest id")
+        parser.add_argument("--phone", help="Phone number, local or E.164")
+        parser.add_argument("--days", type=int, default=7, help="How far back to look")
+        parser.add_argument("--failed", action="store_true", help="Only notifications with a failed attempt")
+
+    def handle(self, *args, **options):
+        if options["guest"] is None and not options["phone"]:
+            raise CommandError("Give --guest or --phone.")
+
+        notifications = history(
+            guest=options["guest"], phone=options["phone"],
+            since=timezone.now() - timedelta(days=options["days"]), failed=options["failed"]
+        )
+        for row in notifications.values(
+                "id", "created_at", "kind", "recipient", "status", "attempts", "message_id", "last_response"
+        ).iterator():
+            self.stdout.write(
+                f"{row['id']}\t{row['created_at']:%Y-%m-%d %H:%M}\t{row['kind']}\t{row['recipient']}\t"
+                f"{row['status']}\t{row['attempts']} attempts\t{row['message_id'] or row['last_response']}"
+            )
@@ -0,0 +1,118 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, OuterRef, Subquery
+
+from guest_house.models import DebitCard, Transaction, BalanceSnapshot
+
+
+def group_by_card(rows):
+    """Yield (card_id, [rows]) from rows ordered by card id; only one card is held at a time"""
+    card_id, group = None, []
+    for row in rows:
+        if row[0] != card_id:
+            if group:
+                yield card_id, group
+            card_id, group = row[0], []
+        group.append(row)
+    if group:
+        yield card_id, group
+
+
+class Command(BaseCommand):
+    help = (
+        "Check every card's ledger in one streaming pass: each entry's balance_after must follow "
+        "from the previous one, match the card's snapshots, and end at DebitCard.balance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows fetched per round trip")
+        parser.add_argument(
+            "--snapshot", action="store_true",
+            help="Record a balance snapshot for every card that reconciles"
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+
+        # Payments keep committing while the streams are read. Entries are checked up to the last one
+        # that existed at the start, and each card row comes with the id of its latest entry, read in
+        # the same statement as its balance: a card that moved since the start has its chain checked
+        # but not its balance, which belongs to entries past the cut-off.
+        cutoff = Transaction.objects.aggregate(last=Max("id"))["last"] or 0
+        latest = Transaction.objects.filter(debit_card=OuterRef("pk")).order_by("-id").values("id")[:1]
+
+        # Three streams ordered by card id are merged, so memory holds one card's rows at a time
+        cards = (
+            DebitCard.objects.order_by("id").annotate(latest=Subquery(latest))
+            .values_list("id", "balance", "latest").iterator(chunk_size=chunk_size)
+        )
+        entries = group_by_card(
+            Transaction.objects.filter(id__lte=cutoff).order_by("debit_card_id", "id")
+            .values_list("debit_card_id", "id", "transaction_type", "amount", "balance_after")
+            .iterator(chunk_size=chunk_size)
+        )
+        snapshots = group_by_card(
+            BalanceSnapshot.objects.order_by("debit_card_id", "transaction_id")
+            .values_list("debit_card_id", "transaction_id", "balance")
+            .iterator(chunk_size=chunk_size)
+        )
+        next_entries = next(entries, None)
+        next_snapshots = next(snapshots, None)
+
+        checked = problems = moved = 0
+        clean = []
+        for card_id, card_balance, latest_id in cards:
+            card_entries, card_snapshots = [], {}
+            if next_entries and next_entries[0] == card_id:
+                card_entries = next_entries[1]
+                next_entries = next(entries, None)
+            if next_snapshots and next_snapshots[0] == card_id:
+                card_snapshots = {txn_id: balance for _, txn_id, balance in next_snapshots[1]}
+                next_snapshots = next(snapshots, None)
+
+            settled = latest_id is None or latest_id <= cutoff
+            moved += not settled
+            errors = self.check_card(card_balance if settled else None, card_entries, card_snapshots)
+            checked += 1
+            for error in errors:
+                problems += 1
+                self.stdout.write(self.style.ERROR(f"[LEDGER] Card {card_id}: {error}"))
+            if options["snapshot"] and settled and not errors and card_entries:
+                clean.append(BalanceSnapshot(
+                    debit_card_id=card_id, transaction_id=card_entries[-1][1], balance=card_balance
+                ))
+                if len(clean) >= chunk_size:
+                    BalanceSnapshot.objects.bulk_create(clean)
+                    clean = []
+
+        if clean:
+            BalanceSnapshot.objects.bulk_create(clean)
+
+        if moved:
+            self.stdout.write(f"[LEDGER] {moved} cards changed during the check; their balances were not compared.")
+        self.stdout.write(f"[LEDGER] Checked {checked} cards, found {problems} problems.")
+        if problems:
+            raise CommandError("Ledger does not reconcile.")
+
+    def check_card(self, card_balance, entries, snapshots):
+        """Problems in one card's entries; card_balance None skips the comparison with the card"""
+        errors = []
+        previous = None
+        for _, txn_id, transaction_type, amount, balance_after in entries:
+            signed = amount if transaction_type == "deposit" else -amount
+            if previous is not None and previous + signed != balance_after:
+                errors.append(
+                    f"transaction {txn_id} leaves {balance_after}, expected {previous + signed}"
+                )
+            if txn_id in snapshots and snapshots[txn_id] != balance_after:
+                errors.append(
+                    f"transaction {txn_id} leaves {balance_after}, snapshot says {snapshots[txn_id]}"
+                )
+            previous = balance_after
+
+        if card_balance is not None:
+            if previous is None:
+                if card_balance:
+                    errors.append(f"balance is {card_balance} but the card has no ledger entries")
+            elif previous != card_balance:
+                errors.append(f"balance is {card_balance} but the ledger ends at {previous}")
+        return errors
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from guest_house.models import Notification
+from guest_house.outbox import replay
+
+
+class Command(BaseCommand):
+    help = "List or requeue dead-lettered notifications so send_notifications delivers them again."
+
+    def add_arguments(self, parser):
+        parser.add_argument("ids", nargs="*", type=int, help="Only these notifications")
+        parser.add_argument("--kind", choices=[kind for kind, _ in Notification.KIND_CHOICES])
+        parser.add_argument("--recipient", help="Only messages to this number")
+        parser.add_argument("--list", action="store_true", help="Show the dead letters instead of requeueing them")
+
+    def handle(self, *args, **options):
+        dead = Notification.objects.filter(status="dead").order_by("id")
+        if options["ids"]:
+            dead = dead.filter(pk__in=options["ids"])
+        if options["kind"]:
+            dead = dead.filter(kind=options["kind"])
+        if options["recipient"]:
+            dead = dead.filter(recipient=options["recipient"])
+
+        if options["list"]:
+            for notification_id, kind, recipient, attempts, last_response in dead.values_list(
+                    "id", "kind", "recipient", "attempts", "last_response").iterator():
+                self.stdout.write(f"{notification_id}\t{kind}\t{recipient}\t{attempts} attempts\t{last_response}")
+            return
+
+        count = replay(dead)
+        self.stdout.write(f"[OUTBOX] Requeued {count} dead-lettered notifications.")
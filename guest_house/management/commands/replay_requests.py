@@ -0,0 +1,334 @@
+import asyncio
+import io
+import json
+import math
+import sys
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.urls import Resolver404, resolve
+
+HOST = "testserver"
+
+# the query counter of the request running in this context, if any
+_queries = ContextVar("replay_queries", default=None)
+
+
+def count_queries(execute, sql, params, many, context):
+    counter = _queries.get()
+    if counter is not None:
+        counter[0] += 1
+    return execute(sql, params, many, context)
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def load(path):
+    """Replayable entries of a JSON-lines log; lines without a method and path are skipped"""
+    entries, skipped = [], 0
+    with open(path, encoding="utf-8") as log:
+        for line in log:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if not isinstance(entry, dict) or not entry.get("method") or not str(entry.get("path", "")).startswith("/"):
+                skipped += 1
+                continue
+            entries.append(prepare(entry))
+    return entries, skipped
+
+
+def prepare(entry):
+    method = entry["method"].upper()
+    path, _, query = entry["path"].partition("?")
+    headers = {name.lower(): str(value) for name, value in (entry.get("headers") or {}).items()}
+    body = entry.get("body")
+    if body is None:
+        body = b""
+    elif isinstance(body, str):
+        body = body.encode()
+    else:
+        body = json.dumps(body).encode()
+        headers.setdefault("content-type", "application/json")
+    try:
+        endpoint = f"{method} {resolve(path).view_name}"
+    except Resolver404:
+        endpoint = f"{method} <unresolved>"
+    return {"method": method, "path": path, "query": query, "headers": headers, "body": body, "endpoint": endpoint}
+
+
+def wsgi_environ(entry):
+    headers = dict(entry["headers"])
+    environ = {
+        "REQUEST_METHOD": entry["method"],
+        "PATH_INFO": entry["path"],
+        "SCRIPT_NAME": "",
+        "QUERY_STRING": entry["query"],
+        "SERVER_NAME": HOST,
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "127.0.0.1",
+        "CONTENT_TYPE": headers.pop("content-type", ""),
+        "CONTENT_LENGTH": str(len(entry["body"])),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(entry["body"]),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    headers.pop("content-length", None)
+    headers.setdefault("host", HOST)
+    for name, value in headers.items():
+        environ["HTTP_" + name.upper().replace("-", "_")] = value
+    return environ
+
+
+def call_wsgi(application, entry):
+    """Run one request through the WSGI app; returns its status code"""
+    status = []
+    response = application(wsgi_environ(entry), lambda line, headers, exc_info=None: status.append(line))
+    try:
+        for _ in response:
+            pass
+    finally:
+        if hasattr(response, "close"):
+            response.close()  # sends request_finished, as a server would
+    return int(status[0].split()[0])
+
+
+async def call_asgi(application, entry):
+    """Run one request through the ASGI app; returns its status code"""
+    headers = dict(entry["headers"])
+    headers.setdefault("host", HOST)
+    headers.setdefault("content-length", str(len(entry["body"])))
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": entry["method"],
+        "scheme": "http",
+        "path": entry["path"],
+        "raw_path": entry["path"].encode(),
+        "query_string": entry["query"].encode(),
+        "root_path": "",
+        "headers": [(name.encode(), value.encode()) for name, value in headers.items()],
+        "client": ("127.0.0.1", 0),
+        "server": (HOST, 80),
+    }
+    pending = [{"type": "http.request", "body": entry["body"], "more_body": False}]
+    finished = asyncio.Event()
+    status = []
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        await finished.wait()  # the client stays connected until the response is complete
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body" and not message.get("more_body"):
+            finished.set()
+
+    await application(scope, receive, send)
+    finished.set()
+    return status[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a JSON-lines request log against the project's URL conf in-process, through the WSGI or "
+        "ASGI application, and report per-endpoint latency percentiles, throughput, query counts and error "
+        "rates as JSON. Each line is an object with method, path (with any query string) and optionally "
+        "headers and body (a JSON value, or a string sent as is); other lines are skipped. The requests run "
+        "against the configured database, and writes are real."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("log", help="JSON-lines file of recorded requests")
+        parser.add_argument("--interface", choices=["wsgi", "asgi"], default="wsgi")
+        parser.add_argument(
+            "--concurrency", type=int, default=4,
+            help="Worker threads (wsgi) or concurrent requests on the event loop (asgi)"
+        )
+        parser.add_argument("--repeat", type=int, default=1, help="Times to replay the whole log")
+        parser.add_argument("--warmup", type=int, default=0, help="Requests replayed first and not measured")
+        parser.add_argument("--output", default=None, help="Write the JSON report here instead of stdout")
+
+    def handle(self, *args, **options):
+        entries, skipped = load(options["log"])
+        if not entries:
+            raise CommandError(f"No replayable requests in {options['log']} ({skipped} lines skipped).")
+        if options["concurrency"] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+
+        replay = self.run_wsgi if options["interface"] == "wsgi" else self.run_asgi
+        instrumented = []
+
+        def instrument(sender, connection, **kwargs):
+            if count_queries not in connection.execute_wrappers:
+                connection.execute_wrappers.append(count_queries)
+                instrumented.append(connection)
+
+        for connection in connections.all(initialized_only=True):
+            instrument(None, connection)
+        connection_created.connect(instrument)
+        try:
+            if options["warmup"]:
+                replay([entries[n % len(entries)] for n in range(options["warmup"])], options["concurrency"])
+            started = time.perf_counter()
+            results = replay(entries * options["repeat"], options["concurrency"])
+            elapsed = time.perf_counter() - started
+        finally:
+            connection_created.disconnect(instrument)
+            for connection in instrumented:
+                if count_queries in connection.execute_wrappers:
+                    connection.execute_wrappers.remove(count_queries)
+
+        report = self.report(results, elapsed, skipped, options)
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as out:
+                out.write(text + "\n")
+            self.stderr.write(
+                f"[REPLAY] {report['requests']} requests in {elapsed:.2f}s "
+                f"({report['throughput']:.0f}/s); report in {options['output']}."
+            )
+        else:
+            self.stdout.write(text)
+
+    def measure(self, entry, call):
+        counter = [0]
+        token = _queries.set(counter)
+        started = time.perf_counter()
+        try:
+            status = call(entry)
+        except Exception:
+            status = None  # raised through the handler instead of becoming a 500
+        finally:
+            _queries.reset(token)
+        return entry["endpoint"], status, time.perf_counter() - started, counter[0]
+
+    def run_wsgi(self, entries, concurrency):
+        application = get_wsgi_application()
+        results, lock = [], threading.Lock()
+        remaining = iter(entries)
+
+        def worker():
+            while True:
+                with lock:
+                    entry = next(remaining, None)
+                if entry is None:
+                    return
+                result = self.measure(entry, lambda entry: call_wsgi(application, entry))
+                with lock:
+                    results.append(result)
+
+        workers = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return results
+
+    def run_asgi(self, entries, concurrency):
+        application = get_asgi_application()
+
+        async def replay():
+            results, remaining = [], iter(entries)
+
+            async def worker():
+                for entry in remaining:
+                    counter = [0]
+                    token = _queries.set(counter)
+                    started = time.perf_counter()
+                    try:
+                        status = await call_asgi(application, entry)
+                    except Exception:
+                        status = None
+                    finally:
+                        _queries.reset(token)
+                    results.append((entry["endpoint"], status, time.perf_counter() - started, counter[0]))
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            return results
+
+        return asyncio.run(replay())
+
+    def report(self, results, elapsed, skipped, options):
+        endpoints = {}
+        for endpoint, status, seconds, queries in results:
+            stats = endpoints.setdefault(endpoint, {"latencies": [], "queries": [], "statuses": {}, "errors": 0})
+            stats["latencies"].append(seconds * 1000)
+            stats["queries"].append(queries)
+            key = str(status) if status is not None else "exception"
+            stats["statuses"][key] = stats["statuses"].get(key, 0) + 1
+            if status is None or status >= 500:
+                stats["errors"] += 1
+
+        def summary(stats):
+            latencies = sorted(stats["latencies"])
+            count = len(latencies)
+            return {
+                "requests": count,
+                "errors": stats["errors"],
+                "error_rate": round(stats["errors"] / count, 4),
+                "statuses": dict(sorted(stats["statuses"].items())),
+                "latency_ms": {
+                    "mean": round(sum(latencies) / count, 3),
+                    "p50": round(percentile(latencies, 0.50), 3),
+                    "p95": round(percentile(latencies, 0.95), 3),
+                    "p99": round(percentile(latencies, 0.99), 3),
+                    "max": round(latencies[-1], 3),
+                },
+                "queries": {
+                    "total": sum(stats["queries"]),
+                    "mean": round(sum(stats["queries"]) / count, 2),
+                    "max": max(stats["queries"]),
+                },
+            }
+
+        overall = {"latencies": [], "queries": [], "statuses": {}, "errors": 0}
+        for stats in endpoints.values():
+            overall["latencies"] += stats["latencies"]
+            overall["queries"] += stats["queries"]
+            overall["errors"] += stats["errors"]
+            for key, count in stats["statuses"].items():
+                overall["statuses"][key] = overall["statuses"].get(key, 0) + count
+
+        return {
+            "started": datetime.now(timezone.utc).isoformat(),
+            "log": options["log"],
+            "interface": options["interface"],
+            "concurrency": options["concurrency"],
+            "repeat": options["repeat"],
+            "warmup": options["warmup"],
+            "debug": settings.DEBUG,
+            "db_profile": settings.DB_PROFILE,
+            "skipped_lines": skipped,
+            "requests": len(results),
+            "duration_s": round(elapsed, 3),
+            "throughput": round(len(results) / elapsed, 2) if elapsed else None,
+            "overall": summary(overall),
+            "endpoints": {name: summary(stats) for name, stats in sorted(endpoints.items())},
+        }
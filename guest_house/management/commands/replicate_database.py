@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from guest_house.replication import replicate
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the read replicas listed in DATABASE_REPLICAS."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep replicating until interrupted instead of exiting after one copy"
+        )
+        parser.add_argument(
+            "--interval", type=float, default=1.0,
+            help="Seconds between copies with --loop: the most the replicas lag"
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DATABASE_REPLICAS:
+            raise CommandError("No replicas configured; set DATABASE_REPLICAS to a comma-separated list of files.")
+        try:
+            while True:
+                aliases = replicate()
+                if not options["loop"]:
+                    self.stdout.write(f"[REPLICATION] Copied the primary to {', '.join(aliases)}.")
+                    return
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("[REPLICATION] Stopped.")
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from guest_house.expiry import ReservationWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "Run reminders and cancellations continuously, waking at each reservation's deadline "
+        "instead of polling from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0,
+            help="Longest sleep between checks for new reservations, in seconds"
+        )
+        parser.add_argument(
+            "--sweep-interval", type=float, default=60.0,
+            help="Seconds between full passes over all due reservations"
+        )
+
+    def handle(self, *args, **options):
+        worker = ReservationWorker(
+            self.stdout,
+            poll_interval=options["poll_interval"],
+            sweep_interval=options["sweep_interval"],
+        )
+        self.stdout.write("[WORKER] Watching pending reservations. Press Ctrl+C to stop.")
+        try:
+            worker.run()
+        except KeyboardInterrupt:
+            self.stdout.write("[WORKER] Stopped.")
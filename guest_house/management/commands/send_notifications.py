@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from guest_house.notifications import get_sms
+from guest_house.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Deliver pending guest notifications from the outbox in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=settings.SMS_BATCH_SIZE,
+            help="Outbox rows read and sent per round"
+        )
+        parser.add_argument(
+            "--worker-id", default=None,
+            help="Lease owner name; defaults to host:pid. Run several workers to send in parallel"
+        )
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep draining until interrupted instead of exiting after one pass"
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0,
+            help="Seconds to wait between passes with --loop"
+        )
+
+    def handle(self, *args, **options):
+        sms = get_sms()
+        try:
+            while True:
+                sent, failed = drain(
+                    sms, self.stdout, batch_size=options["batch_size"], owner=options["worker_id"]
+                )
+                if sent or failed or not options["loop"]:
+                    self.stdout.write(f"[OUTBOX] Sent {sent}, failed {failed}.")
+                if not options["loop"]:
+                    return
+                time.sleep(options["poll_interval"])
+        except KeyboardInterrupt:
+            self.stdout.write("[OUTBOX] Stopped.")
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.4 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guest_house', '0004_alter_debitcard_balance_alter_debitcard_card_number_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['check_out_date', 'check_in_date'], name='reservation_stay_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['room', 'check_out_date'], name='reservation_room_stay_idx'),
+        ),
+    ]
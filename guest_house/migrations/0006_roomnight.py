@@ -0,0 +1,47 @@
+# Generated by Django 5.2.4 on 2026-10-17 20:06
+
+from datetime import date, timedelta
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_room_nights(apps, schema_editor):
+    """Claim nights for reservations that still hold a room"""
+    Reservation = apps.get_model('guest_house', 'Reservation')
+    RoomNight = apps.get_model('guest_house', 'RoomNight')
+
+    active = Reservation.objects.filter(
+        status__in=('pending', 'paid'),
+        room__isnull=False,
+        check_out_date__gt=date.today(),
+    )
+    nights = []
+    for res in active.iterator():
+        for n in range((res.check_out_date - res.check_in_date).days):
+            nights.append(RoomNight(room_id=res.room_id, reservation_id=res.id, date=res.check_in_date + timedelta(days=n)))
+    # legacy rows may already overlap; the first reservation keeps the night
+    RoomNight.objects.bulk_create(nights, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guest_house', '0005_reservation_reservation_stay_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('reservation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='guest_house.reservation')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='guest_house.room')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('room', 'date'), name='unique_room_night')],
+            },
+        ),
+        migrations.RunPython(backfill_room_nights, migrations.RunPython.noop),
+    ]
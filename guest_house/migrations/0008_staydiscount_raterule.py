@@ -0,0 +1,35 @@
+# Generated by Django 5.2.4 on 2026-10-17 20:11
+
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guest_house', '0007_reservation_reservation_keyset_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StayDiscount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_nights', models.PositiveIntegerField(unique=True)),
+                ('percent', models.DecimalField(decimal_places=2, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)])),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RateRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+                ('weekdays', models.CharField(blank=True, help_text='e.g. 4,5 for Friday and Saturday nights', max_length=13, validators=[django.core.validators.RegexValidator('^[0-6](,[0-6])*$', 'Weekdays must be comma-separated numbers, Monday=0 to Sunday=6.')])),
+                ('multiplier', models.DecimalField(decimal_places=3, max_digits=5, validators=[django.core.validators.MinValueValidator(0)])),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rate_rules', to='guest_house.room')),
+            ],
+        ),
+    ]
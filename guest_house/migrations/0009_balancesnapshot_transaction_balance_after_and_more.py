@@ -0,0 +1,60 @@
+# Generated by Django 5.2.4 on 2026-10-17 20:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_balance_after(apps, schema_editor):
+    """Replay each card's history backwards from its current balance"""
+    DebitCard = apps.get_model('guest_house', 'DebitCard')
+    Transaction = apps.get_model('guest_house', 'Transaction')
+
+    for card_id, balance in DebitCard.objects.values_list('id', 'balance').iterator():
+        entries = list(Transaction.objects.filter(debit_card_id=card_id).order_by('-id'))
+        for entry in entries:
+            entry.balance_after = balance
+            balance -= entry.amount if entry.transaction_type == 'deposit' else -entry.amount
+        Transaction.objects.bulk_update(entries, ['balance_after'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guest_house', '0008_staydiscount_raterule'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('taken_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='balance_after',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_balance_after, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['debit_card', 'timestamp'], name='transaction_card_time_idx'),
+        ),
+        migrations.AddField(
+            model_name='balancesnapshot',
+            name='debit_card',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='guest_house.debitcard'),
+        ),
+        migrations.AddField(
+            model_name='balancesnapshot',
+            name='transaction',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='guest_house.transaction'),
+        ),
+        migrations.AddIndex(
+            model_name='balancesnapshot',
+            index=models.Index(fields=['debit_card', 'transaction'], name='snapshot_card_txn_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.4 on 2026-10-17 20:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guest_house', '0009_balancesnapshot_transaction_balance_after_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('reservation_created', 'Reservation created'), ('reminder_due', 'Reminder due'), ('cancelled', 'Cancelled'), ('payment_received', 'Payment received')], max_length=20)),
+                ('recipient', models.CharField(max_length=20)),
+                ('text', models.TextField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('last_response', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('reservation', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='guest_house.reservation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'id'], name='notification_status_idx')],
+            },
+        ),
+    ]
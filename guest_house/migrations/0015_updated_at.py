@@ -0,0 +1,43 @@
+# Generated by Django 5.2.4 on 2026-10-17 20:41
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_reservation_updated_at(apps, schema_editor):
+    """Existing reservations were last touched no earlier than their creation"""
+    Reservation = apps.get_model('guest_house', 'Reservation')
+    Reservation.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guest_house', '0014_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='debitcard',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='guest',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_reservation_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['updated_at'], name='reservation_updated_idx'),
+        ),
+    ]
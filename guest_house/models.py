@@ -1,8 +1,13 @@
-from django.db import models
-from django.core.validators import RegexValidator, MinValueValidator
+from django.db import models, transaction
+from django.db.models import F, Q
+from django.core.exceptions import ValidationError
+from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
+from django.core.serializers.json import DjangoJSONEncoder
 from django.utils import timezone
 from datetime import timedelta
 
+from .pricing import price_stay
+
 
 class Room(models.Model):
     name = models.CharField(
@@ -35,6 +40,47 @@ class Meal(models.Model):
         return self.name
 
 
+class RateRule(models.Model):
+    """
+    Multiplier applied to a room's nightly price on matching nights.
+
+    Leave the dates empty for an open-ended rule and the weekdays empty to match
+    every day; a rule without a room applies to all rooms. When several rules
+    match the same night their multipliers are combined.
+    """
+    name = models.CharField(max_length=100)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='rate_rules', null=True, blank=True)
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)  # inclusive
+    weekdays = models.CharField(
+        max_length=13,
+        blank=True,
+        validators=[RegexValidator(r'^[0-6](,[0-6])*$', "Weekdays must be comma-separated numbers, Monday=0 to Sunday=6.")],
+        help_text="e.g. 4,5 for Friday and Saturday nights"
+    )
+    multiplier = models.DecimalField(
+        max_digits=5,
+        decimal_places=3,
+        validators=[MinValueValidator(0)]
+    )
+
+    def __str__(self):
+        return f"{self.name} (×{self.multiplier})"
+
+
+class StayDiscount(models.Model):
+    """Percentage off the room cost for stays of at least min_nights; the best match wins"""
+    min_nights = models.PositiveIntegerField(unique=True)
+    percent = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        validators=[MinValueValidator(0), MaxValueValidator(100)]
+    )
+
+    def __str__(self):
+        return f"{self.percent}% off {self.min_nights}+ nights"
+
+
 class Guest(models.Model):
     first_name = models.CharField(
         max_length=50,
@@ -55,6 +101,8 @@ class Guest(models.Model):
             )
         ]
     )
+    # conditional GET: see conditional.py
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     @property
     def full_name(self):
@@ -64,6 +112,24 @@ class Guest(models.Model):
         return self.full_name
 
 
+class DebitCardQuerySet(models.QuerySet):
+    def debit(self, card_id, amount):
+        """
+        Take amount off an active card in a single conditional UPDATE.
+
+        Returns False, changing nothing, when the card lacks the funds.
+        """
+        return self.filter(pk=card_id, is_active=True, balance__gte=amount).update(
+            balance=F('balance') - amount, updated_at=timezone.now()
+        ) == 1
+
+    def credit(self, card_id, amount):
+        """Add amount to an active card in a single UPDATE"""
+        return self.filter(pk=card_id, is_active=True).update(
+            balance=F('balance') + amount, updated_at=timezone.now()
+        ) == 1
+
+
 class DebitCard(models.Model):
     guest = models.OneToOneField(Guest, on_delete=models.CASCADE, related_name="card", null=True, blank=True)
     cardholder_name = models.CharField(
@@ -91,17 +157,51 @@ class DebitCard(models.Model):
     )
     expiration_date = models.CharField(max_length=5)  # MM/YY
     is_active = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = DebitCardQuerySet.as_manager()
 
     def __str__(self):
         return f"Card ending in {self.card_number[-4:]} ({self.cardholder_name or 'N/A'})"
 
 
+class ReservationQuerySet(models.QuerySet):
+    def due_for_reminder(self, now):
+        """Set-based Reservation.should_send_reminder"""
+        return self.filter(
+            status='pending',
+            reminder_sent=False,
+            created_at__lte=now - Reservation.REMINDER_AFTER
+        )
+
+    def due_for_cancel(self, now):
+        """Set-based Reservation.should_cancel: unpaid past the deadline and already reminded"""
+        return self.filter(
+            status='pending',
+            reminder_sent=True,
+            created_at__lte=now - Reservation.CANCEL_AFTER
+        )
+
+    def cancel(self):
+        """Cancel the selected reservations and release their room nights in bulk"""
+        with transaction.atomic():
+            RoomNight.objects.filter(reservation__in=self).delete()
+            return self.update(status='cancelled', updated_at=timezone.now())
+
+
 class Reservation(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
         ('paid', 'Paid'),
         ('cancelled', 'Cancelled')
     ]
+    # statuses that hold a room for their dates
+    ACTIVE_STATUSES = ('pending', 'paid')
+
+    # unpaid reservations get a reminder, then are cancelled
+    REMINDER_AFTER = timedelta(minutes=2)
+    CANCEL_AFTER = timedelta(minutes=5)
+
     guest = models.ForeignKey(Guest, on_delete=models.CASCADE)
     room = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, blank=True)
     meal = models.ForeignKey(Meal, on_delete=models.SET_NULL, null=True, blank=True)
@@ -113,15 +213,67 @@ class Reservation(models.Model):
     # automation
     created_at = models.DateTimeField(auto_now_add=True)
     reminder_sent = models.BooleanField(default=False)
+    # bumped by every write, bulk ones included, for conditional GET
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ReservationQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # interval lookups for availability: a range scan on check_out_date
+            # skips every stay that ended before the requested window
+            models.Index(fields=['check_out_date', 'check_in_date'], name='reservation_stay_idx'),
+            models.Index(fields=['room', 'check_out_date'], name='reservation_room_stay_idx'),
+            # keyset pagination
+            models.Index(fields=['created_at', 'id'], name='reservation_keyset_idx'),
+            # collection ETags take Max(updated_at)
+            models.Index(fields=['updated_at'], name='reservation_updated_idx'),
+            # reminder and cancellation sweeps, which walk the due rows in id
+            # order (expiry.transition); only pending rows are ever due, and
+            # they are a small, short-lived fraction of the table. Keyed on id
+            # alone because Django filters booleans as `NOT reminder_sent`,
+            # which a (reminder_sent, ...) prefix cannot seek on.
+            models.Index(fields=['id'], condition=Q(status='pending'), name='reservation_pending_idx'),
+        ]
+
+    def calculate_total_cost(self):
+        """Room nights at their seasonal rates (less any length-of-stay discount) + meal price"""
+        return price_stay(
+            self.check_in_date,
+            self.check_out_date,
+            room_id=self.room_id,
+            room_price=self.room.price_per_night if self.room else None,
+            meal_price=self.meal.price if self.meal else None,
+        )
+
+    # a save that writes any of these re-syncs the room nights
+    NIGHT_FIELDS = {'room', 'room_id', 'check_in_date', 'check_out_date', 'status'}
+
+    def clean(self):
+        if self.check_in_date and self.check_out_date:
+            if self.check_out_date <= self.check_in_date:
+                raise ValidationError({'check_out_date': "Check-out date must be after check-in date."})
+            if self.room_id and self.status in self.ACTIVE_STATUSES and Reservation.objects.filter(
+                status__in=self.ACTIVE_STATUSES,
+                room_id=self.room_id,
+                check_out_date__gt=self.check_in_date,
+                check_in_date__lt=self.check_out_date,
+            ).exclude(pk=self.pk).exists():
+                raise ValidationError({'room': "This room is already booked for the selected dates."})
 
     def save(self, *args, **kwargs):
-        """Auto-calculate total cost: (nights × room price) + meal price"""
+        """
+        Auto-calculate total cost, and claim or release the room nights with
+        the same transaction, so every write path (API, admin, ORM) keeps them
+        in step. Raises IntegrityError when another reservation holds a night.
+        """
         if self.check_in_date and self.check_out_date:
-            nights = (self.check_out_date - self.check_in_date).days
-            room_cost = self.room.price_per_night * nights if self.room else 0
-            meal_cost = self.meal.price if self.meal else 0
-            self.total_cost = room_cost + meal_cost
-        super().save(*args, **kwargs)
+            self.total_cost = self.calculate_total_cost()
+        update_fields = kwargs.get('update_fields')
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if update_fields is None or self.NIGHT_FIELDS & set(update_fields):
+                self.sync_nights()
 
     def __str__(self):
         return f"Reservation for {self.guest.full_name}"
@@ -130,17 +282,66 @@ class Reservation(models.Model):
         return (
             self.status == "pending"
             and not self.reminder_sent
-            and timezone.now() >= self.created_at + timedelta(minutes=2)
+            and timezone.now() >= self.created_at + self.REMINDER_AFTER
         )
 
     def should_cancel(self):
         return (
             self.status == "pending"
-            and timezone.now() >= self.created_at + timedelta(minutes=5)
+            and self.reminder_sent
+            and timezone.now() >= self.created_at + self.CANCEL_AFTER
         )
 
+    def stay_dates(self):
+        """Every night of the stay, check-out day excluded"""
+        nights = (self.check_out_date - self.check_in_date).days
+        return [self.check_in_date + timedelta(days=n) for n in range(nights)]
+
+    def sync_nights(self):
+        """
+        Hold exactly the room's nights of the stay while the reservation is
+        active, and none otherwise; only the difference is written.
+
+        Raises IntegrityError when another reservation already holds one of the
+        nights, so call it inside the transaction that saves the reservation.
+        """
+        wanted = set()
+        if self.room_id and self.status in self.ACTIVE_STATUSES:
+            wanted = {(self.room_id, night) for night in self.stay_dates()}
+        held = {(room_id, night): pk for pk, room_id, night in self.nights.values_list('pk', 'room_id', 'date')}
+        stale = [pk for key, pk in held.items() if key not in wanted]
+        if stale:
+            RoomNight.objects.filter(pk__in=stale).delete()
+        return RoomNight.objects.bulk_create([
+            RoomNight(room_id=room_id, reservation=self, date=night)
+            for room_id, night in sorted(wanted - held.keys())
+        ])
+
+    def release_nights(self):
+        RoomNight.objects.filter(reservation=self).delete()
+
+
+class RoomNight(models.Model):
+    """Occupancy of a room for one night; the unique constraint makes double bookings fail at insert"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='nights')
+    reservation = models.ForeignKey(Reservation, on_delete=models.CASCADE, related_name='nights')
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'date'], name='unique_room_night'),
+        ]
+
+    def __str__(self):
+        return f"{self.room} on {self.date}"
+
 
 class Transaction(models.Model):
+    """
+    Ledger entry. Entries are append-only and each one records the card
+    balance it left behind, so the ledger, not DebitCard.balance, is the
+    source of truth; see ledger.py.
+    """
     debit_card = models.ForeignKey(DebitCard, on_delete=models.CASCADE)
     amount = models.DecimalField(
         max_digits=10,
@@ -153,6 +354,119 @@ class Transaction(models.Model):
     )
     reservation = models.ForeignKey(Reservation, on_delete=models.SET_NULL, null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    balance_after = models.DecimalField(max_digits=10, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            # keyset pagination
+            models.Index(fields=['timestamp', 'id'], name='transaction_keyset_idx'),
+            # card statements
+            models.Index(fields=['debit_card', 'timestamp'], name='transaction_card_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.transaction_type}: {self.amount} on {self.debit_card}"
+
+    @property
+    def signed_amount(self):
+        return self.amount if self.transaction_type == 'deposit' else -self.amount
+
+    @property
+    def balance_before(self):
+        return self.balance_after - self.signed_amount
+
+
+class BalanceSnapshot(models.Model):
+    """Balance of a card as verified by reconcile_ledger, up to and including `transaction`"""
+    debit_card = models.ForeignKey(DebitCard, on_delete=models.CASCADE, related_name='snapshots')
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='+')
+    balance = models.DecimalField(max_digits=10, decimal_places=2)
+    taken_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['debit_card', 'transaction'], name='snapshot_card_txn_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.debit_card}: {self.balance} at {self.taken_at}"
+
+
+class Notification(models.Model):
+    """
+    Outbox entry: an SMS written in the same database transaction as the
+    state change it reports, and delivered later by send_notifications;
+    see outbox.py.
+    """
+    KIND_CHOICES = [
+        ('reservation_created', 'Reservation created'),
+        ('reminder_due', 'Reminder due'),
+        ('cancelled', 'Cancelled'),
+        ('payment_received', 'Payment received'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('dead', 'Dead letter'),  # failed for good; replay_notifications requeues
+    ]
+
+    reservation = models.ForeignKey(
+        Reservation, on_delete=models.CASCADE, null=True, blank=True, related_name='notifications'
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    recipient = models.CharField(max_length=20)
+    text = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    # the provider's answer to the latest failed attempt; empty if none failed
+    last_response = models.TextField(blank=True)
+    # set from the provider's response once sent
+    message_id = models.CharField(max_length=100, blank=True)
+    cost = models.CharField(max_length=30, blank=True)
+    # retry backoff: not claimable before this time
+    next_attempt_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # the drainer holding the row, until lease_expires_at
+    lease_owner = models.CharField(max_length=100, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # the drainer reads pending rows in id order
+            models.Index(fields=['status', 'id'], name='notification_status_idx'),
+            # delivery history of a phone number
+            models.Index(fields=['recipient', 'created_at'], name='notification_recipient_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} to {self.recipient} ({self.status})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Stored outcome of a POST made with an Idempotency-Key header; see idempotency.py.
+    A row without a status_code is a request still in progress, run by `owner`
+    until `lease_expires_at`.
+    """
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    owner = models.CharField(max_length=32, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='unique_idempotency_key'),
+        ]
+        indexes = [
+            # purge_idempotency_keys
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.scope}:{self.key}"
@@ -0,0 +1,12 @@
+from .backends import (
+    AfricasTalkingBackend, ConsoleBackend, FakeGateway, FakeGatewayBackend, FileBackend, HTTPGatewayBackend,
+)
+from .dispatch import Message, Result, dispatch, is_permanent
+from .ratelimit import TokenBucket, get_rate_limiter
+from .sms import format_phone_for_sms, get_sms
+
+__all__ = [
+    'AfricasTalkingBackend', 'ConsoleBackend', 'FakeGateway', 'FakeGatewayBackend', 'FileBackend',
+    'HTTPGatewayBackend', 'Message', 'Result', 'TokenBucket', 'dispatch', 'format_phone_for_sms',
+    'get_rate_limiter', 'get_sms', 'is_permanent',
+]
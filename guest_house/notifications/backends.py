@@ -0,0 +1,196 @@
+"""
+SMS backends.
+
+Every backend has `send(message, recipients)` and answers in the shape of the
+Africa's Talking SMS API, {"SMSMessageData": {"Recipients": [...]}}, so
+dispatch can map results back the same way whichever one SMS_BACKEND names:
+
+- AfricasTalkingBackend: the real provider; the SDK is imported and
+  initialised on the first send, not when Django starts.
+- ConsoleBackend: prints each message, for development.
+- FileBackend: appends each message as a JSON line to SMS_FILE_PATH.
+- HTTPGatewayBackend: posts to an Africa's Talking-compatible HTTP endpoint
+  at SMS_GATEWAY_URL.
+- FakeGatewayBackend: the same, against an in-process FakeGateway that
+  simulates latency and failures, for offline tests and benchmarks.
+"""
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+from urllib.request import Request, urlopen
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from .dispatch import E164
+
+
+def accepted(recipients, cost="RWF 0.0000"):
+    """A response reporting every recipient as sent"""
+    return {"SMSMessageData": {
+        "Message": f"Sent to {len(recipients)}/{len(recipients)}",
+        "Recipients": [
+            {"number": number, "status": "Success", "statusCode": 101, "cost": cost,
+             "messageId": f"ATXid_{uuid.uuid4().hex}"}
+            for number in recipients
+        ],
+    }}
+
+
+class BaseBackend:
+    def send(self, message, recipients):
+        raise NotImplementedError
+
+
+class AfricasTalkingBackend(BaseBackend):
+    def __init__(self):
+        self._sms = None
+        self._lock = threading.Lock()
+
+    @property
+    def sms(self):
+        with self._lock:
+            if self._sms is None:
+                if not settings.AT_API_KEY:
+                    raise ImproperlyConfigured("AT_API_KEY must be set to send SMS through Africa's Talking.")
+                import africastalking
+
+                africastalking.initialize(settings.AT_USERNAME, settings.AT_API_KEY)
+                self._sms = africastalking.SMS
+        return self._sms
+
+    def send(self, message, recipients):
+        return self.sms.send(message, recipients)
+
+
+class ConsoleBackend(BaseBackend):
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self._lock = threading.Lock()
+
+    def send(self, message, recipients):
+        with self._lock:
+            self.stream.write(f"[SMS] to {', '.join(recipients)}: {message}\n")
+            self.stream.flush()
+        return accepted(recipients)
+
+
+class FileBackend(BaseBackend):
+    def __init__(self, path=None):
+        self.path = path or settings.SMS_FILE_PATH
+        self._lock = threading.Lock()
+
+    def send(self, message, recipients):
+        line = json.dumps({"sent_at": timezone.now().isoformat(), "to": recipients, "message": message})
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        return accepted(recipients)
+
+
+class HTTPGatewayBackend(BaseBackend):
+    """Posts to the Africa's Talking messaging API, or anything that speaks it"""
+
+    def __init__(self, url=None, timeout=10):
+        self.url = url or settings.SMS_GATEWAY_URL
+        self.timeout = timeout
+
+    def send(self, message, recipients):
+        data = urlencode({"username": settings.AT_USERNAME, "to": ",".join(recipients), "message": message})
+        request = Request(self.url, data=data.encode(), headers={
+            "Accept": "application/json",
+            "Content-Type": "application/x-www-form-urlencoded",
+            "apiKey": settings.AT_API_KEY,
+        })
+        # HTTP errors raise, so dispatch treats the whole send as failed
+        with urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+
+class FakeGateway:
+    """
+    Local stand-in for the provider's messaging endpoint.
+
+    Each request sleeps `latency` seconds (plus up to `jitter`), fails with a
+    500 for a fraction `error_rate` of requests, rejects malformed numbers
+    like the real API and accepts everything else. `requests` and `messages`
+    count what it received.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = self.messages = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/version1/messaging"
+
+    def start(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+                status, payload = gateway.handle(parse_qs(body))
+                content = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def handle(self, form):
+        recipients = [number for number in form.get("to", [""])[0].split(",") if number]
+        with self._lock:
+            self.requests += 1
+            self.messages += len(recipients)
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate
+        time.sleep(delay)
+
+        if failed:
+            return 500, {"error": "Simulated gateway error"}
+        response = accepted([number for number in recipients if E164.match(number)], cost="RWF 20.0000")
+        response["SMSMessageData"]["Recipients"] += [
+            {"number": number, "status": "InvalidPhoneNumber", "statusCode": 403, "cost": "0", "messageId": "None"}
+            for number in recipients if not E164.match(number)
+        ]
+        return 200, response
+
+
+class FakeGatewayBackend(HTTPGatewayBackend):
+    """HTTP backend that starts its own FakeGateway unless given a url"""
+
+    def __init__(self, url=None, timeout=10, gateway=None):
+        if url is None:
+            gateway = gateway or FakeGateway(
+                latency=settings.SMS_FAKE_LATENCY, error_rate=settings.SMS_FAKE_ERROR_RATE
+            ).start()
+            url = gateway.url
+        self.gateway = gateway
+        super().__init__(url, timeout)
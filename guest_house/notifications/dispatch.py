@@ -0,0 +1,128 @@
+"""
+Batched, concurrent SMS dispatch.
+
+Messages with identical text are grouped into multi-recipient sends of at most
+SMS_BATCH_SIZE numbers, and the sends run on a pool of SMS_MAX_WORKERS threads,
+so a backlog costs roughly (sends / workers) round trips instead of one round
+trip per guest. The gateway reports a status for each number in its
+`Recipients` list; those are mapped back to the caller's keys.
+
+Numbers the provider would refuse outright are failed here without a call,
+and an optional TokenBucket keeps the send rate at the provider's limit.
+"""
+import re
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+
+Message = namedtuple('Message', 'key text recipient')
+Result = namedtuple('Result', 'key recipient sent response')
+
+# Africa's Talking statusCodes for Processed, Success and Queued
+SENT_STATUS_CODES = {100, 101, 102}
+# ...and for InvalidPhoneNumber, UnsupportedNumberType, UserInBlacklist and
+# DoNotDisturbRejection, which no retry can fix
+PERMANENT_STATUS_CODES = {403, 404, 406, 409}
+
+# the format the Africa's Talking SDK accepts; it refuses the whole send otherwise
+E164 = re.compile(r"^\+\d{1,3}\d{3,}$")
+
+
+def batches(messages, batch_size):
+    """Yield (text, [Message]) groups of at most batch_size messages sharing a text"""
+    by_text = defaultdict(list)
+    for message in messages:
+        by_text[message.text].append(message)
+    for text, group in by_text.items():
+        for start in range(0, len(group), batch_size):
+            yield text, group[start:start + batch_size]
+
+
+def recipient_statuses(response):
+    """{number: recipient entry} from a gateway response"""
+    try:
+        recipients = response['SMSMessageData']['Recipients']
+    except (KeyError, TypeError):
+        return {}
+    return {entry.get('number'): entry for entry in recipients}
+
+
+def is_sent(entry):
+    try:
+        return int(entry.get('statusCode')) in SENT_STATUS_CODES
+    except (TypeError, ValueError):
+        return entry.get('status') == 'Success'
+
+
+def is_permanent(response):
+    """Whether a failed send can never succeed, given the failure's response or exception"""
+    if isinstance(response, ValueError):
+        # raised before any call is made, e.g. "Invalid phone number: 0788285575"
+        return True
+    if isinstance(response, dict):
+        try:
+            return int(response.get('statusCode')) in PERMANENT_STATUS_CODES
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _results(group, response=None, error=None):
+    if error is not None:
+        return [Result(m.key, m.recipient, False, error) for m in group]
+
+    statuses = recipient_statuses(response)
+    results = []
+    for message in group:
+        entry = statuses.get(message.recipient)
+        if entry is None:
+            results.append(Result(message.key, message.recipient, False, 'No status returned for recipient'))
+        else:
+            results.append(Result(message.key, message.recipient, is_sent(entry), entry))
+    return results
+
+
+def dispatch(sms, messages, batch_size=None, max_workers=None, limiter=None):
+    """
+    Send every message and return {key: Result}.
+
+    A send that raises marks all of its recipients as not sent, with the
+    exception as the response; other batches are unaffected. limiter, a
+    TokenBucket, is charged one token per recipient before each send.
+    """
+    batch_size = batch_size or settings.SMS_BATCH_SIZE
+    max_workers = max_workers or settings.SMS_MAX_WORKERS
+
+    results = {}
+    valid = []
+    for message in messages:
+        if E164.match(message.recipient):
+            valid.append(message)
+        else:
+            error = ValueError(f"Invalid phone number: {message.recipient}")
+            results[message.key] = Result(message.key, message.recipient, False, error)
+
+    groups = list(batches(valid, batch_size))
+    if not groups:
+        return results
+
+    def send(text, recipients):
+        if limiter is not None:
+            limiter.acquire(len(recipients))
+        return sms.send(text, recipients)
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(groups))) as pool:
+        futures = {
+            pool.submit(send, text, [m.recipient for m in group]): group
+            for text, group in groups
+        }
+        for future in as_completed(futures):
+            group = futures[future]
+            try:
+                batch = _results(group, response=future.result())
+            except Exception as e:
+                batch = _results(group, error=e)
+            for result in batch:
+                results[result.key] = result
+    return results
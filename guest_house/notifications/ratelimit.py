@@ -0,0 +1,54 @@
+import threading
+import time
+
+from django.conf import settings
+
+
+class TokenBucket:
+    """
+    Allow `rate` messages per second on average, with bursts up to `capacity`.
+
+    acquire(n) blocks until the bucket can cover the send. A send larger than
+    the bucket waits for a full bucket and leaves it in debt, so the long-run
+    rate stays exactly `rate` whatever the batch size.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, n=1):
+        needed = min(n, self.capacity)
+        with self._lock:
+            # holding the lock while sleeping keeps waiting senders in line
+            self._refill()
+            while self._tokens < needed:
+                self._sleep((needed - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= n
+
+
+_limiter = None
+_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Process-wide bucket for SMS_RATE_LIMIT, or None when sending is unlimited"""
+    global _limiter
+    rate, burst = settings.SMS_RATE_LIMIT, settings.SMS_BURST or None
+    if not rate:
+        return None
+    with _lock:
+        if _limiter is None or (_limiter.rate, _limiter.capacity) != (rate, burst or rate):
+            _limiter = TokenBucket(rate, burst)
+    return _limiter
@@ -0,0 +1,23 @@
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+_backends = {}
+_lock = threading.Lock()
+
+
+def get_sms():
+    """The SMS_BACKEND instance, created once per process on first use"""
+    path = settings.SMS_BACKEND
+    with _lock:
+        if path not in _backends:
+            _backends[path] = import_string(path)()
+        return _backends[path]
+
+
+def format_phone_for_sms(phone: str) -> str:
+    """Convert 10-digit Rwandan phone numbers into E.164 format (+250)."""
+    if phone.startswith("07") and len(phone) == 10:
+        return "+250" + phone[1:]
+    return phone  # Assume already in correct format
@@ -0,0 +1,231 @@
+"""
+Notification outbox.
+
+State changes never talk to the SMS provider. They call `enqueue` inside their
+own database transaction, so the Notification rows commit or roll back with the
+reservation or payment they describe. `drain` (the send_notifications command)
+later delivers pending rows in batches through notifications.dispatch and
+marks the accepted ones sent.
+
+A failed row is retried with jittered exponential backoff (`next_attempt_at`)
+until NOTIFICATION_MAX_ATTEMPTS, unless the failure is permanent, such as an
+invalid number; either way it then becomes a dead letter (status "dead") to
+inspect in the admin and requeue with replay_notifications. Sends go through
+the process's token bucket, so a backlog drains at SMS_RATE_LIMIT and no faster.
+
+Each attempt is logged as one JSON line through the "guest_house.notifications"
+logger (see logs.py and settings.LOGGING). The rows themselves are the queryable
+record: `history` answers questions like "all failures for this guest this
+week" from the recipient and reservation indexes.
+
+Any number of drainers can run at once, on one host or many. Each one
+`claim`s a batch by stamping it with its owner name and a lease expiry in a
+conditional UPDATE, which works on SQLite as well as on server databases
+(where SKIP LOCKED additionally keeps claimers off each other's candidates).
+Only the lease holder can mark its rows, and rows whose lease ran out, because
+their drainer died, are claimable again. A notification is therefore marked
+sent exactly once; it is sent twice only if a drainer dies between the
+provider accepting it and the mark, or outlives its lease mid-send.
+"""
+import logging
+import os
+import random
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .db import retry_on_busy
+from .models import Notification
+from .notifications import Message, dispatch, format_phone_for_sms, get_rate_limiter, is_permanent
+
+logger = logging.getLogger("guest_house.notifications")
+
+TEMPLATES = {
+    "reservation_created": "✅ Your reservation {id} has been received. Please make payment to confirm.",
+    "reminder_due": "⏰ Reminder: Your reservation {id} is still pending. Please make payment to confirm.",
+    "cancelled": "❌ Your reservation {id} has been cancelled due to no payment within the allowed time.",
+    "payment_received": "💳 Payment for reservation {id} received. Your reservation is confirmed.",
+}
+
+LABELS = {
+    "reservation_created": "CREATED",
+    "reminder_due": "REMINDER",
+    "cancelled": "CANCELLED",
+    "payment_received": "PAID",
+}
+
+
+def enqueue(kind, reservations):
+    """
+    Queue one `kind` notification per (reservation_id, phone) pair.
+
+    Call inside the transaction that makes the change, so the two commit together.
+    """
+    return Notification.objects.bulk_create([
+        Notification(
+            reservation_id=reservation_id,
+            kind=kind,
+            recipient=format_phone_for_sms(phone),
+            text=TEMPLATES[kind].format(id=reservation_id),
+        )
+        for reservation_id, phone in reservations
+    ])
+
+
+def default_owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claimable(now):
+    return Notification.objects.filter(status="pending").filter(
+        Q(lease_expires_at__isnull=True) | Q(lease_expires_at__lte=now),
+        Q(next_attempt_at__isnull=True) | Q(next_attempt_at__lte=now),
+    )
+
+
+def retry_delay(attempts):
+    """Full-jitter exponential backoff after the given number of failed attempts"""
+    ceiling = min(settings.NOTIFICATION_RETRY_CAP, settings.NOTIFICATION_RETRY_BASE * 2 ** (attempts - 1))
+    return timedelta(seconds=random.uniform(0, ceiling))
+
+
+@retry_on_busy
+def claim(owner, batch_size, after_id=0, lease_seconds=None):
+    """
+    Lease up to batch_size pending notifications with id > after_id to owner.
+
+    Returns the claimed rows in id order; rows another drainer claimed first
+    are simply missing from the batch.
+    """
+    now = timezone.now()
+    expires = now + timedelta(seconds=lease_seconds or settings.NOTIFICATION_LEASE_SECONDS)
+    while True:
+        with transaction.atomic():
+            candidates = claimable(now).filter(id__gt=after_id).order_by("id")
+            if connection.features.has_select_for_update_skip_locked:
+                candidates = candidates.select_for_update(skip_locked=True)
+            ids = list(candidates.values_list("id", flat=True)[:batch_size])
+            if not ids:
+                return []
+            # the lease condition is checked again by the UPDATE itself, so of
+            # two drainers that picked the same candidates only one wins each row
+            claimable(now).filter(pk__in=ids).update(lease_owner=owner, lease_expires_at=expires)
+        claimed = list(
+            Notification.objects.filter(pk__in=ids, lease_owner=owner, lease_expires_at=expires).order_by("id")
+        )
+        if claimed:
+            return claimed
+        after_id = ids[-1]  # another drainer won them all; look further on
+
+
+def drain(sms, stdout, batch_size=100, owner=None, limiter=None):
+    """
+    Deliver every notification that is due once, batch_size rows at a time.
+
+    Returns (sent, failed) counts; failed includes rows moved to the dead letters.
+    """
+    owner = owner or default_owner()
+    limiter = limiter or get_rate_limiter()
+    sent_count = failed_count = 0
+    last_id = 0
+    while True:
+        batch = claim(owner, batch_size, after_id=last_id)
+        if not batch:
+            return sent_count, failed_count
+        last_id = batch[-1].id
+
+        results = dispatch(sms, [Message(n.id, n.text, n.recipient) for n in batch], limiter=limiter)
+        sent, failed, changes = mark(owner, batch, results)
+        sent_count += sent
+        failed_count += failed
+        for notification in batch:
+            log_result(stdout, notification, results[notification.id],
+                       changes.get(notification.id, {}).get("status", "retry"))
+
+
+@retry_on_busy
+def mark(owner, batch, results):
+    """
+    Record a dispatched batch on the rows owner still holds.
+
+    Returns (sent, failed) counts and the field changes of each failed row by id.
+    """
+    held = Notification.objects.filter(lease_owner=owner, status="pending")
+    sent = [n for n in batch if results[n.id].sent]
+    for notification in sent:
+        receipt = results[notification.id].response
+        notification.message_id = str(receipt.get("messageId", ""))
+        notification.cost = str(receipt.get("cost", ""))
+    changes = {n.id: failure(n, results[n.id].response) for n in batch if not results[n.id].sent}
+    with transaction.atomic():
+        # receipts first: marking the rows sent releases the lease they are filtered on
+        held.bulk_update(sent, ["message_id", "cost"])
+        sent_count = held.filter(pk__in=[n.id for n in sent]).update(
+            status="sent", sent_at=timezone.now(), attempts=F("attempts") + 1,
+            lease_owner="", lease_expires_at=None
+        )
+        failed_count = sum(
+            held.filter(pk=pk).update(**fields, lease_owner="", lease_expires_at=None)
+            for pk, fields in changes.items()
+        )
+    return sent_count, failed_count, changes
+
+
+def failure(notification, response):
+    """Field updates for a failed attempt: back off and retry, or dead-letter"""
+    attempts = notification.attempts + 1
+    changes = {"attempts": attempts, "last_response": str(response)}
+    if is_permanent(response) or attempts >= settings.NOTIFICATION_MAX_ATTEMPTS:
+        changes.update(status="dead", next_attempt_at=None)
+    else:
+        changes["next_attempt_at"] = timezone.now() + retry_delay(attempts)
+    return changes
+
+
+def replay(notifications):
+    """Requeue dead letters for immediate delivery; returns how many"""
+    return notifications.filter(status="dead").update(
+        status="pending", attempts=0, next_attempt_at=None, lease_owner="", lease_expires_at=None
+    )
+
+
+def log_result(stdout, notification, result, failed_status):
+    status = "sent" if result.sent else failed_status
+    receipt = result.response if isinstance(result.response, dict) else {}
+    logger.info("sms_%s", status, extra={"data": {
+        "notification_id": notification.id,
+        "reservation_id": notification.reservation_id,
+        "kind": notification.kind,
+        "recipient": result.recipient,
+        "status": status,
+        "attempt": notification.attempts + 1,
+        "cost": receipt.get("cost"),
+        "message_id": receipt.get("messageId"),
+        "error": None if result.sent else str(receipt.get("status") or result.response),
+    }})
+    stdout.write(
+        f"[{LABELS[notification.kind]}] Reservation {notification.reservation_id} -> {status} "
+        f"({result.recipient})"
+    )
+
+
+def history(guest=None, phone=None, since=None, failed=False):
+    """
+    Notifications sent to a guest (by reservation) or a phone number, newest first.
+
+    failed=True keeps only those with at least one failed attempt.
+    """
+    notifications = Notification.objects.all()
+    if guest is not None:
+        notifications = notifications.filter(reservation__guest=guest)
+    if phone is not None:
+        notifications = notifications.filter(recipient=format_phone_for_sms(phone))
+    if since is not None:
+        notifications = notifications.filter(created_at__gte=since)
+    if failed:
+        notifications = notifications.exclude(last_response="")
+    return notifications.order_by("-created_at", "-id")
@@ -0,0 +1,72 @@
+from django.db import connections
+from django.db.models import Max
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+def approximate_count(queryset):
+    """
+    Cheap row estimate for an unfiltered queryset, or None when not available.
+
+    PostgreSQL keeps a planner estimate in pg_class; elsewhere the highest
+    primary key is read from the end of the index. Both ignore deleted rows
+    and in-flight inserts, which is fine for "about N results" displays.
+    """
+    if queryset.query.where:
+        return None
+
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [queryset.model._meta.db_table]
+            )
+            row = cursor.fetchone()
+        if row and row[0] >= 0:
+            return row[0]
+
+    return queryset.aggregate(last=Max('pk'))['last'] or 0
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pagination over an indexed (timestamp, id) ordering.
+
+    Each page is a range scan starting at the cursor, so page 1,000 costs the
+    same as page 1. Clients choose the size with ?page_size= (capped) and can
+    ask for an approximate total with ?count=approx.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'approx':
+            self.count = approximate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        body = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+        if self.count is not None:
+            body['approximate_count'] = self.count
+        body['results'] = data
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['approximate_count'] = {'type': 'integer', 'nullable': True}
+        return response_schema
+
+
+class TransactionPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
+
+
+class ReservationPagination(KeysetPagination):
+    ordering = ('-created_at', '-id')
@@ -0,0 +1,232 @@
+"""
+Stay pricing: seasonal rates, length-of-stay discounts and the price catalogue.
+
+The room cost of a stay is the room's nightly price times the sum of the
+nightly rate multipliers over [check_in, check_out). A RateCalendar turns the
+rate rules into an array of daily multipliers and keeps its prefix sums, so the
+multiplier sum of any stay is two array lookups. Pricing a whole matrix of
+rooms × stays therefore builds one calendar per distinct rule set (usually
+just the shared one), computes one weight per stay, and then costs a single
+multiplication per cell, whatever the length of the stays.
+
+Prices and rules change a few times a day but are read on every quote, so each
+process keeps them in a PriceCatalogue. The post_save/post_delete receivers in
+signals.py drop the copy whenever a Room, Meal, RateRule or StayDiscount
+changes in this process, and PRICE_CATALOGUE_TTL bounds how long an edit made
+by another process can go unseen.
+"""
+import threading
+import time
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import accumulate
+
+from django.conf import settings
+
+ZERO = Decimal('0')
+ONE = Decimal('1')
+CENT = Decimal('0.01')
+
+Rate = namedtuple('Rate', 'room_id start_date end_date weekdays multiplier')
+Snapshot = namedtuple('Snapshot', 'rooms meals rates discounts')
+
+
+def to_decimal(value):
+    # model instances built with float prices keep the float until reloaded
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+def money(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+class RateCalendar:
+    """Prefix sums of the daily rate multipliers between first_day and last_day"""
+
+    def __init__(self, rates, first_day, last_day):
+        self.first_day = first_day
+        days = (last_day - first_day).days
+        factors = [ONE] * days
+
+        for rate in rates:
+            start = 0 if rate.start_date is None else max((rate.start_date - first_day).days, 0)
+            stop = days if rate.end_date is None else min((rate.end_date - first_day).days + 1, days)
+            if start >= stop:
+                continue
+            if rate.weekdays:
+                # one strided slice per weekday instead of testing every date
+                first_weekday = (first_day + timedelta(days=start)).weekday()
+                slices = [slice(start + (weekday - first_weekday) % 7, stop, 7) for weekday in rate.weekdays]
+            else:
+                slices = [slice(start, stop)]
+            for days_slice in slices:
+                factors[days_slice] = [f * rate.multiplier for f in factors[days_slice]]
+
+        self.prefix = [ZERO, *accumulate(factors)]
+
+    def weight(self, check_in, check_out):
+        """Sum of the nightly multipliers over [check_in, check_out)"""
+        return (
+            self.prefix[(check_out - self.first_day).days]
+            - self.prefix[(check_in - self.first_day).days]
+        )
+
+
+def discount_factor(discounts, nights):
+    """1 - the best percentage among the (min_nights, percent) pairs the stay qualifies for"""
+    best = max((percent for min_nights, percent in discounts if min_nights <= nights), default=ZERO)
+    return ONE - best / 100
+
+
+def stay_weights(rates, stays, room_ids):
+    """
+    Rate multiplier sum of every stay, per room.
+
+    Returns {room_id: [weight per stay]}; rooms without rules of their own
+    share one list.
+    """
+    first_day = min(check_in for check_in, _ in stays)
+    last_day = max(check_out for _, check_out in stays)
+    shared_rates = [rate for rate in rates if rate.room_id is None]
+    room_rates = defaultdict(list)
+    for rate in rates:
+        if rate.room_id is not None:
+            room_rates[rate.room_id].append(rate)
+
+    def weights(calendar):
+        return [calendar.weight(check_in, check_out) for check_in, check_out in stays]
+
+    shared = None
+    result = {}
+    for room_id in room_ids:
+        if room_id in room_rates:
+            result[room_id] = weights(RateCalendar(shared_rates + room_rates[room_id], first_day, last_day))
+        else:
+            if shared is None:
+                shared = weights(RateCalendar(shared_rates, first_day, last_day))
+            result[room_id] = shared
+    return result
+
+
+def price_matrix(snapshot, room_prices, stays, meal_price=None):
+    """
+    Total cost of every room for every stay.
+
+    room_prices maps room_id to its nightly price and stays is a list of
+    (check_in, check_out) pairs; returns {room_id: [total per stay]}.
+    """
+    if not stays:
+        return {room_id: [] for room_id in room_prices}
+
+    meal_cost = to_decimal(meal_price) if meal_price is not None else ZERO
+    discounts = [discount_factor(snapshot.discounts, (check_out - check_in).days) for check_in, check_out in stays]
+    weights = stay_weights(snapshot.rates, stays, room_prices)
+
+    return {
+        room_id: [
+            money(to_decimal(price) * weight * discount) + meal_cost
+            for weight, discount in zip(weights[room_id], discounts)
+        ]
+        for room_id, price in room_prices.items()
+    }
+
+
+def price_stay(check_in, check_out, room_id=None, room_price=None, meal_price=None, snapshot=None):
+    """Total cost of one stay, using the catalogue's rate rules"""
+    snapshot = snapshot or catalogue.snapshot()
+    if room_price is None:
+        return to_decimal(meal_price) if meal_price is not None else ZERO
+    return price_matrix(snapshot, {room_id: room_price}, [(check_in, check_out)], meal_price)[room_id][0]
+
+
+class PriceCatalogue:
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._expires_at = 0
+
+    def _load(self):
+        from .models import Room, Meal, RateRule, StayDiscount
+
+        rates = [
+            Rate(room_id, start_date, end_date,
+                 tuple(int(day) for day in weekdays.split(',')) if weekdays else (), multiplier)
+            for room_id, start_date, end_date, weekdays, multiplier in RateRule.objects.values_list(
+                'room_id', 'start_date', 'end_date', 'weekdays', 'multiplier')
+        ]
+        return Snapshot(
+            rooms=dict(Room.objects.values_list('id', 'price_per_night')),
+            meals=dict(Meal.objects.values_list('id', 'price')),
+            rates=rates,
+            discounts=sorted(StayDiscount.objects.values_list('min_nights', 'percent')),
+        )
+
+    def snapshot(self):
+        with self._lock:
+            if self._snapshot is None or time.monotonic() >= self._expires_at:
+                self._snapshot = self._load()
+                ttl = self.ttl if self.ttl is not None else getattr(settings, 'PRICE_CATALOGUE_TTL', 60)
+                self._expires_at = time.monotonic() + ttl
+            return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def room_price(self, room_id):
+        """Nightly base price, or None for an unknown room"""
+        return self.snapshot().rooms.get(room_id)
+
+    def meal_price(self, meal_id):
+        """Meal price, or None for an unknown meal"""
+        return self.snapshot().meals.get(meal_id)
+
+    def quote(self, check_in, check_out, room_id=None, meal_id=None):
+        """
+        Price a stay without touching the database on a warm catalogue.
+
+        Raises KeyError naming the room_id or meal_id that does not exist.
+        """
+        snapshot = self.snapshot()
+        if room_id is not None and room_id not in snapshot.rooms:
+            raise KeyError('room_id')
+        if meal_id is not None and meal_id not in snapshot.meals:
+            raise KeyError('meal_id')
+
+        meal_cost = snapshot.meals[meal_id] if meal_id is not None else ZERO
+        room_cost = ZERO
+        if room_id is not None:
+            room_cost = price_stay(check_in, check_out, room_id, snapshot.rooms[room_id], snapshot=snapshot)
+        return {
+            'room_id': room_id,
+            'meal_id': meal_id,
+            'check_in_date': check_in,
+            'check_out_date': check_out,
+            'nights': (check_out - check_in).days,
+            'room_cost': room_cost,
+            'meal_cost': meal_cost,
+            'total_cost': room_cost + meal_cost,
+        }
+
+    def quote_matrix(self, stays, room_ids=None, meal_id=None):
+        """
+        Price every room in room_ids (all rooms when None) for every stay.
+
+        Raises KeyError naming the room_id or meal_id that does not exist.
+        """
+        snapshot = self.snapshot()
+        if room_ids is None:
+            room_ids = sorted(snapshot.rooms)
+        if any(room_id not in snapshot.rooms for room_id in room_ids):
+            raise KeyError('room_id')
+        if meal_id is not None and meal_id not in snapshot.meals:
+            raise KeyError('meal_id')
+
+        room_prices = {room_id: snapshot.rooms[room_id] for room_id in room_ids}
+        meal_price = snapshot.meals[meal_id] if meal_id is not None else None
+        return price_matrix(snapshot, room_prices, stays, meal_price)
+
+
+catalogue = PriceCatalogue()
@@ -0,0 +1,26 @@
+"""
+In-process replication for SQLite replicas.
+
+`replicate` copies the primary database into every replica file with SQLite's
+online backup API: page by page, consistent as of one moment, while the
+primary keeps serving. It stands in for real replication when developing and
+testing with several SQLite files (see the replicate_database command).
+"""
+import sqlite3
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+def replicate(aliases=None):
+    """Bring each replica up to date with the primary; returns the aliases copied"""
+    aliases = list(settings.DATABASE_REPLICAS if aliases is None else aliases)
+    primary = connections[DEFAULT_DB_ALIAS]
+    primary.ensure_connection()
+    for alias in aliases:
+        target = sqlite3.connect(connections.settings[alias]["NAME"])
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+    return aliases
@@ -0,0 +1,91 @@
+"""
+Read/write split across a primary and its read replicas.
+
+ReplicaRouter sends every write to the primary ("default"). Reads go to a
+replica, one of settings.DATABASE_REPLICAS picked per request, only while a
+request runs through ReplicaRoutingMiddleware, and only if that request is a
+GET/HEAD/OPTIONS that has not written anything and its client has not written
+within REPLICA_STICKY_SECONDS:
+
+- the first write of a request pins the rest of it to the primary, so a view
+  reads back what it just wrote;
+- a response to a request that wrote sets a short-lived signed cookie that
+  keeps the client on the primary for the sticky window, so its next GET sees
+  its own write even if the replicas lag;
+- reads inside a transaction stay on the primary, and so does everything
+  outside a request (management commands, workers).
+
+Adding capacity is adding an entry to DATABASE_REPLICAS (settings.py builds
+the aliases); views are unaware of the split.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+STICKY_COOKIE = "primary_until"
+
+
+class RoutingState:
+    def __init__(self, use_replicas):
+        self.use_replicas = use_replicas
+        self.replica = None
+        self.wrote = False
+
+
+# mutated, never re-set, inside a request: views may run in a copied context
+_state = ContextVar("replica_routing", default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db  # related objects come from where their instance did
+        state = _state.get()
+        if state is None or not state.use_replicas or not settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if state.replica is None:
+            state.replica = random.choice(settings.DATABASE_REPLICAS)
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True
+            state.use_replicas = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # every alias holds the same data
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS  # replicas get the schema by replication
+
+
+class ReplicaRoutingMiddleware:
+    """Route a request's reads to a replica unless it, or its client's recent requests, wrote"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sticky = request.get_signed_cookie(
+            STICKY_COOKIE, default=None, max_age=settings.REPLICA_STICKY_SECONDS
+        ) is not None
+        state = RoutingState(use_replicas=request.method in SAFE_METHODS and not sticky)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+
+        if state.wrote:
+            response.set_signed_cookie(
+                STICKY_COOKIE, "1", max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite="Lax"
+            )
+        return response
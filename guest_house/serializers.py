@@ -1,7 +1,16 @@
+from contextlib import contextmanager
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.core.validators import RegexValidator
-from django.db import transaction
-from .models import Room, Meal, Guest, Reservation, DebitCard, Transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Room, Meal, Guest, Reservation, RoomNight, DebitCard, Transaction
+from . import ledger, outbox
+from .db import retry_on_busy
+from .availability import ORDERING, is_room_available, overlapping_reservations
+from .pricing import catalogue
 
 
 class RoomSerializer(serializers.ModelSerializer):
@@ -10,6 +19,19 @@ class RoomSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
+class AvailabilityQuerySerializer(serializers.Serializer):
+    check_in = serializers.DateField()
+    check_out = serializers.DateField()
+    min_price = serializers.DecimalField(max_digits=9, decimal_places=2, required=False)
+    max_price = serializers.DecimalField(max_digits=9, decimal_places=2, required=False)
+    ordering = serializers.ChoiceField(choices=list(ORDERING), required=False)
+
+    def validate(self, attrs):
+        if attrs['check_out'] <= attrs['check_in']:
+            raise serializers.ValidationError("Check-out date must be after check-in date.")
+        return attrs
+
+
 class MealSerializer(serializers.ModelSerializer):
     class Meta:
         model = Meal
@@ -48,13 +70,25 @@ class DebitCardSerializer(serializers.ModelSerializer):
             'card_number': {'write_only': True},
             'cvc': {'write_only': True}
         }
+        # balances only change through deposits and payments, which the ledger records
+        read_only_fields = ('balance',)
+
+
+class StatementQuerySerializer(serializers.Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField(help_text="Inclusive")
+
+    def validate(self, attrs):
+        if attrs['end'] < attrs['start']:
+            raise serializers.ValidationError("End date must not be before start date.")
+        return attrs
 
 
 class TransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = '__all__'
-        read_only_fields = ('timestamp',)
+        read_only_fields = ('timestamp', 'balance_after')
 
 
 class ReservationSerializer(serializers.ModelSerializer):
@@ -65,6 +99,21 @@ class ReservationSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('total_cost', 'status')
 
+    def update(self, instance, validated_data):
+        # dates or room may change; save() re-claims the nights
+        with nights_or_fail():
+            return super().update(instance, validated_data)
+
+
+@contextmanager
+def nights_or_fail():
+    """Save reservations in a savepoint, turning a room night collision into a validation error"""
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError:
+        raise serializers.ValidationError({"room_id": "This room is already booked for the selected dates."})
+
 
 class ReservationCreateSerializer(serializers.Serializer):
     first_name = serializers.CharField(max_length=50)
@@ -92,23 +141,33 @@ class ReservationCreateSerializer(serializers.Serializer):
             raise serializers.ValidationError("Check-out date must be after check-in date.")
 
         if attrs.get('room_id'):
-            try:
-                room = Room.objects.get(id=attrs['room_id'])
-                if not room.is_available:
-                    raise serializers.ValidationError({"room_id": "This room is currently taken."})
-                attrs['room'] = room
-            except Room.DoesNotExist:
+            room = self._lookup(Room, 'rooms', attrs['room_id'])
+            if room is None:
                 raise serializers.ValidationError({"room_id": "Room not found."})
+            if not room.is_available:
+                raise serializers.ValidationError({"room_id": "This room is currently taken."})
+            # bulk imports check every stay of the batch against each other in one pass
+            if self.context.get('check_availability', True) and not is_room_available(
+                    room, attrs['check_in_date'], attrs['check_out_date']):
+                raise serializers.ValidationError({"room_id": "This room is already booked for the selected dates."})
+            attrs['room'] = room
 
         if attrs.get('meal_id'):
-            try:
-                meal = Meal.objects.get(id=attrs['meal_id'])
-                attrs['meal'] = meal
-            except Meal.DoesNotExist:
+            meal = self._lookup(Meal, 'meals', attrs['meal_id'])
+            if meal is None:
                 raise serializers.ValidationError({"meal_id": "Meal not found."})
+            attrs['meal'] = meal
 
         return attrs
 
+    def _lookup(self, model, context_key, pk):
+        """Use the rows preloaded by a bulk request when present, else query"""
+        preloaded = self.context.get(context_key)
+        if preloaded is not None:
+            return preloaded.get(pk)
+        return model.objects.filter(pk=pk).first()
+
+    @retry_on_busy
     def create(self, validated_data):
         guest_data = {
             'first_name': validated_data['first_name'],
@@ -116,29 +175,239 @@ class ReservationCreateSerializer(serializers.Serializer):
             'email': validated_data['email'],
             'phone': validated_data['phone']
         }
-        guest, _ = Guest.objects.get_or_create(**guest_data)
-
-        reservation_data = {
-            'guest': guest,
-            'check_in_date': validated_data['check_in_date'],
-            'check_out_date': validated_data['check_out_date'],
-            'room': validated_data.get('room'),
-            'meal': validated_data.get('meal')
-        }
-        reservation = Reservation.objects.create(**reservation_data)
 
-        # Mark the room as unavailable if one was booked
-        if reservation.room:
-            reservation.room.is_available = False
-            reservation.room.save()
+        # The nights are claimed in the same transaction as the reservation; a
+        # concurrent booking of the same room and date fails on the unique
+        # constraint and rolls the whole reservation back.
+        with transaction.atomic():
+            guest, _ = Guest.objects.get_or_create(**guest_data)
+
+            reservation_data = {
+                'guest': guest,
+                'check_in_date': validated_data['check_in_date'],
+                'check_out_date': validated_data['check_out_date'],
+                'room': validated_data.get('room'),
+                'meal': validated_data.get('meal')
+            }
+            with nights_or_fail():
+                reservation = Reservation.objects.create(**reservation_data)
+            outbox.enqueue('reservation_created', [(reservation.id, guest.phone)])
 
         return reservation
 
 
+class ReservationBulkSerializer(serializers.Serializer):
+    """
+    Validate and create many reservations with a constant number of queries.
+
+    Rooms, meals, booked nights and guests are each resolved with one IN query
+    for the whole batch; guests, reservations and room nights are then written
+    with bulk_create. Every item is reported as created or failed on its own.
+    """
+    MAX_ITEMS = 1000
+
+    reservations = serializers.ListField(
+        child=serializers.DictField(), allow_empty=False, max_length=MAX_ITEMS
+    )
+
+    def create(self, validated_data):
+        items = validated_data['reservations']
+        results = [None] * len(items)
+        context = {
+            'rooms': Room.objects.in_bulk(self._ids(items, 'room_id')),
+            'meals': Meal.objects.in_bulk(self._ids(items, 'meal_id')),
+            'check_availability': False,
+        }
+
+        valid = []
+        for index, item in enumerate(items):
+            serializer = ReservationCreateSerializer(data=item, context=context)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = self._failed(index, serializer.errors)
+
+        valid = self._claim_nights(valid, results)
+        valid = self._resolve_guests(valid, results)
+
+        reservations = []
+        for index, data in valid:
+            reservation = Reservation(
+                guest=data['guest'],
+                room=data.get('room'),
+                meal=data.get('meal'),
+                check_in_date=data['check_in_date'],
+                check_out_date=data['check_out_date'],
+            )
+            # bulk_create skips save(), so price here
+            reservation.total_cost = reservation.calculate_total_cost()
+            reservations.append(reservation)
+
+        try:
+            with transaction.atomic():
+                # several items may share one new guest
+                new_guests = {id(data['guest']): data['guest'] for _, data in valid if data['guest'].pk is None}
+                Guest.objects.bulk_create(list(new_guests.values()))
+                Reservation.objects.bulk_create(reservations)
+                RoomNight.objects.bulk_create([
+                    RoomNight(room_id=reservation.room_id, reservation=reservation, date=night)
+                    for reservation in reservations if reservation.room_id
+                    for night in reservation.stay_dates()
+                ])
+                outbox.enqueue('reservation_created', [
+                    (reservation.id, reservation.guest.phone) for reservation in reservations
+                ])
+        except IntegrityError:
+            # another request booked one of the nights (or took an email/phone)
+            # after the batch was checked; nothing from the batch was written
+            for index, _ in valid:
+                results[index] = self._failed(index, "The batch conflicted with a concurrent booking; please retry.")
+            return results
+
+        for (index, _), reservation in zip(valid, reservations):
+            results[index] = {
+                "index": index,
+                "status": "created",
+                "reservation_id": reservation.id,
+                "total_cost": reservation.total_cost,
+            }
+        return results
+
+    def _ids(self, items, key):
+        ids = set()
+        for item in items:
+            try:
+                ids.add(int(item[key]))
+            except (KeyError, TypeError, ValueError):
+                pass
+        return ids
+
+    def _failed(self, index, errors):
+        return {"index": index, "status": "failed", "errors": errors}
+
+    def _claim_nights(self, valid, results):
+        """Reject stays that overlap booked nights, an active reservation, or an earlier stay in the batch"""
+        stays = [data for _, data in valid if data.get('room')]
+        if not stays:
+            return valid
+
+        rooms = {data['room'].id for data in stays}
+        start = min(data['check_in_date'] for data in stays)
+        end = max(data['check_out_date'] for data in stays)
+        taken = set(RoomNight.objects.filter(
+            room_id__in=rooms, date__gte=start, date__lt=end,
+        ).values_list('room_id', 'date'))
+        # the same check single bookings make, which also sees reservations missing their nights
+        for room_id, check_in, check_out in overlapping_reservations(start, end, rooms=rooms).values_list(
+                'room_id', 'check_in_date', 'check_out_date'):
+            taken |= {(room_id, night) for night in Reservation(
+                check_in_date=max(check_in, start), check_out_date=min(check_out, end)).stay_dates()}
+
+        accepted = []
+        for index, data in valid:
+            if data.get('room'):
+                nights = {(data['room'].id, night) for night in Reservation(
+                    check_in_date=data['check_in_date'], check_out_date=data['check_out_date']).stay_dates()}
+                if nights & taken:
+                    results[index] = self._failed(index, {"room_id": ["This room is already booked for the selected dates."]})
+                    continue
+                taken |= nights
+            accepted.append((index, data))
+        return accepted
+
+    def _resolve_guests(self, valid, results):
+        """Match each item to an existing guest or a new (unsaved) one"""
+        emails = {data['email'] for _, data in valid}
+        phones = {data['phone'] for _, data in valid}
+        by_email, by_phone = {}, {}
+        for guest in Guest.objects.filter(Q(email__in=emails) | Q(phone__in=phones)):
+            by_email[guest.email] = guest
+            by_phone[guest.phone] = guest
+
+        accepted = []
+        for index, data in valid:
+            guest = by_email.get(data['email']) or by_phone.get(data['phone'])
+            if guest is None:
+                guest = Guest(first_name=data['first_name'], last_name=data['last_name'],
+                              email=data['email'], phone=data['phone'])
+                by_email[guest.email] = by_phone[guest.phone] = guest
+            elif (guest.first_name, guest.last_name, guest.email, guest.phone) != (
+                    data['first_name'], data['last_name'], data['email'], data['phone']):
+                results[index] = self._failed(index, "A different guest already uses this email or phone.")
+                continue
+            accepted.append((index, dict(data, guest=guest)))
+        return accepted
+
+
+class QuoteItemSerializer(serializers.Serializer):
+    room_id = serializers.IntegerField(required=False)
+    meal_id = serializers.IntegerField(required=False)
+    check_in_date = serializers.DateField()
+    check_out_date = serializers.DateField()
+    nights = serializers.IntegerField(read_only=True)
+    room_cost = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    meal_cost = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+    total_cost = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
+
+    def validate(self, attrs):
+        if not attrs.get('room_id') and not attrs.get('meal_id'):
+            raise serializers.ValidationError("At least a room or a meal must be selected.")
+
+        if attrs['check_out_date'] <= attrs['check_in_date']:
+            raise serializers.ValidationError("Check-out date must be after check-in date.")
+
+        try:
+            return catalogue.quote(
+                attrs['check_in_date'], attrs['check_out_date'],
+                room_id=attrs.get('room_id'), meal_id=attrs.get('meal_id')
+            )
+        except KeyError as e:
+            field = e.args[0]
+            raise serializers.ValidationError({field: f"{'Room' if field == 'room_id' else 'Meal'} not found."})
+
+
+class QuoteSerializer(serializers.Serializer):
+    """Price many stays in one call; nothing is booked and nothing is written"""
+    MAX_ITEMS = 500
+
+    items = QuoteItemSerializer(many=True, allow_empty=False, max_length=MAX_ITEMS)
+
+
+class StaySerializer(serializers.Serializer):
+    check_in_date = serializers.DateField()
+    check_out_date = serializers.DateField()
+
+    def validate(self, attrs):
+        if attrs['check_out_date'] <= attrs['check_in_date']:
+            raise serializers.ValidationError("Check-out date must be after check-in date.")
+        return attrs
+
+
+class QuoteMatrixSerializer(serializers.Serializer):
+    """Price every listed room (all rooms by default) for every candidate stay"""
+    MAX_ROOMS = 500
+    MAX_STAYS = 100
+
+    room_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False, max_length=MAX_ROOMS
+    )
+    meal_id = serializers.IntegerField(required=False)
+    stays = StaySerializer(many=True, allow_empty=False, max_length=MAX_STAYS)
+
+    def validate(self, attrs):
+        stays = [(stay['check_in_date'], stay['check_out_date']) for stay in attrs['stays']]
+        try:
+            attrs['matrix'] = catalogue.quote_matrix(stays, attrs.get('room_ids'), attrs.get('meal_id'))
+        except KeyError as e:
+            field = e.args[0]
+            raise serializers.ValidationError({field: f"{'Room' if field == 'room_id' else 'Meal'} not found."})
+        return attrs
+
+
 class PaymentSerializer(serializers.Serializer):
     card_number = serializers.CharField(max_length=20)
     cvc = serializers.CharField(max_length=4)
-    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
     reservation_id = serializers.IntegerField()
 
     def validate(self, attrs):
@@ -149,11 +418,8 @@ class PaymentSerializer(serializers.Serializer):
         except DebitCard.DoesNotExist:
             raise serializers.ValidationError("Invalid or inactive card details.")
 
-        if card.balance < attrs['amount']:
-            raise serializers.ValidationError("Insufficient balance.")
-
         try:
-            reservation = Reservation.objects.get(
+            reservation = Reservation.objects.select_related('guest').get(
                 id=attrs['reservation_id'], status="pending"
             )
         except Reservation.DoesNotExist:
@@ -163,31 +429,30 @@ class PaymentSerializer(serializers.Serializer):
         attrs['reservation'] = reservation
         return attrs
 
+    @retry_on_busy
     def create(self, validated_data):
         card = validated_data['card']
         reservation = validated_data['reservation']
         amount = validated_data['amount']
 
+        # Both updates are conditional, so concurrent payments cannot overdraw
+        # the card or pay the same reservation twice; either failure rolls back.
         with transaction.atomic():
-            card.balance -= amount
-            card.save()
-
-            reservation.status = "paid"
-            reservation.save()
-
-            txn = Transaction.objects.create(
-                debit_card=card,
-                amount=amount,
-                transaction_type='payment',
-                reservation=reservation
-            )
+            if not Reservation.objects.filter(pk=reservation.pk, status="pending").update(
+                status="paid", updated_at=timezone.now()
+            ):
+                raise serializers.ValidationError("Reservation not found or already processed.")
+            txn = ledger.post(card, amount, 'payment', reservation=reservation)
+            if txn is None:
+                raise serializers.ValidationError("Insufficient balance.")
+            outbox.enqueue('payment_received', [(reservation.id, reservation.guest.phone)])
 
         return txn
 
 
 class DepositSerializer(serializers.Serializer):
     card_number = serializers.CharField(max_length=20)
-    amount = serializers.DecimalField(max_digits=10, decimal_places=2)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
 
     def validate(self, attrs):
         try:
@@ -197,17 +462,13 @@ class DepositSerializer(serializers.Serializer):
         except DebitCard.DoesNotExist:
             raise serializers.ValidationError("Invalid or inactive card number.")
 
+    @retry_on_busy
     def create(self, validated_data):
         card = validated_data['card']
         amount = validated_data['amount']
 
-        with transaction.atomic():
-            card.balance += amount
-            card.save()
-            txn = Transaction.objects.create(
-                debit_card=card,
-                amount=amount,
-                transaction_type='deposit'
-            )
+        txn = ledger.post(card, amount, 'deposit')
+        if txn is None:
+            raise serializers.ValidationError("Invalid or inactive card number.")
 
         return txn
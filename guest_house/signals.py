@@ -0,0 +1,39 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import catalogue_cache
+from .models import Room, Meal, RateRule, StayDiscount
+from .pricing import catalogue
+
+
+def now_and_on_commit(invalidate):
+    """
+    Drop cached copies now, so the rest of this transaction reads the change,
+    and again once it commits: until then other connections still read the
+    old rows, and whatever they cached meanwhile would stay until the TTL.
+    """
+    invalidate()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=Meal)
+@receiver(post_delete, sender=Meal)
+@receiver(post_save, sender=RateRule)
+@receiver(post_delete, sender=RateRule)
+@receiver(post_save, sender=StayDiscount)
+@receiver(post_delete, sender=StayDiscount)
+def invalidate_price_catalogue(sender, **kwargs):
+    now_and_on_commit(catalogue.invalidate)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+@receiver(post_save, sender=Meal)
+@receiver(post_delete, sender=Meal)
+def invalidate_catalogue_cache(sender, instance, **kwargs):
+    pk = instance.pk  # a deleted instance loses it before commit
+    now_and_on_commit(lambda: catalogue_cache.invalidate(sender, pk))
@@ -1,8 +1,46 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from io import StringIO
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
 from rest_framework import status
 from datetime import date, timedelta
-from .models import Guest, Room, DebitCard, Reservation, Transaction
+from decimal import Decimal
+from unittest.mock import Mock, patch
+from rest_framework.exceptions import ValidationError
+from django.contrib.auth.models import User
+from . import catalogue_cache, idempotency, ledger, outbox
+from .db import retry_on_busy
+from .logs import BackgroundRotatingHandler
+from .management.commands import reconcile_ledger
+from .management.commands.benchmark_db_writes import in_thread, scratch_database
+from .management.commands.generate_dataset import Command as GenerateDatasetCommand
+from .models import (BalanceSnapshot, Guest, IdempotencyKey, Meal, Notification, RateRule, Room, StayDiscount, DebitCard, Reservation,
+                     RoomNight, Transaction)
+from .availability import overlapping_reservations
+from .expiry import DeadlineScheduler, ReservationWorker, cancel_expired, process_due
+from .notifications import (AfricasTalkingBackend, FakeGateway, FakeGatewayBackend, Message, TokenBucket, dispatch,
+                            get_sms, is_permanent)
+from .outbox import drain
+from .pagination import TransactionPagination
+from .pricing import catalogue
+from .replication import replicate
+from .routers import STICKY_COOKIE, ReplicaRouter, ReplicaRoutingMiddleware
+from .serializers import PaymentSerializer, ReservationCreateSerializer
 
 
 class GuestHouseAPITest(TestCase):
@@ -73,9 +111,9 @@ class GuestHouseAPITest(TestCase):
         reservation_id = response.json().get("reservation_id")
         self.assertIsNotNone(reservation_id)
 
-        # Verify room is no longer available
+        # The room stays bookable for other dates
         self.room.refresh_from_db()
-        self.assertFalse(self.room.is_available)
+        self.assertTrue(self.room.is_available)
 
         # Make payment
         self.client.post("/api/payments/", {
@@ -118,4 +156,1499 @@ class GuestHouseAPITest(TestCase):
         # Assert that the request fails with the correct error
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn("This room is currently taken.", str(response.content))
-        
+
+
+class RoomAvailabilityTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.guest = Guest.objects.create(
+            first_name="Alice",
+            last_name="Doe",
+            email="alice@example.com",
+            phone="+250712345678"
+        )
+        self.cheap = Room.objects.create(name="Room A", price_per_night=30.00)
+        self.dear = Room.objects.create(name="Room B", price_per_night=90.00)
+        self.check_in = date.today() + timedelta(days=10)
+
+        # Room A is booked for 3 nights starting at check_in
+        Reservation.objects.create(
+            guest=self.guest,
+            room=self.cheap,
+            check_in_date=self.check_in,
+            check_out_date=self.check_in + timedelta(days=3)
+        )
+
+    def search(self, check_in, check_out, **params):
+        return self.client.get("/api/rooms/availability/", {
+            "check_in": check_in,
+            "check_out": check_out,
+            **params
+        })
+
+    def test_overlapping_stay_excludes_room(self):
+        response = self.search(self.check_in + timedelta(days=2), self.check_in + timedelta(days=5))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r["id"] for r in response.json()], [self.dear.id])
+
+    def test_adjacent_and_cancelled_stays_do_not_block(self):
+        # check-out day is free for the next guest
+        response = self.search(self.check_in + timedelta(days=3), self.check_in + timedelta(days=4))
+        self.assertEqual([r["id"] for r in response.json()], [self.cheap.id, self.dear.id])
+
+        Reservation.objects.update(status="cancelled")
+        response = self.search(self.check_in, self.check_in + timedelta(days=1), ordering="-price")
+        self.assertEqual([r["id"] for r in response.json()], [self.dear.id, self.cheap.id])
+
+    def test_price_range(self):
+        response = self.search(date.today(), date.today() + timedelta(days=1), max_price="50.00")
+        self.assertEqual([r["id"] for r in response.json()], [self.cheap.id])
+
+    def test_invalid_range(self):
+        response = self.search(self.check_in, self.check_in)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_booking_overlapping_dates_is_rejected(self):
+        response = self.client.post("/api/reservations/", {
+            "first_name": "John",
+            "last_name": "Smith",
+            "email": "john@example.com",
+            "phone": "+250789012345",
+            "room_id": self.cheap.id,
+            "check_in_date": self.check_in + timedelta(days=1),
+            "check_out_date": self.check_in + timedelta(days=2),
+        }, format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("already booked for the selected dates", str(response.content))
+
+
+class RoomNightTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.room = Room.objects.create(name="Room A", price_per_night=50.00)
+        self.check_in = date.today() + timedelta(days=1)
+        self.booking = {
+            "first_name": "John",
+            "last_name": "Smith",
+            "email": "john@example.com",
+            "phone": "+250789012345",
+            "room": self.room,
+            "check_in_date": self.check_in,
+            "check_out_date": self.check_in + timedelta(days=3),
+        }
+
+    def test_booking_claims_each_night(self):
+        reservation = ReservationCreateSerializer().create(self.booking)
+        nights = RoomNight.objects.filter(reservation=reservation).order_by("date")
+        self.assertEqual([n.date for n in nights], reservation.stay_dates())
+
+    def test_colliding_booking_fails_at_insert(self):
+        ReservationCreateSerializer().create(self.booking)
+
+        # Simulates a request that passed validation before the first one committed
+        clash = dict(self.booking, email="jane@example.com", phone="+250789000000",
+                     check_in_date=self.check_in + timedelta(days=2),
+                     check_out_date=self.check_in + timedelta(days=4))
+        with self.assertRaises(ValidationError):
+            ReservationCreateSerializer().create(clash)
+
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.assertFalse(Guest.objects.filter(email="jane@example.com").exists())
+
+    def test_cancel_releases_nights(self):
+        reservation = ReservationCreateSerializer().create(self.booking)
+        Reservation.objects.filter(pk=reservation.pk).cancel()
+
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, "cancelled")
+        self.assertFalse(RoomNight.objects.exists())
+
+        # the nights are free again
+        ReservationCreateSerializer().create(dict(self.booking, email="jane@example.com", phone="+250789000000"))
+        self.assertEqual(RoomNight.objects.count(), 3)
+
+    def nights(self, reservation):
+        return list(reservation.nights.order_by("date").values_list("room_id", "date"))
+
+    def test_orm_saves_keep_nights_in_step(self):
+        guest = Guest.objects.create(first_name="John", last_name="Smith", email="john@example.com",
+                                     phone="+250789012345")
+        reservation = Reservation.objects.create(guest=guest, room=self.room, check_in_date=self.check_in,
+                                                 check_out_date=self.check_in + timedelta(days=2))
+        self.assertEqual(self.nights(reservation), [(self.room.id, night) for night in reservation.stay_dates()])
+
+        reservation.check_out_date = self.check_in + timedelta(days=4)
+        reservation.save()
+        self.assertEqual(len(self.nights(reservation)), 4)
+
+        with self.assertRaises(IntegrityError):
+            Reservation.objects.create(guest=guest, room=self.room, check_in_date=self.check_in + timedelta(days=3),
+                                       check_out_date=self.check_in + timedelta(days=5))
+        self.assertEqual(Reservation.objects.count(), 1)
+
+        reservation.status = "cancelled"
+        reservation.save()
+        self.assertEqual(self.nights(reservation), [])
+
+    def test_admin_edits_move_nights_and_reject_overlaps(self):
+        client = APIClient()
+        client.force_login(User.objects.create_superuser("admin", "admin@example.com", "secret"))
+        reservation = ReservationCreateSerializer().create(self.booking)
+        other = Room.objects.create(name="Room B", price_per_night=60.00)
+
+        def form(**fields):
+            return {
+                "guest": reservation.guest_id, "room": self.room.id, "meal": "",
+                "check_in_date": self.check_in, "check_out_date": self.check_in + timedelta(days=3),
+                "transaction_set-TOTAL_FORMS": 0, "transaction_set-INITIAL_FORMS": 0, **fields,
+            }
+
+        response = client.post(f"/admin/guest_house/reservation/{reservation.id}/change/",
+                               form(room=other.id, check_out_date=self.check_in + timedelta(days=2)))
+        self.assertEqual(response.status_code, status.HTTP_302_FOUND)
+        self.assertEqual(self.nights(reservation), [(other.id, night) for night in reservation.stay_dates()[:2]])
+
+        response = client.post("/admin/guest_house/reservation/add/", form(room=other.id))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertContains(response, "already booked for the selected dates")
+        self.assertEqual(Reservation.objects.count(), 1)
+
+
+class BulkReservationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.rooms = [Room.objects.create(name=f"Room {n}", price_per_night=40.00) for n in range(5)]
+        self.meal = Meal.objects.create(name="Breakfast", price=5.00)
+        self.existing = Guest.objects.create(
+            first_name="Alice", last_name="Doe", email="alice@example.com", phone="+250712345678"
+        )
+        self.check_in = date.today() + timedelta(days=1)
+
+    def payload(self, n, **overrides):
+        item = {
+            "first_name": "Guest",
+            "last_name": "Number",
+            "email": f"guest{n}@example.com",
+            "phone": f"+25078{n:07d}",
+            "room_id": self.rooms[n % len(self.rooms)].id,
+            "meal_id": self.meal.id,
+            "check_in_date": str(self.check_in + timedelta(days=2 * (n // len(self.rooms)))),
+            "check_out_date": str(self.check_in + timedelta(days=2 * (n // len(self.rooms)) + 2)),
+        }
+        item.update(overrides)
+        return item
+
+    def post(self, items):
+        return self.client.post("/api/reservations/bulk/", {"reservations": items}, format="json")
+
+    def test_query_count_does_not_grow_with_batch(self):
+        catalogue.snapshot()  # rate rules are read once per process, not per batch
+        with CaptureQueriesContext(connection) as small:
+            response = self.post([self.payload(n) for n in range(5)])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        Reservation.objects.all().delete()
+        Guest.objects.exclude(pk=self.existing.pk).delete()
+
+        with CaptureQueriesContext(connection) as large:
+            response = self.post([self.payload(n) for n in range(50)])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["created"], 50)
+        self.assertEqual(len(large), len(small))
+
+        reservation = Reservation.objects.get(pk=response.json()["results"][0]["reservation_id"])
+        self.assertEqual(float(reservation.total_cost), 85.00)  # 2 × 40 + 5
+        self.assertEqual(RoomNight.objects.count(), 100)
+
+    def test_per_item_results(self):
+        items = [
+            self.payload(0),
+            self.payload(1, first_name="Alice", last_name="Doe", email="alice@example.com", phone="+250712345678"),
+            self.payload(2, room_id=9999),
+            self.payload(3, room_id=self.rooms[0].id),  # clashes with item 0
+            self.payload(4, email="alice@example.com"),  # email belongs to another guest
+            self.payload(5, check_out_date=str(self.check_in)),
+        ]
+        response = self.post(items)
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        statuses = [r["status"] for r in response.json()["results"]]
+        self.assertEqual(statuses, ["created", "created", "failed", "failed", "failed", "failed"])
+        self.assertEqual(Reservation.objects.filter(guest=self.existing).count(), 1)
+        self.assertEqual(Guest.objects.count(), 2)
+
+    def test_bulk_agrees_with_single_on_reservations_without_nights(self):
+        # e.g. a row written before room nights existed, that the backfill missed
+        Reservation.objects.create(guest=self.existing, room=self.rooms[0], check_in_date=self.check_in,
+                                   check_out_date=self.check_in + timedelta(days=3))
+        RoomNight.objects.all().delete()
+        item = self.payload(0, check_in_date=str(self.check_in + timedelta(days=1)))
+
+        single = self.client.post("/api/reservations/", item, format="json")
+        self.assertEqual(single.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.post([item])
+        self.assertEqual(response.json()["results"][0]["status"], "failed")
+        self.assertIn("already booked", str(response.json()["results"][0]["errors"]))
+        self.assertEqual(Reservation.objects.count(), 1)
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.card = DebitCard.objects.create(
+            cardholder_name="Alice Doe",
+            card_number="1234567812345678",
+            cvc="123",
+            expiration_date="12/30"
+        )
+        self.transactions = [
+            Transaction.objects.create(debit_card=self.card, amount=10, transaction_type="deposit", balance_after=10 * n)
+            for n in range(1, 6)
+        ]
+
+    def test_pages_walk_the_ledger_newest_first(self):
+        seen = []
+        url = "/api/transactions/?page_size=2"
+        while url:
+            body = self.client.get(url).json()
+            self.assertLessEqual(len(body["results"]), 2)
+            seen += [t["id"] for t in body["results"]]
+            url = body["next"]
+
+        self.assertEqual(seen, [t.id for t in reversed(self.transactions)])
+
+    def test_approximate_count_is_opt_in(self):
+        body = self.client.get("/api/transactions/").json()
+        self.assertNotIn("approximate_count", body)
+
+        body = self.client.get("/api/transactions/?count=approx").json()
+        self.assertEqual(body["approximate_count"], self.transactions[-1].id)
+
+    def test_page_size_is_capped(self):
+        with patch.object(TransactionPagination, "max_page_size", 3):
+            body = self.client.get("/api/transactions/?page_size=100000").json()
+        self.assertEqual(len(body["results"]), 3)
+
+
+class QueryBudgetTest(TestCase):
+    """
+    Every read endpoint has a fixed query budget. Each one is measured with a
+    small and a larger data set: the count must fit the budget and must not
+    grow with the number of rows returned (no N+1 lookups).
+    """
+    BUDGETS = {
+        # conditional GET endpoints spend one query on the version check
+        "/api/reservations/": 2,
+        "/api/reservations/{reservation}/": 2,
+        "/api/transactions/": 2,
+        "/api/rooms/": 1,
+        "/api/rooms/availability/?check_in=2030-01-01&check_out=2030-01-05": 1,
+        "/api/meals/": 1,
+        "/api/guests/": 2,
+        "/api/debitcards/": 2,
+        "/admin/guest_house/reservation/": 5,
+        "/admin/guest_house/reservation/{reservation}/change/": 8,
+        "/admin/guest_house/transaction/": 5,
+        "/admin/guest_house/debitcard/": 6,
+    }
+
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = APIClient()
+        self.admin.force_login(User.objects.create_superuser("admin", "admin@example.com", "secret"))
+        self.room = Room.objects.create(name="Room A", price_per_night=50.00)
+        self.meal = Meal.objects.create(name="Breakfast", price=5.00)
+        self.rows = 0
+        self.reservation = None
+
+    def add_rows(self, n):
+        for i in range(self.rows, self.rows + n):
+            guest = Guest.objects.create(
+                first_name="Guest", last_name="Number", email=f"guest{i}@example.com", phone=f"+25078{i:07d}"
+            )
+            card = DebitCard.objects.create(
+                guest=guest, cardholder_name="Guest Number", card_number=f"{i:016d}", expiration_date="12/30"
+            )
+            start = date(2030, 1, 1) + timedelta(days=2 * i)
+            reservation = Reservation.objects.create(
+                guest=guest, room=self.room, meal=self.meal, check_in_date=start, check_out_date=start + timedelta(days=2)
+            )
+            Transaction.objects.create(debit_card=card, amount=10, transaction_type="payment", reservation=reservation,
+                                       balance_after=0)
+            self.reservation = self.reservation or reservation
+        self.rows += n
+
+    def count_queries(self, url):
+        url = url.format(reservation=self.reservation.id)
+        client = self.admin if url.startswith("/admin/") else self.client
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK, url)
+        return len(queries)
+
+    def test_endpoints_stay_within_budget(self):
+        self.add_rows(2)
+        for url in self.BUDGETS:
+            self.count_queries(url)  # warm per-process caches (content types, ...)
+        small = {url: self.count_queries(url) for url in self.BUDGETS}
+
+        self.add_rows(20)
+        for url, budget in self.BUDGETS.items():
+            with self.subTest(url=url):
+                large = self.count_queries(url)
+                self.assertLessEqual(large, budget)
+                self.assertEqual(large, small[url])
+
+
+class QuoteTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.room = Room.objects.create(name="Room A", price_per_night=50.00)
+        self.meal = Meal.objects.create(name="Breakfast", price=5.00)
+        self.check_in = date.today() + timedelta(days=1)
+
+    def quote(self, *items):
+        return self.client.post("/api/quotes/", {"items": list(items)}, format="json")
+
+    def stay(self, nights, **ids):
+        return {
+            "check_in_date": str(self.check_in),
+            "check_out_date": str(self.check_in + timedelta(days=nights)),
+            **ids
+        }
+
+    def test_warm_catalogue_prices_without_queries(self):
+        self.quote(self.stay(1, room_id=self.room.id))
+
+        with self.assertNumQueries(0):
+            response = self.quote(
+                self.stay(2, room_id=self.room.id, meal_id=self.meal.id),
+                self.stay(3, meal_id=self.meal.id),
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        quotes = response.json()["quotes"]
+        self.assertEqual([q["total_cost"] for q in quotes], ["105.00", "5.00"])
+        self.assertEqual(quotes[0]["nights"], 2)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_price_change_invalidates_catalogue(self):
+        self.assertEqual(catalogue.room_price(self.room.id), 50)
+
+        self.room.price_per_night = 80
+        self.room.save()
+
+        response = self.quote(self.stay(1, room_id=self.room.id))
+        self.assertEqual(response.json()["quotes"][0]["total_cost"], "80.00")
+
+    def test_catalogue_is_invalidated_again_on_commit(self):
+        stale = catalogue.snapshot()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.room.price_per_night = 80
+            self.room.save()
+            # another connection, still reading the pre-commit rows, reloads the catalogue
+            catalogue._snapshot = stale
+        self.assertEqual(catalogue.room_price(self.room.id), 50)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(catalogue.room_price(self.room.id), 80)
+
+    def test_unknown_room(self):
+        response = self.quote(self.stay(1, room_id=9999))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Room not found.", str(response.content))
+
+
+class SeasonalPricingTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.room = Room.objects.create(name="Room A", price_per_night=100.00)
+        self.suite = Room.objects.create(name="Suite", price_per_night=200.00)
+        self.meal = Meal.objects.create(name="Breakfast", price=5.00)
+        self.monday = date(2030, 7, 1)
+
+        RateRule.objects.create(name="Weekend", weekdays="4,5", multiplier="1.5")  # Fri & Sat nights
+        RateRule.objects.create(name="Suite high season", room=self.suite, start_date=date(2030, 7, 1),
+                                end_date=date(2030, 7, 31), multiplier="2")
+        StayDiscount.objects.create(min_nights=7, percent=10)
+
+    def test_weekend_nights_and_long_stay_discount(self):
+        guest = Guest.objects.create(first_name="Alice", last_name="Doe", email="alice@example.com",
+                                     phone="+250712345678")
+        # Mon-Mon: 5 weekday nights + Fri and Sat at 1.5, minus 10% for a week
+        week = Reservation.objects.create(guest=guest, room=self.room, meal=self.meal,
+                                          check_in_date=self.monday, check_out_date=self.monday + timedelta(days=7))
+        self.assertEqual(week.total_cost, Decimal("725.00"))  # 800 × 0.9 + 5
+
+        # Thu-Sat the week after: Thursday at base price, Friday at 1.5
+        short = Reservation.objects.create(guest=guest, room=self.room,
+                                           check_in_date=self.monday + timedelta(days=10),
+                                           check_out_date=self.monday + timedelta(days=12))
+        self.assertEqual(short.total_cost, Decimal("250.00"))
+
+    def test_matrix_matches_single_quotes(self):
+        stays = [
+            {"check_in_date": str(self.monday + timedelta(days=d)),
+             "check_out_date": str(self.monday + timedelta(days=d + n))}
+            for d in range(0, 40, 5) for n in (1, 3, 8)
+        ]
+        catalogue.snapshot()
+
+        with self.assertNumQueries(0):
+            response = self.client.post("/api/quotes/matrix/", {"stays": stays, "meal_id": self.meal.id},
+                                        format="json")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rooms = response.json()["rooms"]
+        self.assertEqual([r["room_id"] for r in rooms], [self.room.id, self.suite.id])
+        for row in rooms:
+            for stay, total in zip(stays, row["totals"]):
+                quote = catalogue.quote(date.fromisoformat(stay["check_in_date"]),
+                                        date.fromisoformat(stay["check_out_date"]),
+                                        room_id=row["room_id"], meal_id=self.meal.id)
+                self.assertEqual(Decimal(total), quote["total_cost"])
+
+    def test_suite_season_applies_only_to_suite(self):
+        quote = catalogue.quote(date(2030, 7, 31), date(2030, 8, 2), room_id=self.suite.id)
+        self.assertEqual(quote["room_cost"], Decimal("600.00"))  # Wed 400 (season) + Thu 200
+
+        quote = catalogue.quote(date(2030, 7, 31), date(2030, 8, 2), room_id=self.room.id)
+        self.assertEqual(quote["room_cost"], Decimal("200.00"))
+
+
+class ConditionalBalanceUpdateTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.guest = Guest.objects.create(
+            first_name="Alice", last_name="Doe", email="alice@example.com", phone="+250712345678"
+        )
+        self.room = Room.objects.create(name="Room A", price_per_night=50.00)
+        self.card = DebitCard.objects.create(
+            guest=self.guest, cardholder_name="Alice Doe", card_number="1234567812345678",
+            balance=60.00, cvc="123", expiration_date="12/30"
+        )
+        self.reservation = Reservation.objects.create(
+            guest=self.guest, room=self.room,
+            check_in_date=date.today(), check_out_date=date.today() + timedelta(days=1)
+        )
+
+    def pay(self, amount):
+        return self.client.post("/api/payments/", {
+            "card_number": self.card.card_number,
+            "cvc": self.card.cvc,
+            "amount": amount,
+            "reservation_id": self.reservation.id,
+        }, format="json")
+
+    def test_debit_is_conditional(self):
+        self.assertFalse(DebitCard.objects.debit(self.card.pk, Decimal("60.01")))
+        self.assertTrue(DebitCard.objects.debit(self.card.pk, Decimal("60.00")))
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("0.00"))
+
+    def test_insufficient_balance_changes_nothing(self):
+        response = self.pay(75.00)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("Insufficient balance.", str(response.content))
+        self.card.refresh_from_db()
+        self.reservation.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("60.00"))
+        self.assertEqual(self.reservation.status, "pending")
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_reservation_cannot_be_paid_twice(self):
+        validated = {
+            "card": self.card,
+            "reservation": self.reservation,
+            "amount": Decimal("50.00"),
+        }
+        PaymentSerializer().create(validated)
+        # a second request that passed validation before the first one committed
+        with self.assertRaises(ValidationError):
+            PaymentSerializer().create(validated)
+
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("10.00"))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_deposit_reports_new_balance(self):
+        response = self.client.post("/api/deposits/", {
+            "card_number": self.card.card_number, "amount": 15.50
+        }, format="json")
+        self.assertEqual(response.json()["new_balance"], 75.50)
+
+        response = self.client.post("/api/deposits/", {
+            "card_number": self.card.card_number, "amount": -10
+        }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class LedgerTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.card = DebitCard.objects.create(
+            cardholder_name="Alice Doe", card_number="1234567812345678", cvc="123", expiration_date="12/30"
+        )
+
+    def deposit(self, amount):
+        return ledger.post(self.card, Decimal(amount), "deposit")
+
+    def test_entries_carry_running_balance(self):
+        self.deposit("100.00")
+        self.deposit("20.00")
+        payment = ledger.post(self.card, Decimal("70.00"), "payment")
+
+        self.assertEqual(payment.balance_after, Decimal("50.00"))
+        self.assertEqual(payment.balance_before, Decimal("120.00"))
+        self.assertIsNone(ledger.post(self.card, Decimal("50.01"), "payment"))
+
+        self.card.refresh_from_db()
+        self.assertEqual(ledger.balance(self.card), self.card.balance)
+
+    def test_statement(self):
+        self.deposit("100.00")
+        Transaction.objects.update(timestamp=timezone.now() - timedelta(days=3))
+        self.deposit("30.00")
+        ledger.post(self.card, Decimal("10.00"), "payment")
+
+        today = timezone.localdate()
+        response = self.client.get(f"/api/debitcards/{self.card.id}/statement/", {"start": today, "end": today})
+        body = response.json()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(body["opening_balance"], "100.00")
+        self.assertEqual(body["closing_balance"], "120.00")
+        self.assertEqual([t["balance_after"] for t in body["transactions"]], ["130.00", "120.00"])
+
+    def test_reconcile_and_snapshot(self):
+        self.deposit("100.00")
+        ledger.post(self.card, Decimal("40.00"), "payment")
+
+        call_command("reconcile_ledger", "--snapshot", stdout=StringIO())
+        snapshot = BalanceSnapshot.objects.get()
+        self.assertEqual(snapshot.balance, Decimal("60.00"))
+
+        # the materialised balance drifts away from the ledger
+        DebitCard.objects.filter(pk=self.card.pk).update(balance=Decimal("75.00"))
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("reconcile_ledger", stdout=out)
+        self.assertIn("ledger ends at 60.00", out.getvalue())
+
+        # history rewritten behind the snapshot
+        DebitCard.objects.filter(pk=self.card.pk).update(balance=Decimal("65.00"))
+        Transaction.objects.filter(transaction_type="payment").update(amount=Decimal("35.00"), balance_after=Decimal("65.00"))
+        out = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("reconcile_ledger", stdout=out)
+        self.assertIn("snapshot says 60.00", out.getvalue())
+
+    def test_payments_during_reconcile_are_not_mismatches(self):
+        self.deposit("100.00")
+        group_by_card = reconcile_ledger.group_by_card
+        paid = []
+
+        def payment_commits_meanwhile(rows):
+            if not paid:
+                paid.append(ledger.post(self.card, Decimal("40.00"), "payment"))
+            return group_by_card(rows)
+
+        out = StringIO()
+        with patch.object(reconcile_ledger, "group_by_card", payment_commits_meanwhile):
+            call_command("reconcile_ledger", "--snapshot", stdout=out)
+        self.assertIn("1 cards changed during the check", out.getvalue())
+        self.assertIn("found 0 problems", out.getvalue())
+        self.assertFalse(BalanceSnapshot.objects.exists())
+
+
+class FakeSMS:
+    """Local stand-in for the Africa's Talking SMS gateway"""
+
+    def __init__(self, rejected=(), delay=0, failure=("InvalidPhoneNumber", 403)):
+        self.rejected = set(rejected)
+        self.delay = delay
+        self.failure = failure
+        self.sent = []
+        self.lock = threading.Lock()
+        self.in_flight = self.max_in_flight = 0
+
+    def send(self, text, recipients):
+        with self.lock:
+            self.sent.append((text, recipients))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        return {"SMSMessageData": {"Message": f"Sent to {len(recipients)}", "Recipients": [
+            {"number": number, "status": self.failure[0], "statusCode": self.failure[1]} if number in self.rejected
+            else {"number": number, "status": "Success", "statusCode": 101, "messageId": f"ATXid_{i}"}
+            for i, number in enumerate(recipients)
+        ]}}
+
+
+class SMSDispatchTest(TestCase):
+    def test_identical_texts_share_a_send(self):
+        sms = FakeSMS(rejected={"+250780000002"})
+        messages = [Message(i, "Hello", f"+25078000000{i}") for i in range(5)]
+        messages.append(Message(9, "Bye", "+250780000009"))
+
+        results = dispatch(sms, messages, batch_size=3)
+
+        self.assertEqual(sorted(len(recipients) for _, recipients in sms.sent), [1, 2, 3])
+        self.assertEqual(sorted(k for k, r in results.items() if r.sent), [0, 1, 3, 4, 9])
+        self.assertEqual(results[2].response["status"], "InvalidPhoneNumber")
+
+    def test_sends_run_concurrently(self):
+        sms = FakeSMS(delay=0.05)
+        messages = [Message(i, f"Reservation {i}", "+250780000000") for i in range(8)]
+
+        results = dispatch(sms, messages, max_workers=4)
+
+        self.assertEqual(len(results), 8)
+        self.assertGreater(sms.max_in_flight, 1)
+        self.assertLessEqual(sms.max_in_flight, 4)
+
+    def test_failed_send_marks_its_recipients(self):
+        class BrokenSMS:
+            def send(self, text, recipients):
+                raise ConnectionError("gateway down")
+
+        results = dispatch(BrokenSMS(), [Message(1, "Hello", "+250780000001")])
+        self.assertFalse(results[1].sent)
+        self.assertIsInstance(results[1].response, ConnectionError)
+
+
+class SMSBackendTest(TestCase):
+    def test_fake_gateway_over_http(self):
+        gateway = FakeGateway().start()
+        self.addCleanup(gateway.stop)
+        messages = [Message(1, "Hello", "+250780000001"), Message(2, "Hello", "078000")]
+
+        results = dispatch(FakeGatewayBackend(gateway=gateway), messages)
+
+        self.assertTrue(results[1].sent)
+        self.assertTrue(results[1].response["messageId"].startswith("ATXid_"))
+        self.assertFalse(results[2].sent)
+        self.assertEqual(gateway.messages, 1)  # the malformed number never left the process
+
+    def test_fake_gateway_errors(self):
+        gateway = FakeGateway(error_rate=1.0).start()
+        self.addCleanup(gateway.stop)
+
+        results = dispatch(FakeGatewayBackend(gateway=gateway), [Message(1, "Hello", "+250780000001")])
+        self.assertFalse(results[1].sent)
+        self.assertFalse(is_permanent(results[1].response))
+
+    def test_configured_backend(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "sms.jsonl")
+        with override_settings(SMS_BACKEND="guest_house.notifications.backends.FileBackend", SMS_FILE_PATH=path):
+            self.assertIs(get_sms(), get_sms())
+            results = dispatch(get_sms(), [Message(1, "Hello", "+250780000001")])
+        self.assertTrue(results[1].sent)
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(json.loads(f.readline())["to"], ["+250780000001"])
+
+    @override_settings(AT_API_KEY="")
+    def test_africas_talking_needs_a_key_only_to_send(self):
+        backend = AfricasTalkingBackend()
+        with self.assertRaises(ImproperlyConfigured):
+            backend.send("Hello", ["+250780000001"])
+
+
+class ReservationWorkerTest(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(name="Room A", price_per_night=50.00)
+        self.guest = Guest.objects.create(first_name="John", last_name="Smith",
+                                          email="john@example.com", phone="0789012345")
+
+    def reserve(self, age=timedelta(0)):
+        # back to back, since the room nights forbid overlapping stays
+        check_in = date.today() + timedelta(days=1 + 2 * Reservation.objects.count())
+        reservation = Reservation.objects.create(guest=self.guest, room=self.room, check_in_date=check_in,
+                                                 check_out_date=check_in + timedelta(days=2))
+        Reservation.objects.filter(pk=reservation.pk).update(created_at=timezone.now() - age)
+        reservation.refresh_from_db()
+        return reservation
+
+    def test_scheduler_orders_deadlines(self):
+        scheduler = DeadlineScheduler()
+        now = timezone.now()
+        scheduler.schedule(1, now)
+        scheduler.schedule(2, now - timedelta(minutes=1), reminder_sent=True)
+
+        self.assertEqual(scheduler.next_due(), now + Reservation.REMINDER_AFTER)
+        self.assertEqual(scheduler.pop_due(now + Reservation.CANCEL_AFTER - timedelta(seconds=1)), [1, 2])
+        self.assertEqual(scheduler.pop_due(now + Reservation.CANCEL_AFTER), [1])
+        self.assertEqual(len(scheduler), 0)
+
+    def test_poll_picks_up_new_reservations(self):
+        old = self.reserve()
+        scheduler = DeadlineScheduler()
+        scheduler.load()
+        self.assertEqual(len(scheduler), 2)
+
+        new = self.reserve()
+        self.assertEqual(scheduler.poll(), 1)
+        self.assertEqual(scheduler.last_seen_id, new.id)
+        self.assertEqual(scheduler.poll(), 0)
+        self.assertEqual(scheduler.pop_due(old.created_at + Reservation.REMINDER_AFTER), [old.id])
+
+    def test_worker_reminds_then_cancels(self):
+        worker = ReservationWorker(StringIO(), sweep_interval=3600)
+        reservation = self.reserve(age=Reservation.REMINDER_AFTER)
+        worker.start()
+
+        self.assertLessEqual(worker.tick(), worker.poll_interval)
+        reservation.refresh_from_db()
+        self.assertTrue(reservation.reminder_sent)
+        self.assertEqual(reservation.notifications.get().recipient, "+250789012345")
+
+        # nothing is due before the cancellation deadline
+        worker.tick(reservation.created_at + Reservation.CANCEL_AFTER - timedelta(seconds=1))
+        self.assertEqual(reservation.notifications.count(), 1)
+
+        worker.tick(reservation.created_at + Reservation.CANCEL_AFTER)
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, "cancelled")
+        self.assertEqual(
+            list(reservation.notifications.order_by("id").values_list("kind", flat=True)),
+            ["reminder_due", "cancelled"]
+        )
+
+    def test_transitions_are_set_based(self):
+        def expire(count):
+            Reservation.objects.all().delete()
+            for _ in range(count):
+                self.reserve(age=Reservation.CANCEL_AFTER)
+            with CaptureQueriesContext(connection) as remind:
+                process_due(timezone.now(), StringIO())
+            with CaptureQueriesContext(connection) as cancel:
+                process_due(timezone.now(), StringIO())
+            return len(remind), len(cancel)
+
+        self.assertEqual(expire(2), expire(20))
+        self.assertEqual(Reservation.objects.due_for_cancel(timezone.now()).count(), 0)
+        self.assertEqual(Reservation.objects.filter(status="cancelled").count(), 20)
+
+    def test_cancel_in_chunks(self):
+        for _ in range(5):
+            self.reserve(age=Reservation.CANCEL_AFTER)
+        Reservation.objects.update(reminder_sent=True)
+
+        cancel_expired(timezone.now(), StringIO(), chunk_size=2)
+
+        self.assertEqual(Reservation.objects.filter(status="cancelled").count(), 5)
+        self.assertEqual(Notification.objects.filter(kind="cancelled").count(), 5)
+
+
+@override_settings(SMS_RATE_LIMIT=0)
+@patch("guest_house.outbox.logger", Mock())
+class OutboxTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.room = Room.objects.create(name="Room A", price_per_night=50.00)
+        self.check_in = date.today() + timedelta(days=1)
+        self.booking = {
+            "first_name": "John",
+            "last_name": "Smith",
+            "email": "john@example.com",
+            "phone": "0789012345",
+            "room": self.room,
+            "check_in_date": self.check_in,
+            "check_out_date": self.check_in + timedelta(days=2),
+        }
+
+    def test_notifications_commit_with_the_change(self):
+        reservation = ReservationCreateSerializer().create(self.booking)
+        self.assertEqual(reservation.notifications.get().kind, "reservation_created")
+
+        # the clashing booking rolls back, and its notification with it
+        with self.assertRaises(ValidationError):
+            ReservationCreateSerializer().create(dict(self.booking, email="jane@example.com", phone="0789000000"))
+        self.assertEqual(Notification.objects.count(), 1)
+
+        card = DebitCard.objects.create(guest=reservation.guest, cardholder_name="John Smith",
+                                        card_number="4000000000000001", balance=Decimal("500.00"),
+                                        cvc="123", expiration_date="12/30")
+        serializer = PaymentSerializer(data={"card_number": card.card_number, "cvc": "123",
+                                             "amount": "100.00", "reservation_id": reservation.id})
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        self.assertEqual(reservation.notifications.latest("id").kind, "payment_received")
+
+    def test_drain_delivers_and_backs_off(self):
+        ReservationCreateSerializer().create(self.booking)
+        ReservationCreateSerializer().create(dict(
+            self.booking, email="jane@example.com", phone="0789000000",
+            check_in_date=self.check_in + timedelta(days=5), check_out_date=self.check_in + timedelta(days=6)
+        ))
+        sms = FakeSMS(rejected={"+250789000000"}, failure=("InternalServerError", 500))
+
+        self.assertEqual(drain(sms, StringIO(), batch_size=1), (1, 1))
+        self.assertEqual(Notification.objects.filter(status="sent").count(), 1)
+        failed = Notification.objects.get(status="pending")
+        self.assertEqual(failed.attempts, 1)
+        self.assertIn("InternalServerError", failed.last_response)
+        self.assertIsNotNone(failed.next_attempt_at)
+
+        # not retried before its backoff runs out, and sent rows are never sent again
+        self.assertEqual(drain(sms, StringIO()), (0, 0))
+        Notification.objects.update(next_attempt_at=timezone.now())
+        sms.rejected.clear()
+        self.assertEqual(drain(sms, StringIO()), (1, 0))
+        self.assertEqual(len(sms.sent), 3)
+        self.assertFalse(Notification.objects.filter(status="pending").exists())
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_dead_letters_and_replay(self):
+        outbox.enqueue("reminder_due", [(None, "078828557"), (None, "+250788000001"), (None, "+250788000002")])
+        sms = FakeSMS(rejected={"+250788000001"}, failure=("InternalServerError", 500))
+
+        # the malformed number is dead-lettered without a call, the rejected one after its last attempt
+        drain(sms, StringIO())
+        Notification.objects.update(next_attempt_at=None)
+        drain(sms, StringIO())
+        self.assertEqual(sorted(r for _, recipients in sms.sent for r in recipients),
+                         ["+250788000001", "+250788000001", "+250788000002"])
+        dead = Notification.objects.filter(status="dead").order_by("id")
+        self.assertEqual([(n.recipient, n.attempts) for n in dead], [("078828557", 1), ("+250788000001", 2)])
+        self.assertIn("Invalid phone number", dead[0].last_response)
+
+        out = StringIO()
+        call_command("replay_notifications", "--recipient", "+250788000001", stdout=out)
+        self.assertIn("Requeued 1", out.getvalue())
+        sms.rejected.clear()
+        self.assertEqual(drain(sms, StringIO()), (1, 0))
+
+    def test_token_bucket_holds_the_rate(self):
+        clock = [0.0]
+        bucket = TokenBucket(rate=10, capacity=5, clock=lambda: clock[0],
+                             sleep=lambda seconds: clock.__setitem__(0, clock[0] + seconds))
+
+        for _ in range(5):
+            bucket.acquire()
+        self.assertEqual(clock[0], 0)  # the burst is free
+
+        # a send larger than the bucket waits for a full one and the next send pays off the rest
+        bucket.acquire(20)
+        bucket.acquire(10)
+        bucket.acquire(1)
+        self.assertAlmostEqual(clock[0], 3.1)  # 31 messages at 10/s after the burst
+
+    def test_leases_keep_drainers_apart(self):
+        reservation = ReservationCreateSerializer().create(self.booking)
+        outbox.enqueue("reminder_due", [(reservation.id, "0789012345")])
+
+        first = outbox.claim("worker-a", batch_size=10)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(outbox.claim("worker-b", batch_size=10), [])
+
+        # worker-a dies; once its lease runs out worker-b takes over
+        Notification.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        sms = FakeSMS()
+        self.assertEqual(drain(sms, StringIO(), owner="worker-b"), (2, 0))
+
+        # the stale holder can no longer mark the rows
+        held = Notification.objects.filter(lease_owner="worker-a", status="pending")
+        self.assertEqual(held.update(status="sent"), 0)
+        self.assertEqual(Notification.objects.filter(status="sent", attempts=1).count(), 2)
+
+    def test_interleaved_drainers_send_each_notification_once(self):
+        outbox.enqueue("reminder_due", [(None, f"+2507800000{i:02d}") for i in range(30)])
+        sms = FakeSMS()
+
+        a = outbox.claim("worker-a", batch_size=4)
+        b = outbox.claim("worker-b", batch_size=4)
+        self.assertFalse({n.id for n in a} & {n.id for n in b})
+
+        # worker-c drains everything else and leaves the leased rows alone
+        self.assertEqual(drain(sms, StringIO(), batch_size=5, owner="worker-c"), (22, 0))
+        self.assertEqual(Notification.objects.filter(status="pending").count(), 8)
+        recipients = [r for _, batch in sms.sent for r in batch]
+        self.assertEqual(len(recipients), len(set(recipients)))
+
+    def test_stale_drainer_leaves_the_receipts_alone(self):
+        outbox.enqueue("reminder_due", [(None, "+250780000001")])
+        [stale] = outbox.claim("worker-a", batch_size=10)
+        Notification.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(drain(FakeSMS(), StringIO(), owner="worker-b"), (1, 0))
+        receipt = Notification.objects.values_list("message_id", flat=True).get()
+
+        # worker-a comes back from a slow send with a receipt of its own
+        results = {stale.id: Mock(sent=True, response={"messageId": "ATXid_stale", "cost": "RWF 1"})}
+        self.assertEqual(outbox.mark("worker-a", [stale], results), (0, 0, {}))
+        self.assertEqual(Notification.objects.values_list("message_id", flat=True).get(), receipt)
+
+    @override_settings(SMS_RATE_LIMIT=0)
+    def test_concurrent_drainers_send_each_notification_once(self):
+        for profile in ("development", "production"):
+            with self.subTest(profile=profile), tempfile.TemporaryDirectory() as directory:
+                with scratch_database(profile, os.path.join(directory, "outbox.sqlite3")):
+                    sms, counts, rows = self.drain_concurrently(drainers=2, notifications=60)
+                recipients = [r for _, batch in sms.sent for r in batch]
+                self.assertEqual(len(recipients), 60)
+                self.assertEqual(len(set(recipients)), 60)
+                self.assertEqual(sum(sent for sent, _ in counts), 60)
+                self.assertEqual({status for status, _ in rows}, {"sent"})
+                self.assertTrue(all(message_id.startswith("ATXid_") for _, message_id in rows))
+
+    def drain_concurrently(self, drainers, notifications):
+        """Drain a scratch outbox from several threads at once; returns the gateway, counts and rows"""
+        def prepare():
+            call_command("migrate", verbosity=0, interactive=False)
+            outbox.enqueue("reminder_due", [(None, f"+2507800{n:05d}") for n in range(notifications)])
+
+        def drainer(owner):
+            try:
+                counts.append(drain(sms, StringIO(), batch_size=5, owner=owner))
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connections.close_all()
+
+        in_thread(prepare)
+        sms, counts, errors = FakeSMS(delay=0.002), [], []
+        threads = [threading.Thread(target=drainer, args=(f"worker-{n}",)) for n in range(drainers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return sms, counts, in_thread(lambda: list(Notification.objects.values_list("status", "message_id")))
+
+    def test_deliveries_are_logged_and_queryable(self):
+        reservation = ReservationCreateSerializer().create(self.booking)
+        outbox.enqueue("reminder_due", [(reservation.id, "0789012345")])
+        sms = FakeSMS(rejected={"+250789012345"}, failure=("InternalServerError", 500))
+
+        with patch("guest_house.outbox.logger") as log:
+            drain(sms, StringIO())
+        entry = log.info.call_args.kwargs["extra"]["data"]
+        self.assertEqual((entry["reservation_id"], entry["status"], entry["error"]),
+                         (reservation.id, "retry", "InternalServerError"))
+
+        Notification.objects.update(next_attempt_at=None)
+        sms.rejected.clear()
+        drain(sms, StringIO())
+        self.assertTrue(Notification.objects.get(kind="reminder_due").message_id.startswith("ATXid_"))
+
+        week_ago = timezone.now() - timedelta(days=7)
+        self.assertEqual(outbox.history(guest=reservation.guest, since=week_ago).count(), 2)
+        self.assertEqual(
+            list(outbox.history(phone="0789012345", since=week_ago, failed=True).values_list("kind", flat=True)),
+            ["reminder_due", "reservation_created"]
+        )
+
+
+class StructuredLogTest(TestCase):
+    def test_json_lines_rotate_by_size(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "notifications.log.jsonl")
+        handler = BackgroundRotatingHandler(path, max_bytes=300, backup_count=2)
+        log = logging.getLogger("guest_house.tests.structured")
+        log.addHandler(handler)
+        log.setLevel(logging.INFO)
+        log.propagate = False
+        self.addCleanup(log.removeHandler, handler)
+
+        for i in range(10):
+            log.info("sms_sent", extra={"data": {"reservation_id": i, "recipient": "+250789012345"}})
+        handler.stop()
+
+        with open(path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(entries[-1]["reservation_id"], 9)
+        self.assertEqual(entries[-1]["event"], "sms_sent")
+        self.assertTrue(os.path.exists(path + ".1"))
+
+
+class IdempotencyTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        idempotency.cache.clear()
+        self.guest = Guest.objects.create(first_name="Alice", last_name="Doe",
+                                          email="alice@example.com", phone="+250788123456")
+        self.card = DebitCard.objects.create(guest=self.guest, cardholder_name="Alice Doe",
+                                             card_number="1234567812345678", balance=0, cvc="123",
+                                             expiration_date="12/30")
+
+    def deposit(self, key, amount="100.00"):
+        return self.client.post("/api/deposits/", {"card_number": self.card.card_number, "amount": amount},
+                                format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_without_crediting_twice(self):
+        first = self.deposit("deposit-1")
+        with self.assertNumQueries(0):
+            retry = self.deposit("deposit-1")
+
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("100.00"))
+        self.assertEqual(Transaction.objects.count(), 1)
+
+        # another worker without the cached copy replays from the table
+        idempotency.cache.clear()
+        self.assertEqual(self.deposit("deposit-1").json(), first.json())
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_key_reused_for_another_request(self):
+        self.deposit("deposit-1")
+        self.assertEqual(self.deposit("deposit-1", amount="5.00").status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+    def test_rejections_are_replayed(self):
+        response = self.client.post("/api/payments/", {
+            "card_number": self.card.card_number, "cvc": "000", "amount": "10.00", "reservation_id": 1
+        }, format="json", HTTP_IDEMPOTENCY_KEY="payment-1")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(IdempotencyKey.objects.get(key="payment-1").status_code, 400)
+
+    @override_settings(IDEMPOTENCY_WAIT=0.1)
+    def test_duplicate_waits_for_the_original(self):
+        fingerprint = idempotency.request_hash({"card_number": self.card.card_number, "amount": "100.00"})
+        IdempotencyKey.objects.create(scope="deposits", key="deposit-1", request_hash=fingerprint,
+                                      owner="original", lease_expires_at=timezone.now() + timedelta(minutes=5),
+                                      expires_at=timezone.now() + timedelta(hours=1))
+
+        # the original is still running, long after the wait: it keeps its claim
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(self.deposit("deposit-1").status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+        # once its lease has run out it was abandoned, and is taken over
+        IdempotencyKey.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.deposit("deposit-1").status_code, status.HTTP_200_OK)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_original_that_lost_its_claim_rolls_back(self):
+        post = ledger.post
+
+        def taken_over_meanwhile(*args, **kwargs):
+            txn = post(*args, **kwargs)
+            IdempotencyKey.objects.update(owner="retry")
+            return txn
+
+        with patch("guest_house.ledger.post", taken_over_meanwhile):
+            response = self.deposit("deposit-1")
+
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(Transaction.objects.count(), 0)
+        self.card.refresh_from_db()
+        self.assertEqual(self.card.balance, Decimal("0.00"))
+        self.assertIsNone(IdempotencyKey.objects.get(key="deposit-1").status_code)
+
+    def test_ttl_cache_is_bounded(self):
+        clock = [0]
+        cache = idempotency.TTLCache(maxsize=2, ttl=10, clock=lambda: clock[0])
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)  # evicts b, the least recently used
+        self.assertEqual((cache.get("a"), cache.get("b"), cache.get("c")), (1, None, 3))
+
+        clock[0] = 10
+        self.assertIsNone(cache.get("a"))
+
+
+class CatalogueCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        catalogue_cache.get_cache().clear()
+        self.room = Room.objects.create(name="Room A", price_per_night=50.00)
+        Meal.objects.create(name="Breakfast", price=10.00)
+
+    def test_reads_are_served_from_the_cache(self):
+        first = self.client.get("/api/rooms/")
+        self.client.get(f"/api/rooms/{self.room.id}/")
+        with self.assertNumQueries(0):
+            again = self.client.get("/api/rooms/")
+            detail = self.client.get(f"/api/rooms/{self.room.id}/")
+        self.assertEqual(again.content, first.content)
+        self.assertEqual(again["Content-Type"], first["Content-Type"])
+        self.assertEqual(detail.json()["name"], "Room A")
+
+    def test_changes_invalidate_their_entries(self):
+        self.client.get("/api/rooms/")
+        self.client.get(f"/api/rooms/{self.room.id}/")
+        other = Room.objects.create(name="Room B", price_per_night=80.00)
+        self.client.get(f"/api/rooms/{other.id}/")
+
+        self.room.name = "Garden Room"
+        self.room.save()
+        self.assertEqual([r["name"] for r in self.client.get("/api/rooms/").json()], ["Garden Room", "Room B"])
+        self.assertEqual(self.client.get(f"/api/rooms/{self.room.id}/").json()["name"], "Garden Room")
+        with self.assertNumQueries(0):
+            self.client.get(f"/api/rooms/{other.id}/")  # untouched entries stay cached
+
+        self.room.delete()
+        self.assertEqual(self.client.get(f"/api/rooms/{self.room.id}/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_entries_refilled_before_commit_are_dropped(self):
+        url = f"/api/rooms/{self.room.id}/"
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.room.name = "Garden Room"
+            self.room.save()
+            # a concurrent GET, still reading the pre-commit row, fills the cache again
+            catalogue_cache.store(catalogue_cache.detail_key(Room, self.room.id),
+                                  json.dumps({"id": self.room.id, "name": "Room A"}).encode(), "application/json")
+        self.assertEqual(self.client.get(url).json()["name"], "Room A")
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(self.client.get(url).json()["name"], "Garden Room")
+
+    def test_non_canonical_pk_is_not_cached(self):
+        self.client.get(f"/api/rooms/0{self.room.id}/")
+        self.room.name = "Garden Room"
+        self.room.save()
+        self.assertEqual(self.client.get(f"/api/rooms/0{self.room.id}/").json()["name"], "Garden Room")
+        self.assertEqual(self.client.get(f"/api/rooms/{self.room.id}/").json()["name"], "Garden Room")
+
+    def test_warm(self):
+        expected = self.client.get("/api/meals/").content
+        catalogue_cache.get_cache().clear()
+
+        catalogue_cache.warm()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get("/api/meals/").content, expected)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.guest = Guest.objects.create(
+            first_name="Alice", last_name="Doe", email="alice@example.com", phone="+250712345678"
+        )
+        self.room = Room.objects.create(name="Room A", price_per_night=50.00)
+        self.card = DebitCard.objects.create(
+            guest=self.guest, cardholder_name="Alice Doe", card_number="1234567812345678",
+            balance=100.00, cvc="123", expiration_date="12/30"
+        )
+        self.reservation = Reservation.objects.create(
+            guest=self.guest, room=self.room,
+            check_in_date=date.today(), check_out_date=date.today() + timedelta(days=1)
+        )
+        self.url = f"/api/reservations/{self.reservation.id}/"
+
+    def test_unchanged_reservation_is_not_modified(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+
+        with self.assertNumQueries(1):
+            again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(again.content, b"")
+
+        again = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get("/api/reservations/999/", HTTP_IF_NONE_MATCH="*").status_code,
+                         status.HTTP_404_NOT_FOUND)
+
+    def test_writes_change_the_etag(self):
+        etags = [self.client.get(self.url)["ETag"]]
+
+        response = self.client.post("/api/payments/", {
+            "card_number": self.card.card_number, "cvc": self.card.cvc,
+            "amount": 50.00, "reservation_id": self.reservation.id,
+        }, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["status"], "paid")
+        etags.append(response["ETag"])
+
+        self.client.patch(f"/api/guests/{self.guest.id}/", {"first_name": "Alicia"}, format="json")
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual(response.json()["guest"]["first_name"], "Alicia")  # nested, so it counts
+        etags.append(response["ETag"])
+
+        Reservation.objects.filter(pk=self.reservation.pk).cancel()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etags[-1])
+        self.assertEqual(response.json()["status"], "cancelled")
+        etags.append(response["ETag"])
+        self.assertEqual(len(set(etags)), 4)
+
+    def test_collection_etags(self):
+        reservations = self.client.get("/api/reservations/")
+        transactions = self.client.get("/api/transactions/")
+        self.assertEqual(self.client.get("/api/reservations/", HTTP_IF_NONE_MATCH=reservations["ETag"]).status_code,
+                         status.HTTP_304_NOT_MODIFIED)
+        self.assertNotEqual(self.client.get("/api/reservations/?page_size=1")["ETag"], reservations["ETag"])
+
+        Reservation.objects.create(
+            guest=self.guest, room=self.room,
+            check_in_date=date.today() + timedelta(days=3), check_out_date=date.today() + timedelta(days=4)
+        )
+        ledger.post(self.card, Decimal("10.00"), "deposit")
+        for url, previous in (("/api/reservations/", reservations), ("/api/transactions/", transactions)):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=previous["ETag"]).status_code,
+                             status.HTTP_200_OK)
+
+
+@override_settings(DB_BUSY_RETRIES=2)
+@patch("guest_house.db.time.sleep", Mock())
+class DatabaseProfileTest(TestCase):
+    @patch("guest_house.db.connection.in_atomic_block", False)
+    def test_busy_writes_are_retried_a_bounded_number_of_times(self):
+        write = Mock(side_effect=[OperationalError("database is locked"), "done"])
+        self.assertEqual(retry_on_busy(write)(), "done")
+        self.assertEqual(write.call_count, 2)
+
+        write = Mock(side_effect=OperationalError("database is locked"))
+        with self.assertRaises(OperationalError):
+            retry_on_busy(write)()
+        self.assertEqual(write.call_count, 3)
+
+    def test_only_busy_errors_outside_a_transaction_are_retried(self):
+        write = Mock(side_effect=OperationalError("no such table: guest_house_guest"))
+        with self.assertRaises(OperationalError):
+            retry_on_busy(write)()
+        self.assertEqual(write.call_count, 1)
+
+        # TestCase runs inside a transaction, which a retry could not restart
+        write = Mock(side_effect=OperationalError("database is locked"))
+        with self.assertRaises(OperationalError):
+            retry_on_busy(write)()
+        self.assertEqual(write.call_count, 1)
+
+    def test_production_options_configure_each_connection(self):
+        with tempfile.TemporaryDirectory() as directory:
+            wrapper = SQLiteDatabaseWrapper({
+                **connection.settings_dict,
+                "NAME": os.path.join(directory, "db.sqlite3"),
+                "OPTIONS": settings.SQLITE_PRODUCTION_OPTIONS,
+            }, alias="production")
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone()[0], "wal")
+                    cursor.execute("PRAGMA busy_timeout")
+                    self.assertEqual(cursor.fetchone()[0], settings.SQLITE_PRAGMAS["busy_timeout"])
+                self.assertEqual(wrapper.transaction_mode, "IMMEDIATE")
+            finally:
+                wrapper.close()
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command("benchmark_db_writes", threads=2, writes=5, readers=1, stdout=out)
+        self.assertIn("development: 10/10 payments", out.getvalue())
+        self.assertIn("production: 10/10 payments", out.getvalue())
+
+
+class QueryPlanTest(TestCase):
+    """
+    The hot queries must keep reaching their rows through an index. Each is
+    run through EXPLAIN QUERY PLAN; a plain SCAN of a table fails the test, as
+    does a plan that stops using the index the query was designed around.
+    """
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def hot_queries(self):
+        now = timezone.now()
+        card = DebitCard(pk=1)
+        start, end = now - timedelta(days=30), now
+        return {
+            "reminder sweep": (
+                Reservation.objects.due_for_reminder(now).filter(id__gt=0).order_by("id")
+                .values_list("id", "guest__phone")[:5000],
+                "reservation_pending_idx"
+            ),
+            "cancellation sweep": (
+                Reservation.objects.due_for_cancel(now).filter(id__gt=0).order_by("id")
+                .values_list("id", "guest__phone")[:5000],
+                "reservation_pending_idx"
+            ),
+            "payment card lookup": (
+                DebitCard.objects.filter(card_number="1234567812345678", cvc="123", is_active=True),
+                "(card_number=?)"
+            ),
+            "payment reservation lookup": (
+                Reservation.objects.select_related("guest").filter(id=1, status="pending"),
+                "INTEGER PRIMARY KEY (rowid=?)"
+            ),
+            "card balance": (ledger.entries(card).order_by("-id").values_list("balance_after")[:1], "(debit_card_id=?)"),
+            "card statement": (
+                ledger.entries(card).filter(timestamp__gte=start, timestamp__lt=end).order_by("timestamp", "id"),
+                "transaction_card_time_idx"
+            ),
+            "outbox claim": (
+                outbox.claimable(now).filter(id__gt=0).order_by("id").values_list("id", flat=True)[:100],
+                "notification_status_idx"
+            ),
+            "notification history": (
+                Notification.objects.filter(recipient="+250712345678", created_at__gte=start)
+                .order_by("-created_at", "-id"),
+                "notification_recipient_idx"
+            ),
+            "idempotency purge": (IdempotencyKey.objects.filter(expires_at__lte=now), "idempotency_expires_idx"),
+            "room availability": (
+                overlapping_reservations(date(2030, 1, 1), date(2030, 1, 5)).values("room"), "reservation_stay_idx"
+            ),
+        }
+
+    def test_hot_queries_use_their_indexes(self):
+        for name, (queryset, index) in self.hot_queries().items():
+            with self.subTest(query=name):
+                plan = self.plan(queryset)
+                self.assertFalse([step for step in plan if step.startswith("SCAN ") and " USING " not in step], plan)
+                self.assertTrue(any(index in step for step in plan), plan)
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"], REPLICA_STICKY_SECONDS=5)
+class ReplicaRoutingTest(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def serve(self, request, view):
+        routed = []
+        response = ReplicaRoutingMiddleware(lambda r: view(routed) or HttpResponse())(request)
+        return response, routed
+
+    def test_safe_requests_read_from_one_replica(self):
+        response, routed = self.serve(self.factory.get("/api/rooms/"), lambda routed: routed.extend(
+            self.router.db_for_read(Room) for _ in range(5)
+        ))
+        self.assertEqual(len(set(routed)), 1)
+        self.assertIn(routed[0], settings.DATABASE_REPLICAS)
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.router.db_for_read(Room), "default")  # outside a request
+
+    def test_writes_pin_reads_to_the_primary(self):
+        def write_then_read(routed):
+            routed.append(self.router.db_for_read(Reservation))
+            self.router.db_for_write(Reservation)
+            routed.append(self.router.db_for_read(Reservation))
+
+        response, routed = self.serve(self.factory.get("/api/reservations/"), write_then_read)
+        self.assertIn(routed[0], settings.DATABASE_REPLICAS)
+        self.assertEqual(routed[1], "default")
+
+        # the client's next requests read its own write from the primary
+        follow_up = self.factory.get("/api/reservations/")
+        follow_up.COOKIES[STICKY_COOKIE] = response.cookies[STICKY_COOKIE].value
+        _, routed = self.serve(follow_up, lambda routed: routed.append(self.router.db_for_read(Reservation)))
+        self.assertEqual(routed, ["default"])
+
+        _, routed = self.serve(self.factory.post("/api/payments/"),
+                               lambda routed: routed.append(self.router.db_for_read(Reservation)))
+        self.assertEqual(routed, ["default"])
+
+
+class ReplicationTest(TransactionTestCase):
+    def test_replicate_copies_the_primary_into_each_replica(self):
+        Room.objects.create(name="Room A", price_per_night=50.00)
+        with tempfile.TemporaryDirectory() as directory:
+            names = [os.path.join(directory, f"replica{n}.sqlite3") for n in (1, 2)]
+            with patch.dict(connections.settings, {
+                f"replica{n}": {**connection.settings_dict, "NAME": name} for n, name in enumerate(names, 1)
+            }):
+                self.assertEqual(replicate(["replica1", "replica2"]), ["replica1", "replica2"])
+            for name in names:
+                replica = sqlite3.connect(name)
+                try:
+                    rows = replica.execute("SELECT name FROM guest_house_room").fetchall()
+                finally:
+                    replica.close()
+                self.assertEqual(rows, [("Room A",)])
+
+
+class GenerateDatasetTest(TestCase):
+    def generate(self, seed=1):
+        call_command("generate_dataset", guests=60, seed=seed, today=date(2030, 1, 1), stdout=StringIO())
+
+    def test_dataset_is_consistent(self):
+        self.generate()
+
+        self.assertEqual(Guest.objects.count(), 60)
+        self.assertEqual(DebitCard.objects.count(), 60)
+        for guest in Guest.objects.all()[:5]:
+            guest.full_clean()
+        statuses = set(Reservation.objects.values_list("status", flat=True))
+        self.assertTrue({"paid", "cancelled"} <= statuses)
+        # active stays never share a room night, and the ledger reconciles
+        self.assertEqual(
+            RoomNight.objects.count(),
+            sum((r.check_out_date - r.check_in_date).days
+                for r in Reservation.objects.filter(status__in=Reservation.ACTIVE_STATUSES))
+        )
+        out = StringIO()
+        call_command("reconcile_ledger", stdout=out)
+        self.assertIn("found 0 problems", out.getvalue())
+
+    def test_same_seed_gives_same_rows(self):
+        def rows():
+            return list(Reservation.objects.order_by("id").values_list(
+                "room__name", "check_in_date", "check_out_date", "status", "total_cost"
+            ))
+
+        self.generate()
+        first = rows()
+        Reservation.objects.all().delete()
+        Guest.objects.all().delete()
+        Room.objects.all().delete()
+        self.generate()
+        self.assertEqual(rows(), first)
+
+    def test_runs_stack(self):
+        self.generate()
+        self.generate(seed=2)
+
+        self.assertEqual(Guest.objects.count(), 120)
+        self.assertEqual(Meal.objects.count(), 5)  # the menu is reused, not added again
+
+    def test_concurrent_writes_stop_the_run(self):
+        create_catalogue = GenerateDatasetCommand.create_catalogue
+
+        def racing(command, count):
+            create_catalogue(command, count)
+            Guest.objects.create(first_name="Late", last_name="Writer", email="late@example.com", phone="+250788999999")
+
+        with patch.object(GenerateDatasetCommand, "create_catalogue", racing):
+            with self.assertRaisesMessage(CommandError, "run generate_dataset alone"):
+                self.generate()
+        self.assertEqual(Guest.objects.count(), 1)
+
+
+class ReplayRequestsTest(TestCase):
+    def replay(self, *extra):
+        with tempfile.TemporaryDirectory() as directory:
+            log = os.path.join(directory, "requests.jsonl")
+            with open(log, "w") as f:
+                f.write(json.dumps({"method": "GET", "path": "/api/guests/"}) + "\n")
+                f.write(json.dumps({"method": "GET", "path": "/api/missing/"}) + "\n")
+                f.write(json.dumps({"request_id": "not-a-request"}) + "\n")
+            out = StringIO()
+            call_command("replay_requests", log, "--repeat", "3", *extra, stdout=out, stderr=StringIO())
+        return json.loads(out.getvalue())
+
+    def test_report_per_endpoint(self):
+        report = self.replay("--concurrency", "2")
+
+        self.assertEqual(report["requests"], 6)
+        self.assertEqual(report["skipped_lines"], 1)
+        guests = report["endpoints"]["GET guest-list"]
+        self.assertEqual(guests["statuses"], {"200": 3})
+        self.assertEqual(guests["error_rate"], 0.0)
+        self.assertGreaterEqual(guests["queries"]["mean"], 1)
+        self.assertLessEqual(guests["latency_ms"]["p50"], guests["latency_ms"]["p99"])
+        self.assertEqual(report["endpoints"]["GET <unresolved>"]["statuses"], {"404": 3})
+
+    def test_asgi_interface(self):
+        report = self.replay("--interface", "asgi")
+
+        self.assertEqual(report["interface"], "asgi")
+        self.assertEqual(report["overall"]["statuses"], {"200": 3, "404": 3})
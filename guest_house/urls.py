@@ -2,7 +2,8 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     RoomViewSet, MealViewSet, GuestViewSet, DebitCardViewSet,
-    ReservationViewSet, TransactionViewSet, PaymentViewSet, DepositViewSet
+    ReservationViewSet, TransactionViewSet, PaymentViewSet, DepositViewSet,
+    QuoteViewSet
 )
 
 router = DefaultRouter()
@@ -13,12 +14,16 @@ router.register(r'debitcards', DebitCardViewSet)
 router.register(r'reservations', ReservationViewSet)
 router.register(r'transactions', TransactionViewSet, basename='transaction')
 
-# ✅ Payment & Deposit: handled manually, not via router
+# ✅ Payment, Deposit & Quote: handled manually, not via router
 payment_list = PaymentViewSet.as_view({'get': 'list', 'post': 'create'})
 deposit_list = DepositViewSet.as_view({'get': 'list', 'post': 'create'})
+quote_list = QuoteViewSet.as_view({'get': 'list', 'post': 'create'})
+quote_matrix = QuoteViewSet.as_view({'post': 'matrix'})
 
 urlpatterns = [
     path('', include(router.urls)),
     path('payments/', payment_list, name='payments'),
     path('deposits/', deposit_list, name='deposits'),
+    path('quotes/', quote_list, name='quotes'),
+    path('quotes/matrix/', quote_matrix, name='quote-matrix'),
 ]
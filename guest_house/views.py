@@ -1,24 +1,41 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
 from rest_framework import viewsets, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
-from django.db import transaction
 from .models import Room, Meal, Guest, Reservation, DebitCard, Transaction
+from . import ledger
+from .idempotency import idempotent
+from .availability import available_rooms
+from .catalogue_cache import CachedCatalogueMixin
+from .conditional import collection_version, conditional, detail_version
+from .pagination import ReservationPagination, TransactionPagination
 from .serializers import (
-    RoomSerializer, MealSerializer, GuestSerializer, DebitCardSerializer,
-    TransactionSerializer, ReservationSerializer, ReservationCreateSerializer,
-    PaymentSerializer, DepositSerializer
+    AvailabilityQuerySerializer, StatementQuerySerializer, RoomSerializer, MealSerializer, GuestSerializer, DebitCardSerializer,
+    TransactionSerializer, ReservationSerializer, ReservationCreateSerializer, ReservationBulkSerializer,
+    PaymentSerializer, DepositSerializer, QuoteSerializer, QuoteMatrixSerializer
 )
 
 
 # -----------------------------
 # CRUD VIEWSETS
 # -----------------------------
-class RoomViewSet(viewsets.ModelViewSet):
+class RoomViewSet(CachedCatalogueMixin, viewsets.ModelViewSet):
     queryset = Room.objects.all()
     serializer_class = RoomSerializer
 
+    @action(detail=False, methods=['get'])
+    def availability(self, request):
+        """Rooms free for the whole stay: ?check_in=&check_out=[&min_price=&max_price=&ordering=]"""
+        params = AvailabilityQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        rooms = available_rooms(**params.validated_data)
+        return Response(RoomSerializer(rooms, many=True).data)
+
 
-class MealViewSet(viewsets.ModelViewSet):
+class MealViewSet(CachedCatalogueMixin, viewsets.ModelViewSet):
     queryset = Meal.objects.all()
     serializer_class = MealSerializer
 
@@ -27,29 +44,88 @@ class GuestViewSet(viewsets.ModelViewSet):
     queryset = Guest.objects.all()
     serializer_class = GuestSerializer
 
+    @conditional(collection_version(Guest))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(detail_version(Guest))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class DebitCardViewSet(viewsets.ModelViewSet):
     queryset = DebitCard.objects.all()
     serializer_class = DebitCardSerializer
 
+    @conditional(collection_version(DebitCard))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(detail_version(DebitCard))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @action(detail=True, methods=['get'])
+    def statement(self, request, pk=None):
+        """Opening balance, transactions and closing balance: ?start=YYYY-MM-DD&end=YYYY-MM-DD"""
+        card = self.get_object()
+        params = StatementQuerySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+
+        tz = timezone.get_current_timezone()
+        start = datetime.combine(params.validated_data['start'], time.min, tzinfo=tz)
+        end = datetime.combine(params.validated_data['end'] + timedelta(days=1), time.min, tzinfo=tz)
+        result = ledger.statement(card, start, end)
+
+        return Response({
+            "card_id": card.id,
+            "start": params.validated_data['start'],
+            "end": params.validated_data['end'],
+            "opening_balance": str(result['opening_balance']),
+            "closing_balance": str(result['closing_balance']),
+            "transactions": TransactionSerializer(result['entries'], many=True).data
+        })
+
 
 class TransactionViewSet(viewsets.ReadOnlyModelViewSet):
     """Read-only viewset for transactions"""
     queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
+    pagination_class = TransactionPagination
+
+    # entries never change once written
+    @conditional(collection_version(Transaction, field='timestamp'))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(detail_version(Transaction, field='timestamp'))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 # -----------------------------
 # RESERVATION
 # -----------------------------
 class ReservationViewSet(viewsets.ModelViewSet):
-    queryset = Reservation.objects.all()
+    # the serializer nests the guest; load it with the reservation
+    queryset = Reservation.objects.select_related('guest', 'room', 'meal')
+    pagination_class = ReservationPagination
 
     def get_serializer_class(self):
         if self.action == 'create':
             return ReservationCreateSerializer
+        if self.action == 'bulk':
+            return ReservationBulkSerializer
         return ReservationSerializer
 
+    @conditional(collection_version(Reservation, nested=('guest',)))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional(detail_version(Reservation, nested=('guest',)))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -62,6 +138,27 @@ class ReservationViewSet(viewsets.ModelViewSet):
             "total_cost": reservation.total_cost
         }, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """Create many reservations at once: {"reservations": [<reservation payload>, ...]}"""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = serializer.save()
+
+        created = sum(1 for r in results if r['status'] == 'created')
+        if created == len(results):
+            code = status.HTTP_201_CREATED
+        elif created == 0:
+            code = status.HTTP_400_BAD_REQUEST
+        else:
+            code = status.HTTP_207_MULTI_STATUS
+
+        return Response({
+            "created": created,
+            "failed": len(results) - created,
+            "results": results
+        }, status=code)
+
 
 # -----------------------------
 # PAYMENT
@@ -91,6 +188,7 @@ class PaymentViewSet(viewsets.ViewSet):
             'view': self
         }
 
+    @idempotent('payments')
     def create(self, request):
         serializer = PaymentSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -127,29 +225,63 @@ class DepositViewSet(viewsets.ViewSet):
             'view': self
         }
 
+    @idempotent('deposits')
     def create(self, request):
         serializer = DepositSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
+        txn = serializer.save()
+        debit_card = txn.debit_card
 
-        card_number = serializer.validated_data['card_number']
-        amount = serializer.validated_data['amount']
+        return Response({
+            "message": f"Successfully deposited {txn.amount} to card ending in {debit_card.card_number[-4:]}.",
+            "new_balance": txn.balance_after,
+            "transaction_id": txn.id
+        }, status=status.HTTP_200_OK)
 
-        try:
-            debit_card = DebitCard.objects.get(card_number=card_number, is_active=True)
-        except DebitCard.DoesNotExist:
-            return Response({"error": "Invalid or inactive card number."}, status=status.HTTP_400_BAD_REQUEST)
 
-        with transaction.atomic():
-            debit_card.balance += amount
-            debit_card.save()
-            txn = Transaction.objects.create(
-                debit_card=debit_card,
-                amount=amount,
-                transaction_type='deposit'
-            )
+# -----------------------------
+# QUOTE
+# -----------------------------
+class QuoteViewSet(viewsets.ViewSet):
+    renderer_classes = [JSONRenderer, BrowsableAPIRenderer]
+    serializer_class = QuoteSerializer
 
+    def list(self, request):
+        """Show info on how to use quote endpoint"""
+        serializer = self.get_serializer()
         return Response({
-            "message": f"Successfully deposited {amount} to card ending in {debit_card.card_number[-4:]}.",
-            "new_balance": debit_card.balance,
-            "transaction_id": txn.id
+            "message": "Quote endpoint - POST JSON with a list of stays to price them without booking",
+            "required_fields": list(serializer.fields.keys()),
+            "method": "POST",
+            "form": serializer.data if hasattr(serializer, 'data') else {}
+        })
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('context', self.get_serializer_context())
+        return self.serializer_class(*args, **kwargs)
+
+    def get_serializer_context(self):
+        return {
+            'request': getattr(self, 'request', None),
+            'format': getattr(self, 'format_kwarg', None),
+            'view': self
+        }
+
+    def create(self, request):
+        serializer = QuoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        return Response({"quotes": serializer.data['items']}, status=status.HTTP_200_OK)
+
+    def matrix(self, request):
+        """Price comparison: total cost of each room for each candidate stay"""
+        serializer = QuoteMatrixSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        return Response({
+            "stays": serializer.data['stays'],
+            "rooms": [
+                {"room_id": room_id, "totals": [str(total) for total in totals]}
+                for room_id, totals in serializer.validated_data['matrix'].items()
+            ]
         }, status=status.HTTP_200_OK)
@@ -1,5 +1,5 @@
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 
 # --------------------------------------------------
 # BASE DIR
@@ -34,6 +34,8 @@ INSTALLED_APPS = [
 # --------------------------------------------------
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    # outermost after security, so session and auth reads are routed too
+    "guest_house.routers.ReplicaRoutingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -69,14 +71,88 @@ TEMPLATES = [
 ]
 
 # --------------------------------------------------
-# DATABASE (default: SQLite, change if needed)
+# DATABASE (default: SQLite, change if needed; DB_PROFILE=production for
+# concurrent writers)
 # --------------------------------------------------
+# seconds a writer waits for SQLite's write lock before "database is locked"
+SQLITE_BUSY_TIMEOUT = config("SQLITE_BUSY_TIMEOUT", default=5, cast=float)
+# run on every new connection: WAL so reads never block on the writer,
+# synchronous=NORMAL (durable in WAL, fsyncs at checkpoints rather than per
+# commit), a 64 MiB page cache and 256 MiB of memory-mapped reads
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,
+    "mmap_size": 256 * 1024 * 1024,
+    "busy_timeout": int(SQLITE_BUSY_TIMEOUT * 1000),
+}
+SQLITE_PRODUCTION_OPTIONS = {
+    "init_command": ";".join(f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()),
+    # take the write lock at BEGIN: a deferred transaction that has to upgrade
+    # its read lock fails at once instead of waiting out the busy timeout
+    "transaction_mode": "IMMEDIATE",
+    "timeout": SQLITE_BUSY_TIMEOUT,
+}
+# what DB_PROFILE=production adds to the default database
+SQLITE_PRODUCTION_DATABASE = {
+    "OPTIONS": SQLITE_PRODUCTION_OPTIONS,
+    # keep connections open across requests instead of one per request
+    "CONN_MAX_AGE": config("CONN_MAX_AGE", default=600, cast=int),
+    "CONN_HEALTH_CHECKS": True,
+}
+
+DB_PROFILE = config("DB_PROFILE", default="development")
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
     }
 }
+if DB_PROFILE == "production":
+    DATABASES["default"].update(SQLITE_PRODUCTION_DATABASE)
+
+# Read replicas: comma-separated database files, each a copy of the primary
+# (kept in step locally by `manage.py replicate_database`). Request reads are
+# spread over them by guest_house.routers; after writing, a client reads from
+# the primary for REPLICA_STICKY_SECONDS.
+DATABASE_REPLICAS = []
+for number, name in enumerate(config("DATABASE_REPLICAS", default="", cast=Csv()), 1):
+    DATABASES[f"replica{number}"] = {**DATABASES["default"], "NAME": name, "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(f"replica{number}")
+DATABASE_ROUTERS = ["guest_house.routers.ReplicaRouter"]
+REPLICA_STICKY_SECONDS = config("REPLICA_STICKY_SECONDS", default=5, cast=int)
+
+# writes that still find the database locked are retried (guest_house.db.retry_on_busy)
+# this many times, backing off exponentially from BASE to at most CAP seconds
+DB_BUSY_RETRIES = config("DB_BUSY_RETRIES", default=5, cast=int)
+DB_BUSY_RETRY_BASE = config("DB_BUSY_RETRY_BASE", default=0.05, cast=float)
+DB_BUSY_RETRY_CAP = config("DB_BUSY_RETRY_CAP", default=1.0, cast=float)
+
+# --------------------------------------------------
+# CACHE (CACHE_BACKEND: locmem, file, redis or memcached)
+# --------------------------------------------------
+CACHE_BACKENDS = {
+    "locmem": "django.core.cache.backends.locmem.LocMemCache",
+    "file": "django.core.cache.backends.filebased.FileBasedCache",
+    "redis": "django.core.cache.backends.redis.RedisCache",
+    "memcached": "django.core.cache.backends.memcached.PyMemcacheCache",
+}
+CACHE_BACKEND = config("CACHE_BACKEND", default="locmem")
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKENDS[CACHE_BACKEND],
+        "LOCATION": config(
+            "CACHE_LOCATION", default=str(BASE_DIR / "cache") if CACHE_BACKEND == "file" else "guest-house"
+        ),
+    }
+}
+
+# Rendered room and meal responses: which cache, how long an entry may live
+# (the bound on staleness across processes with locmem), and whether each
+# process fills it on its first request
+CATALOGUE_CACHE = "default"
+CATALOGUE_CACHE_TIMEOUT = config("CATALOGUE_CACHE_TIMEOUT", default=300, cast=int)
+CATALOGUE_CACHE_WARM = config("CATALOGUE_CACHE_WARM", default=True, cast=bool)
 
 # --------------------------------------------------
 # PASSWORD VALIDATION
@@ -107,8 +183,76 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 # --------------------------------------------------
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# --------------------------------------------------
+# PRICE CATALOGUE (seconds a worker may serve prices edited by another worker)
+# --------------------------------------------------
+PRICE_CATALOGUE_TTL = config("PRICE_CATALOGUE_TTL", default=60, cast=int)
+
 # --------------------------------------------------
 # AFRICA'S TALKING (replaces Twilio)
 # --------------------------------------------------
 AT_USERNAME = config("AT_USERNAME", default="sandbox")
-AT_API_KEY = config("AT_API_KEY")
+# only needed once a message goes out through AfricasTalkingBackend
+AT_API_KEY = config("AT_API_KEY", default="")
+
+# Where SMS go: AfricasTalkingBackend, ConsoleBackend, FileBackend,
+# HTTPGatewayBackend or FakeGatewayBackend from guest_house.notifications.backends
+SMS_BACKEND = config("SMS_BACKEND", default="guest_house.notifications.backends.AfricasTalkingBackend")
+SMS_FILE_PATH = config("SMS_FILE_PATH", default=str(BASE_DIR / "sms_outbox.jsonl"))
+SMS_GATEWAY_URL = config("SMS_GATEWAY_URL", default="https://api.africastalking.com/version1/messaging")
+# FakeGatewayBackend: seconds per request and fraction of requests that fail
+SMS_FAKE_LATENCY = config("SMS_FAKE_LATENCY", default=0.0, cast=float)
+SMS_FAKE_ERROR_RATE = config("SMS_FAKE_ERROR_RATE", default=0.0, cast=float)
+
+# SMS dispatch: recipients per send and sends in flight at once
+SMS_BATCH_SIZE = config("SMS_BATCH_SIZE", default=100, cast=int)
+SMS_MAX_WORKERS = config("SMS_MAX_WORKERS", default=8, cast=int)
+# seconds a notification drainer holds the rows it claimed before others may reclaim them
+NOTIFICATION_LEASE_SECONDS = config("NOTIFICATION_LEASE_SECONDS", default=60, cast=int)
+# provider limit in messages per second (0 disables) and the largest burst allowed
+SMS_RATE_LIMIT = config("SMS_RATE_LIMIT", default=10, cast=float)
+SMS_BURST = config("SMS_BURST", default=0, cast=int)
+# failed notifications are retried with jittered exponential backoff, then dead-lettered
+NOTIFICATION_MAX_ATTEMPTS = config("NOTIFICATION_MAX_ATTEMPTS", default=5, cast=int)
+NOTIFICATION_RETRY_BASE = config("NOTIFICATION_RETRY_BASE", default=30, cast=int)
+NOTIFICATION_RETRY_CAP = config("NOTIFICATION_RETRY_CAP", default=3600, cast=int)
+
+# --------------------------------------------------
+# LOGGING (notification deliveries as JSON lines, written off the sending thread)
+# --------------------------------------------------
+NOTIFICATION_LOG_FILE = config("NOTIFICATION_LOG_FILE", default=str(BASE_DIR / "notifications.log.jsonl"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "notification_log": {
+            "class": "guest_house.logs.BackgroundRotatingHandler",
+            "filename": NOTIFICATION_LOG_FILE,
+            "max_bytes": config("NOTIFICATION_LOG_MAX_BYTES", default=50 * 1024 * 1024, cast=int),
+            "backup_count": config("NOTIFICATION_LOG_BACKUPS", default=10, cast=int),
+            # e.g. "midnight" to rotate daily instead of by size
+            "when": config("NOTIFICATION_LOG_WHEN", default="") or None,
+        },
+    },
+    "loggers": {
+        "guest_house.notifications": {
+            "handlers": ["notification_log"],
+            "level": "INFO",
+            "propagate": False,
+        },
+    },
+}
+
+# --------------------------------------------------
+# IDEMPOTENCY KEYS (payments and deposits)
+# --------------------------------------------------
+# how long a stored response is replayed, how many stay cached in each process,
+# and how long a duplicate waits for the original before giving up with 409
+IDEMPOTENCY_KEY_TTL = config("IDEMPOTENCY_KEY_TTL", default=24 * 60 * 60, cast=int)
+IDEMPOTENCY_CACHE_SIZE = config("IDEMPOTENCY_CACHE_SIZE", default=10000, cast=int)
+IDEMPOTENCY_WAIT = config("IDEMPOTENCY_WAIT", default=10, cast=float)
+# how long a claim stays with the request that made it; only after this may a
+# duplicate take it over, so keep it well above the slowest request (busy
+# retries included)
+IDEMPOTENCY_LEASE = config("IDEMPOTENCY_LEASE", default=300, cast=float)